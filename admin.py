@@ -0,0 +1,329 @@
+# Socket de administración local del servidor y su cliente de línea de órdenes (sin Qt)
+#
+# Uso: python admin.py [--port PUERTO | --socket RUTA] [orden ...]
+# Sin orden abre una consola interactiva. "ayuda" lista las órdenes del servidor.
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# Tiempo máximo para que un cliente de administración envíe su orden (segundos)
+COMMAND_TIMEOUT = 5.0
+
+def default_path(port):
+    """Ruta por defecto del socket de administración del servidor en 'port'"""
+    return os.path.join(tempfile.gettempdir(), f"chat-admin-{port}.sock")
+
+class AdminServer:
+    """Atiende órdenes de texto por un socket Unix: una línea de orden, la respuesta y cierre.
+
+    El socket se crea con permisos solo para el propietario del proceso; quien
+    puede conectarse puede administrar el servidor.
+    """
+
+    def __init__(self, path, handler):
+        self.path = path
+        self.handler = handler  # (línea de orden) -> texto de respuesta
+        self.sock = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Crea el socket y empieza a atender órdenes; lanza OSError si no se puede"""
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("los sockets Unix no están disponibles en este sistema")
+        if os.path.exists(self.path):
+            # Socket abandonado por un proceso anterior (si hay otro vivo, el connect funciona)
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise OSError(f"ya hay un servidor atendiendo en {self.path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path)
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self.sock.listen(8)
+        self.running = True
+        self.thread = threading.Thread(target=self.accept_loop, name="administracion")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            with conn:
+                self.serve(conn)
+
+    def serve(self, conn):
+        conn.settimeout(COMMAND_TIMEOUT)
+        data = b""
+        try:
+            while b"\n" not in data and len(data) < 65536:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+            line = data.split(b"\n", 1)[0].decode("utf-8", "replace").strip()
+            try:
+                reply = self.handler(line)
+            except Exception as e:
+                reply = f"Error: {e}"
+            conn.sendall(reply.encode("utf-8") + b"\n")
+        except OSError:
+            pass
+
+    def stop(self):
+        self.running = False
+        if self.sock:
+            self.sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+def format_duration(seconds):
+    """Duración legible: 45 s, 12 min, 3 h 20 min"""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} s"
+    if seconds < 3600:
+        return f"{seconds // 60} min"
+    return f"{seconds // 3600} h {seconds % 3600 // 60} min"
+
+class AdminCommands:
+    """Órdenes de administración sobre el registro vivo de un ServerThread.
+
+    Las consultas copian la lista de sesiones bajo el cerrojo y trabajan sobre
+    la copia, de modo que el reparto de mensajes no se detiene mientras tanto.
+    """
+
+    HELP = """Órdenes disponibles:
+  sesiones [sala]            sesiones activas con sus estadísticas
+  expulsar <alias> [motivo]  desconecta todas las sesiones del usuario
+  vetar <alias|ip> [min]     expulsa y rechaza su dirección (0 o sin minutos = indefinido)
+  levantar <ip>              retira un veto
+  vetados                    direcciones vetadas
+  aviso <texto>              mensaje del sistema a todas las sesiones
+  salas                      salas con usuarios y sesiones
+  sala <nombre>              usuarios de una sala (locales y de otros nodos)
+  metricas                   contadores, latencias y estado del servidor
+  etapas                     etapas de la cadena de mensajes con sus tiempos
+  filtro [recargar]          estado del filtro de términos o recarga de su fichero
+  registro [nivel]           nivel del registro: info, sistema, aviso o error"""
+
+    # Tiempo para que el aviso de expulsión llegue al cliente antes de cerrar (segundos)
+    KICK_DRAIN = 0.5
+
+    def __init__(self, server):
+        self.server = server
+
+    def command(self, line):
+        """Ejecuta una orden de texto y devuelve el resultado como texto"""
+        words = line.split(None, 1)
+        if not words:
+            return self.HELP
+        name, argument = words[0].lower(), words[1].strip() if len(words) > 1 else ""
+        handler = getattr(self, f"cmd_{name}", None)
+        if handler is None:
+            return self.HELP
+        try:
+            return handler(argument)
+        except Exception as e:
+            return f"Error: {e}"
+
+    def sessions(self):
+        with self.server.clients_lock:
+            return list(self.server.clients)
+
+    def cmd_ayuda(self, argument):
+        return self.HELP
+
+    def cmd_sesiones(self, argument):
+        sessions = [session for session in self.sessions() if not argument or session.room == argument]
+        if not sessions:
+            return "No hay sesiones activas"
+        now = time.time()
+        lines = [f"{'alias':20} {'sala':12} {'dirección':22} {'conectado':>10} {'recibidas':>9} "
+                 f"{'enviadas':>9} {'cola':>5}"]
+        for session in sorted(sessions, key=lambda session: (session.room, session.alias)):
+            address = f"{session.addr[0]}:{session.addr[1]}"
+            lines.append(f"{session.alias[:20]:20} {session.room[:12]:12} {address:22} "
+                         f"{format_duration(now - session.since):>10} {session.received:>9} "
+                         f"{session.output.frames:>9} {len(session.output.pending):>5}")
+        lines.append(f"{len(sessions)} sesiones")
+        return "\n".join(lines)
+
+    def kick(self, sessions, notice):
+        for session in sessions:
+            self.server.kick(session, notice, self.KICK_DRAIN)
+
+    def cmd_expulsar(self, argument):
+        alias, _, reason = argument.partition(" ")
+        if not alias:
+            return "Uso: expulsar <alias> [motivo]"
+        sessions = [session for session in self.sessions() if session.alias == alias]
+        if not sessions:
+            return f"No hay ninguna sesión de {alias}"
+        notice = "Has sido expulsado del chat" + (f": {reason.strip()}" if reason.strip() else "")
+        self.kick(sessions, notice)
+        return f"{alias} expulsado ({len(sessions)} sesiones)"
+
+    def cmd_vetar(self, argument):
+        words = argument.split()
+        if not words:
+            return "Uso: vetar <alias|ip> [minutos]"
+        minutes = float(words[1]) if len(words) > 1 else 0
+        target = words[0]
+        sessions = [session for session in self.sessions() if target in (session.alias, session.addr[0])]
+        addresses = {session.addr[0] for session in sessions} or {target}
+        for address in addresses:
+            self.server.ban(address, minutes * 60 or None)
+        self.kick(sessions, "Has sido vetado en este servidor")
+        duration = f"{minutes:g} min" if minutes else "sin límite"
+        return f"Vetado {', '.join(sorted(addresses))} ({duration}); {len(sessions)} sesiones expulsadas"
+
+    def cmd_levantar(self, argument):
+        if not argument:
+            return "Uso: levantar <ip>"
+        if self.server.unban(argument):
+            return f"Veto retirado: {argument}"
+        return f"{argument} no estaba vetado"
+
+    def cmd_vetados(self, argument):
+        bans = self.server.bans()
+        if not bans:
+            return "No hay direcciones vetadas"
+        return "\n".join(f"{address:40} {'sin límite' if remaining is None else format_duration(remaining)}"
+                         for address, remaining in sorted(bans.items()))
+
+    def cmd_aviso(self, argument):
+        if not argument:
+            return "Uso: aviso <texto>"
+        count = self.server.announce(argument)
+        return f"Aviso enviado a {count} sesiones"
+
+    def cmd_salas(self, argument):
+        rooms = {}  # sala -> [alias, número de sesiones]
+        for session in self.sessions():
+            users, count = rooms.setdefault(session.room, [set(), 0])
+            users.add(session.alias)
+            rooms[session.room][1] = count + 1
+        if not rooms:
+            return "No hay salas con usuarios"
+        return "\n".join(f"{room:20} {len(users):>5} usuarios {count:>6} sesiones"
+                         for room, (users, count) in sorted(rooms.items()))
+
+    def cmd_sala(self, argument):
+        if not argument:
+            return "Uso: sala <nombre>"
+        local = sorted({session.alias for session in self.sessions() if session.room == argument})
+        published = self.server.roster.snapshot(argument)
+        remote = sorted(user for user in published if user not in local)
+        lines = [f"Sala {argument}: {len(local)} usuarios locales, {len(remote)} de otros nodos"]
+        if local:
+            lines.append("Locales: " + ", ".join(local))
+        if remote:
+            lines.append("Otros nodos: " + ", ".join(remote))
+        return "\n".join(lines)
+
+    def cmd_metricas(self, argument):
+        server = self.server
+        sessions = self.sessions()
+        queued = sum(len(session.output.pending) for session in sessions)
+        lines = [f"Sesiones: {len(sessions)} activas, {server.handshaking} en saludo "
+                 f"(máximo {server.max_sessions}); tramas en cola: {queued}"]
+        lines.append("Contadores: " + ", ".join(f"{key} {value}" for key, value in server.metrics.items()))
+        latency = server.latency.summary()
+        if latency:
+            lines.append(f"Latencia: {latency}")
+        if server.history is not None:
+            lines.append(f"Historial: {len(server.history)} mensajes en {server.history_path}")
+        if server.federation:
+            with server.federation.lock:
+                links = [link.peer_id for link in server.federation.links]
+            lines.append(f"Federación: nodo {server.node_id}, enlaces: {', '.join(links) or 'ninguno'}")
+        if server.filter:
+            lines.append(f"Filtro: {server.filter.summary()}")
+        if server.attachments:
+            lines.append(f"Adjuntos: {server.attachments.summary()}")
+        if server.events:
+            lines.append(f"Eventos: {server.events.summary()}")
+        if server.capture:
+            lines.append(f"Captura: {server.capture.events} eventos en {server.capture.path}")
+        lines.append(f"Hilos: {threading.active_count()}; registro: {server.log_level}")
+        return "\n".join(lines)
+
+    def cmd_etapas(self, argument):
+        return self.server.pipeline.summary() or "La cadena de mensajes no tiene etapas"
+
+    def cmd_filtro(self, argument):
+        if not self.server.filter:
+            return "El filtro de términos no está activado (--filter)"
+        if argument == "recargar" and not self.server.filter.reload():
+            return f"No se pudo recargar {self.server.filter.path}; se mantiene la lista anterior"
+        return self.server.filter.summary()
+
+    def cmd_registro(self, argument):
+        if argument:
+            self.server.set_log_level(argument)
+        return f"Nivel del registro: {self.server.log_level}"
+
+def send_command(path, line, timeout=10.0):
+    """Envía una orden al servidor y devuelve su respuesta"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(line.encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks).decode("utf-8").rstrip("\n")
+    finally:
+        sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Administración del servidor de chat en marcha")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 10000)),
+                        help="puerto del servidor (para la ruta por defecto del socket)")
+    parser.add_argument("--socket", help="ruta del socket de administración")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="orden (por ejemplo: sesiones)")
+    args = parser.parse_args()
+    path = args.socket or default_path(args.port)
+
+    try:
+        if args.command:
+            print(send_command(path, " ".join(args.command)))
+            return
+        print(f"Conectado a {path}. Escribe 'ayuda' para ver las órdenes, Ctrl+D para salir.")
+        while True:
+            try:
+                line = input("admin> ").strip()
+            except EOFError:
+                print()
+                return
+            if line in ("salir", "exit"):
+                return
+            if line:
+                print(send_command(path, line))
+    except OSError as e:
+        print(f"No se pudo contactar con el servidor en {path}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# Adjuntos direccionados por contenido: trozos deduplicados y manifiestos (sin Qt)
+#
+# Un fichero se parte en trozos de CHUNK_SIZE bytes. Cada trozo se guarda una sola vez,
+# con su SHA-256 como nombre, y el fichero es un manifiesto con la lista de trozos cuyo
+# identificador es el SHA-256 del contenido completo. Compartir dos veces el mismo PDF,
+# o dos ficheros con partes comunes, solo ocupa (y solo se sube) lo que no estaba ya.
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+
+CHUNK_SIZE = 32 * 1024  # en base64 un trozo ocupa unos 44 KB: cabe en una trama (MAX_FRAME)
+MAX_ATTACHMENT = 16 * 2**20  # con este límite la lista de trozos también cabe en una trama
+HASH = re.compile(r"^[0-9a-f]{64}$")
+ATTACHMENTS_DIR = "adjuntos"
+CLIENT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".chatapp", "trozos")
+
+def is_hash(value):
+    return isinstance(value, str) and HASH.match(value) is not None
+
+def chunk_count(size):
+    return max((size + CHUNK_SIZE - 1) // CHUNK_SIZE, 1)
+
+def split_file(path):
+    """Identificador, tamaño y hashes de los trozos de un fichero; lanza ValueError si es demasiado grande"""
+    size = os.path.getsize(path)
+    if size > MAX_ATTACHMENT:
+        raise ValueError(f"el fichero supera el máximo de {MAX_ATTACHMENT // 2**20} MB")
+    whole = hashlib.sha256()
+    hashes = []
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(CHUNK_SIZE)
+            if not data and hashes:
+                break
+            whole.update(data)
+            hashes.append(hashlib.sha256(data).hexdigest())
+            if not data:
+                break
+    return whole.hexdigest(), size, hashes
+
+def read_chunk(path, index):
+    with open(path, "rb") as file:
+        file.seek(index * CHUNK_SIZE)
+        return file.read(CHUNK_SIZE)
+
+def encode_chunk(data):
+    return base64.b64encode(data).decode("ascii")
+
+def decode_chunk(text):
+    """Bytes de un trozo recibido en base64; lanza ValueError si no es válido"""
+    try:
+        return base64.b64decode(text, validate=True)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"trozo mal codificado: {e}")
+
+def format_size(size):
+    """Tamaño legible: 812 B, 14.2 KB, 3.1 MB"""
+    for limit, suffix in ((2**20, "MB"), (2**10, "KB")):
+        if size >= limit:
+            return f"{size / limit:.1f} {suffix}"
+    return f"{size} B"
+
+class ChunkStore:
+    """Trozos en disco con su SHA-256 como nombre, repartidos en subcarpetas por prefijo.
+
+    Las escrituras son atómicas (fichero temporal + renombrado): un trozo presente
+    está siempre completo, y dos escrituras del mismo trozo dan el mismo fichero.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "trozos"), exist_ok=True)
+
+    def chunk_path(self, digest):
+        return os.path.join(self.directory, "trozos", digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.chunk_path(digest))
+
+    def missing(self, hashes):
+        """Hashes sin trozo guardado, sin repetir y en el orden de la lista"""
+        seen = set()
+        result = []
+        for digest in hashes:
+            if digest not in seen and not self.has(digest):
+                result.append(digest)
+            seen.add(digest)
+        return result
+
+    def get(self, digest):
+        with open(self.chunk_path(digest), "rb") as file:
+            return file.read()
+
+    def put(self, digest, data):
+        """Guarda un trozo; devuelve False si ya estaba y lanza ValueError si el hash no coincide"""
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError("el contenido del trozo no coincide con su hash")
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+        return True
+
+    def assemble(self, file_id, hashes, destination):
+        """Escribe el fichero a partir de sus trozos y comprueba que su hash es file_id"""
+        whole = hashlib.sha256()
+        temporary = f"{destination}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temporary, "wb") as file:
+                for digest in hashes:
+                    data = self.get(digest)
+                    whole.update(data)
+                    file.write(data)
+            if whole.hexdigest() != file_id:
+                raise ValueError("el fichero reconstruido no coincide con su identificador")
+            os.replace(temporary, destination)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+class AttachmentStore(ChunkStore):
+    """Almacén de adjuntos del servidor: trozos deduplicados más un manifiesto por fichero"""
+
+    def __init__(self, directory=ATTACHMENTS_DIR):
+        super().__init__(directory)
+        os.makedirs(os.path.join(directory, "ficheros"), exist_ok=True)
+        self.lock = threading.Lock()
+        # Estadísticas desde el arranque: lo subido frente a lo que se compartió
+        self.stats = {"ficheros": 0, "repetidos": 0, "trozos_nuevos": 0, "bytes_nuevos": 0,
+                      "bytes_compartidos": 0}
+
+    def manifest_path(self, file_id):
+        return os.path.join(self.directory, "ficheros", f"{file_id}.json")
+
+    def manifest(self, file_id):
+        """Manifiesto {"id", "tamano", "trozos"} o None si el fichero no existe"""
+        try:
+            with open(self.manifest_path(file_id), encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, digest, data):
+        stored = super().put(digest, data)
+        if stored:
+            with self.lock:
+                self.stats["trozos_nuevos"] += 1
+                self.stats["bytes_nuevos"] += len(data)
+        return stored
+
+    def commit(self, file_id, size, hashes):
+        """Registra un fichero cuyos trozos ya están todos; lanza ValueError si algo no cuadra"""
+        with self.lock:
+            self.stats["bytes_compartidos"] += size
+        if os.path.exists(self.manifest_path(file_id)):
+            with self.lock:
+                self.stats["repetidos"] += 1
+            return False
+        whole = hashlib.sha256()
+        total = 0
+        for digest in hashes:
+            data = self.get(digest)
+            whole.update(data)
+            total += len(data)
+        if whole.hexdigest() != file_id or total != size:
+            raise ValueError("los trozos no forman el fichero anunciado")
+        path = self.manifest_path(file_id)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({"id": file_id, "tamano": size, "trozos": hashes}, file, separators=(',', ':'))
+        os.replace(temporary, path)
+        with self.lock:
+            self.stats["ficheros"] += 1
+        return True
+
+    def summary(self):
+        stats = self.stats
+        return (f"{stats['ficheros']} ficheros nuevos y {stats['repetidos']} repetidos; "
+                f"{format_size(stats['bytes_nuevos'])} guardados de {format_size(stats['bytes_compartidos'])} "
+                f"compartidos ({stats['trozos_nuevos']} trozos) en {self.directory}")
@@ -0,0 +1,108 @@
+# Benchmark del filtro de términos: coste por mensaje según el tamaño de la lista
+#
+# Uso: python bench_filter.py [--terms 10000] [--messages 2000] [--length 200]
+# Compara el autómata Aho-Corasick con una lista de expresiones regulares (una por término)
+# para 100 términos y para la lista completa. Sale con código 1 si el autómata, con la
+# lista completa, supera el presupuesto por mensaje. El coste del autómata depende de la
+# longitud del mensaje, no del número de términos: al crecer la lista solo aumenta algo
+# porque el árbol es más denso y se siguen más enlaces de fallo por carácter.
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from wordfilter import Automaton, Rule, mask
+
+# Presupuesto por mensaje del filtro con la lista completa (microsegundos)
+BUDGET_US = 200
+# Mensajes para la lista de expresiones, que es mucho más lenta
+REGEX_MESSAGES = 50
+
+def random_word(rng, low=4, high=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+def make_terms(rng, count):
+    terms = set()
+    while len(terms) < count:
+        terms.add(random_word(rng, 5, 12))
+    return sorted(terms)
+
+def make_messages(rng, count, length, terms):
+    """Mensajes de palabras al azar; uno de cada diez lleva un término de la lista"""
+    messages = []
+    for i in range(count):
+        words = []
+        while sum(len(word) + 1 for word in words) < length:
+            words.append(random_word(rng, 2, 9))
+        if i % 10 == 0:
+            words[rng.randrange(len(words))] = rng.choice(terms).upper()
+        messages.append(" ".join(words)[:length])
+    return messages
+
+def time_automaton(terms, messages):
+    """(segundos de construcción, microsegundos por mensaje, mensajes con coincidencias)"""
+    start = time.perf_counter()
+    automaton = Automaton([Rule(term) for term in terms])
+    built = time.perf_counter() - start
+    hits = 0
+    start = time.perf_counter()
+    for message in messages:
+        matches = automaton.search(message)
+        if matches:
+            mask(message, matches)
+            hits += 1
+    return built, (time.perf_counter() - start) / len(messages) * 1e6, hits
+
+def time_regex(terms, messages):
+    """Lo mismo con una expresión regular por término, como haría un filtro ingenuo"""
+    start = time.perf_counter()
+    patterns = [re.compile(r"\b" + re.escape(term) + r"\b", re.IGNORECASE) for term in terms]
+    built = time.perf_counter() - start
+    hits = 0
+    start = time.perf_counter()
+    for message in messages:
+        found = False
+        for pattern in patterns:
+            if pattern.search(message):
+                message = pattern.sub(lambda match: "*" * len(match.group()), message)
+                found = True
+        hits += found
+    return built, (time.perf_counter() - start) / len(messages) * 1e6, hits
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del filtro de términos")
+    parser.add_argument("--terms", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=200, help="caracteres por mensaje")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    terms = make_terms(rng, args.terms)
+    messages = make_messages(rng, args.messages, args.length, terms)
+    results = {}
+    regex = {}
+    print(f"{args.messages} mensajes de {args.length} caracteres")
+    for count in sorted({min(100, args.terms), args.terms}):
+        subset = terms[:count]
+        built, per_message, hits = time_automaton(subset, messages)
+        results[count] = per_message
+        print(f"Autómata,  {count:>6} términos: construcción {built * 1000:8.1f} ms, "
+              f"{per_message:8.1f} µs/mensaje ({hits} con coincidencias)")
+        built, per_message, hits = time_regex(subset, messages[:REGEX_MESSAGES])
+        regex[count] = per_message
+        print(f"Regex,     {count:>6} términos: construcción {built * 1000:8.1f} ms, "
+              f"{per_message:8.1f} µs/mensaje ({hits} de {REGEX_MESSAGES} con coincidencias)")
+
+    full = results[args.terms]
+    ok = full <= BUDGET_US
+    print(f"De 100 a {args.terms} términos: autómata {full / results[min(100, args.terms)]:.1f}x, "
+          f"regex {regex[args.terms] / regex[min(100, args.terms)]:.1f}x; "
+          f"el autómata es {regex[args.terms] / full:.0f} veces más rápido con la lista completa")
+    print(f"Autómata con {args.terms} términos: {full:.1f} µs/mensaje (presupuesto {BUDGET_US} µs): "
+          f"{'OK' if ok else 'EXCEDIDO'}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
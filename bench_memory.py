@@ -0,0 +1,102 @@
+# Benchmark de memoria del servidor: bytes de RSS por conexión inactiva
+#
+# Uso: python bench_memory.py [--sessions 10000] [--room-size 100]
+# Arranca el servidor sin interfaz, abre las conexiones (con su saludo completo, repartidas
+# en salas), espera a que se asienten y mide el RSS y los hilos del proceso del servidor.
+# Sale con código 1 si, al ritmo medido, 10 000 sesiones inactivas no caben en 1 GB.
+# Necesita Linux (/proc) y un límite de descriptores suficiente para las dos partes.
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from poller import raise_fd_limit
+from protocol import encode_frame, FrameReader, ALIAS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Objetivo: al menos 10 000 sesiones inactivas por GB de RSS
+TARGET_SESSIONS = 10000
+TARGET_RSS = 1024 ** 3
+# Tiempo para que terminen los hilos escritores y se agreguen los deltas de presencia
+SETTLE = 8.0
+
+def process_status(pid):
+    """RSS en bytes e hilos de un proceso, leídos de /proc"""
+    values = {}
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            key, _, value = line.partition(":")
+            values[key] = value.split()
+    return int(values["VmRSS"][0]) * 1024, int(values["Threads"][0])
+
+def start_server(port, sessions):
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    command = [sys.executable, "server.py", "--headless", "--host", "127.0.0.1", "--port", str(port),
+               "--max-sessions", str(sessions + 16), "--backlog", "1024", "--history", ""]
+    return subprocess.Popen(command, cwd=HERE, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def open_session(port, alias, room):
+    """Conecta y completa el saludo; la conexión queda abierta sin más tráfico"""
+    sock = socket.create_connection(("127.0.0.1", port), timeout=10)
+    reader = FrameReader()
+    while not any(frame["tipo"] == ALIAS for frame in reader.feed(sock.recv(4096))):
+        pass
+    sock.sendall(encode_frame(ALIAS, alias=alias, sala=room))
+    return sock
+
+def wait_for_server(port):
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("el servidor no arrancó")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de memoria por conexión inactiva")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--room-size", type=int, default=100, help="sesiones por sala")
+    parser.add_argument("--port", type=int, default=10900)
+    args = parser.parse_args()
+
+    raise_fd_limit(args.sessions + 256)
+    server = start_server(args.port, args.sessions)
+    sockets = []
+    try:
+        wait_for_server(args.port)
+        time.sleep(SETTLE / 2)
+        base_rss, base_threads = process_status(server.pid)
+
+        start = time.perf_counter()
+        for i in range(args.sessions):
+            sockets.append(open_session(args.port, f"u{i}", f"sala{i // args.room_size}"))
+        elapsed = time.perf_counter() - start
+        peak_rss, peak_threads = process_status(server.pid)
+        time.sleep(SETTLE)
+        rss, threads = process_status(server.pid)
+    except (OSError, RuntimeError) as e:
+        print(f"ERROR: {e} (con {len(sockets)} conexiones abiertas)")
+        sys.exit(1)
+    finally:
+        for sock in sockets:
+            sock.close()
+        server.terminate()
+        server.wait()
+
+    per_session = max(rss - base_rss, 0) / args.sessions
+    projected = base_rss + per_session * TARGET_SESSIONS
+    print(f"{args.sessions} sesiones inactivas en {args.sessions // args.room_size or 1} salas "
+          f"(conectadas en {elapsed:.1f} s)")
+    print(f"RSS del servidor: {base_rss / 2**20:.1f} MB en vacío, {peak_rss / 2**20:.1f} MB al conectar, "
+          f"{rss / 2**20:.1f} MB en reposo")
+    print(f"Hilos del servidor: {base_threads} en vacío, {peak_threads} al conectar, {threads} en reposo")
+    print(f"Por sesión inactiva: {per_session / 1024:.1f} KB")
+    print(f"Estimación para {TARGET_SESSIONS} sesiones: {projected / 2**20:.0f} MB "
+          f"({'OK' if projected <= TARGET_RSS else 'EXCEDIDO'}, objetivo {TARGET_RSS / 2**20:.0f} MB)")
+    sys.exit(0 if projected <= TARGET_RSS else 1)
+
+if __name__ == "__main__":
+    main()
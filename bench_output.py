@@ -0,0 +1,109 @@
+# Benchmark del planificador de salida: rendimiento y latencia según el micro-tick
+#
+# Uso: python bench_output.py [--frames N] [--size BYTES] [--rate TRAMAS_S] [--burst K]
+# Envía tramas por TCP local a través de OutputScheduler con distintos ticks y compara
+# con una escritura directa por trama (como hacía el servidor original).
+import argparse
+import socket
+import statistics
+import struct
+import threading
+import time
+from output import OutputScheduler, set_nodelay
+
+TICKS_MS = [0, 0.5, 1, 2, 5]
+HEADER = struct.Struct("!Id")  # longitud, instante de envío
+
+def make_pair():
+    """Crea una pareja de sockets TCP conectados por la interfaz local"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    listener.close()
+    return server, client
+
+def receive_all(sock, count, latencies):
+    """Lee 'count' tramas y anota la latencia de cada una"""
+    buffer = b""
+    received = 0
+    while received < count:
+        data = sock.recv(1 << 16)
+        if not data:
+            break
+        buffer += data
+        offset = 0
+        now = time.perf_counter()
+        while len(buffer) - offset >= HEADER.size:
+            length, sent = HEADER.unpack_from(buffer, offset)
+            if len(buffer) - offset < length:
+                break
+            latencies.append(now - sent)
+            offset += length
+            received += 1
+        buffer = buffer[offset:]
+
+def run(tick_ms, frames, size, rate, burst):
+    """Envía las tramas y devuelve (tramas/s, escrituras, latencias en ms)"""
+    sender, receiver = make_pair()
+    padding = b"x" * max(size - HEADER.size, 0)
+    latencies = []
+    reader = threading.Thread(target=receive_all, args=(receiver, frames, latencies))
+    reader.start()
+
+    if tick_ms is None:
+        # Referencia: una escritura por trama, sin agrupar
+        set_nodelay(sender)
+        write = sender.sendall
+        output = None
+    else:
+        output = OutputScheduler(sender, tick_ms / 1000, max_pending=frames + 1)
+        output.start()
+        write = output.send
+
+    interval = burst / rate if rate else 0
+    start = time.perf_counter()
+    next_burst = start
+    for index in range(frames):
+        if rate and index % burst == 0:
+            # Ritmo constante: ráfagas de 'burst' tramas
+            delay = next_burst - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_burst += interval
+        write(HEADER.pack(HEADER.size + len(padding), time.perf_counter()) + padding)
+    reader.join()
+    elapsed = time.perf_counter() - start
+
+    writes = output.writes if output else frames
+    if output:
+        output.drain(1)
+    sender.close()
+    receiver.close()
+    return frames / elapsed, writes, [latency * 1000 for latency in latencies]
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento y latencia del planificador de salida")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=120, help="bytes por trama")
+    parser.add_argument("--rate", type=int, default=5000, help="tramas/s en la prueba de latencia")
+    parser.add_argument("--burst", type=int, default=10, help="tramas por ráfaga en la prueba de latencia")
+    args = parser.parse_args()
+
+    modes = [("directo", None)] + [(f"tick {tick:g} ms", tick) for tick in TICKS_MS]
+    print(f"{args.frames} tramas de {args.size} bytes")
+    print(f"{'modo':12} {'máx. tramas/s':>14} {'escrituras':>11} | "
+          f"{'a ' + str(args.rate) + '/s: p50 ms':>16} {'p99 ms':>8} {'escrituras':>11}")
+    for name, tick in modes:
+        throughput, writes, _ = run(tick, args.frames, args.size, 0, args.burst)
+        _, paced_writes, latencies = run(tick, args.frames, args.size, args.rate, args.burst)
+        print(f"{name:12} {throughput:14.0f} {writes:11d} | {statistics.median(latencies):16.3f} "
+              f"{percentile(latencies, 0.99):8.3f} {paced_writes:11d}")
+
+if __name__ == "__main__":
+    main()
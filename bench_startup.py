@@ -0,0 +1,127 @@
+# Benchmark de arranque del cliente: tiempos de importación y de conexión
+#
+# Uso: python bench_startup.py [--repeat N]
+# Cada medida se toma en un intérprete nuevo para que las importaciones sean en frío.
+# Sale con código 1 si alguna medida supera su presupuesto.
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+from protocol import encode_frame, FrameReader, ALIAS, SYSTEM, ROSTER
+
+# Presupuestos en milisegundos (mediana)
+BUDGETS = {
+    "import client_core": 50,
+    "conexión client_core": 150,
+    "import client (Qt)": 400,
+    "ventana ChatWindow (Qt)": 600,
+}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPTS = {
+    "import client_core": """
+import time
+t = time.perf_counter()
+import client_core
+print((time.perf_counter() - t) * 1000)
+""",
+    "conexión client_core": """
+import time, sys
+t = time.perf_counter()
+from client_core import ChatConnection
+conn = ChatConnection("127.0.0.1", int(sys.argv[1]), "bench")
+conn.connect()
+while not conn.joined:
+    conn.receive()
+conn.receive()
+print((time.perf_counter() - t) * 1000)
+conn.close()
+""",
+    "import client (Qt)": """
+import time
+t = time.perf_counter()
+import client
+print((time.perf_counter() - t) * 1000)
+""",
+    "ventana ChatWindow (Qt)": """
+import time
+t = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+import client
+app = QApplication([])
+window = client.ChatWindow()
+window.show()
+app.processEvents()
+print((time.perf_counter() - t) * 1000)
+""",
+}
+
+def stub_server():
+    """Servidor mínimo que completa el saludo y envía bienvenida y lista de usuarios"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(16)
+
+    def serve(conn):
+        with conn:
+            conn.sendall(encode_frame(ALIAS))
+            reader = FrameReader()
+            while not reader.feed(conn.recv(4096)):
+                pass
+            conn.sendall(encode_frame(SYSTEM, texto="bienvenido") + encode_frame(ROSTER, sala="general", usuarios=[]))
+            conn.recv(4096)
+
+    def accept_loop():
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener.getsockname()[1]
+
+def qt_available():
+    """Comprueba si PyQt5 está instalado sin importarlo en este proceso"""
+    result = subprocess.run([sys.executable, "-c", "import PyQt5.QtWidgets"], capture_output=True)
+    return result.returncode == 0
+
+def measure(name, repeat, args=()):
+    """Ejecuta el script en intérpretes nuevos y devuelve las medidas en ms"""
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    samples = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", SCRIPTS[name], *map(str, args)],
+                                cwd=HERE, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque del cliente")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    port = stub_server()
+    has_qt = qt_available()
+    over_budget = False
+
+    print(f"{'medida':28} {'mediana':>9} {'mín':>9} {'presupuesto':>12}")
+    for name, budget in BUDGETS.items():
+        if "(Qt)" in name and not has_qt:
+            print(f"{name:28} {'(PyQt5 no instalado)':>32}")
+            continue
+        extra = (port,) if name.startswith("conexión") else ()
+        samples = measure(name, args.repeat, extra)
+        median = statistics.median(samples)
+        status = "OK" if median <= budget else "EXCEDIDO"
+        over_budget = over_budget or median > budget
+        print(f"{name:28} {median:8.1f}ms {min(samples):8.1f}ms {budget:10d}ms  {status}")
+
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
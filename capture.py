@@ -0,0 +1,96 @@
+# Captura del tráfico entrante del servidor en un fichero binario compacto (sin Qt)
+import gzip
+import struct
+import threading
+import time
+from protocol import FrameReader
+
+MAGIC = b"CHATCAP\x01"
+# Registro: tipo de evento, id de conexión, microsegundos desde el inicio, longitud de los datos
+RECORD = struct.Struct("<BIQI")
+
+# Tipos de evento
+CONNECT = 1
+DATA = 2
+DISCONNECT = 3
+
+def open_file(path, mode):
+    """Abre el fichero de captura, comprimido con gzip si termina en .gz"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
+
+class CaptureWriter:
+    """Graba conexiones, datos recibidos y desconexiones con su instante relativo.
+
+    Se guardan los bytes tal como llegan del socket (no las tramas decodificadas):
+    así la reproducción repite también cómo se trocean los datos en la red.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open_file(path, "wb")
+        self.file.write(MAGIC)
+        self.start = time.monotonic()
+        self.next_id = 0
+        self.events = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def record(self, kind, conn_id, data=b""):
+        with self._lock:
+            if self.closed:
+                return
+            elapsed = int((time.monotonic() - self.start) * 1_000_000)
+            self.file.write(RECORD.pack(kind, conn_id, elapsed, len(data)))
+            if data:
+                self.file.write(data)
+            self.events += 1
+
+    def connect(self):
+        """Registra una conexión nueva y devuelve su id"""
+        with self._lock:
+            self.next_id += 1
+            conn_id = self.next_id
+        self.record(CONNECT, conn_id)
+        return conn_id
+
+    def reader(self):
+        """FrameReader de una conexión nueva que graba todo lo que recibe"""
+        return CapturingReader(self, self.connect())
+
+    def close(self):
+        with self._lock:
+            if not self.closed:
+                self.closed = True
+                self.file.close()
+
+class CapturingReader(FrameReader):
+    """FrameReader que además graba los bytes recibidos"""
+
+    __slots__ = ("capture", "conn_id")
+
+    def __init__(self, capture, conn_id):
+        super().__init__()
+        self.capture = capture
+        self.conn_id = conn_id
+
+    def feed(self, data):
+        self.capture.record(DATA, self.conn_id, data)
+        return super().feed(data)
+
+    def disconnect(self):
+        self.capture.record(DISCONNECT, self.conn_id)
+
+def read_capture(path):
+    """Recorre una captura: devuelve (tipo, id de conexión, segundos, datos) por evento"""
+    with open_file(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} no es una captura del servidor de chat")
+        while True:
+            header = file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, conn_id, elapsed, length = RECORD.unpack(header)
+            data = file.read(length) if length else b""
+            yield kind, conn_id, elapsed / 1_000_000, data
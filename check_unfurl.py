@@ -0,0 +1,173 @@
+# Comprobaciones de la vista previa de enlaces contra un servidor HTTP local
+#
+# Uso: python check_unfurl.py
+# Sirve páginas de prueba con http.server en 127.0.0.1 (sin salir a Internet) y
+# comprueba la extracción del título, el tope de bytes, el tiempo máximo, que las
+# peticiones simultáneas compartan una descarga y la caducidad de la caché.
+# Sale con código 1 si alguna comprobación falla.
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unfurl import LinkUnfurler, TTLCache, fetch_title
+
+TIMEOUT = 1.0
+MAX_BYTES = 16 * 1024
+
+PAGES = {
+    "/og": '<html><head><title>Título normal</title>'
+           '<meta property="og:title" content="Título &amp; OG"></head><body></body></html>',
+    "/titulo": "<html><head><title>\n  Solo   título\n</title></head><body>texto</body></html>",
+    "/sin-titulo": "<html><head></head><body>nada</body></html>",
+    # El título llega antes del tope de bytes en una y después en la otra
+    "/cerca": "<html><head><title>Cerca</title>" + "<!-- relleno -->" * 256 + "</head></html>",
+    "/lejos": "<html><head>" + "<!-- relleno -->" * 4096 + "<title>Lejos</title></head></html>",
+}
+
+class Handler(BaseHTTPRequestHandler):
+    hits = {}
+    hits_lock = threading.Lock()
+
+    def do_GET(self):
+        with self.hits_lock:
+            self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path == "/lento":
+            # Cabeceras al momento y el cuerpo gota a gota, sin cerrar nunca <head>
+            self.send_page_headers()
+            try:
+                for _ in range(50):
+                    self.wfile.write(b"<!-- -->")
+                    self.wfile.flush()
+                    time.sleep(0.1)
+            except OSError:
+                pass
+            return
+        if self.path == "/mudo":
+            # No responde nada durante más tiempo del que espera el cliente
+            time.sleep(TIMEOUT * 3)
+            return
+        if self.path == "/compartida":
+            time.sleep(0.3)  # da tiempo a que lleguen las demás peticiones
+            page = "<html><head><title>Compartida</title></head></html>"
+        else:
+            page = PAGES.get(self.path)
+        if page is None:
+            self.send_error(404)
+            return
+        self.send_page_headers()
+        try:
+            self.wfile.write(page.encode("utf-8"))
+        except OSError:
+            pass
+
+    def send_page_headers(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class Clock:
+    """Reloj manual para comprobar la caducidad sin esperar"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def request_all(unfurler, url, count):
+    """Pide la misma URL 'count' veces a la vez y espera todas las respuestas"""
+    results = []
+    done = threading.Event()
+
+    def callback(url, title):
+        results.append(title)
+        if len(results) == count:
+            done.set()
+
+    for _ in range(count):
+        unfurler.request(url, callback)
+    done.wait(TIMEOUT * 5)
+    return results
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    failures = []
+
+    def check(name, condition, detail=""):
+        print(f"{'OK   ' if condition else 'FALLO'} {name}{f' ({detail})' if detail else ''}")
+        if not condition:
+            failures.append(name)
+
+    try:
+        # Extracción del título
+        title = fetch_title(base + "/og", TIMEOUT, MAX_BYTES)
+        check("og:title antes que <title>", title == "Título & OG", repr(title))
+        title = fetch_title(base + "/titulo", TIMEOUT, MAX_BYTES)
+        check("<title> con espacios normalizados", title == "Solo título", repr(title))
+        title = fetch_title(base + "/sin-titulo", TIMEOUT, MAX_BYTES)
+        check("página sin título", title == "", repr(title))
+
+        # Tope de bytes: lo que queda más allá de MAX_BYTES no se lee
+        title = fetch_title(base + "/cerca", TIMEOUT, MAX_BYTES)
+        check("título dentro del tope de bytes", title == "Cerca", repr(title))
+        title = fetch_title(base + "/lejos", TIMEOUT, MAX_BYTES)
+        check("título más allá del tope de bytes", title == "", repr(title))
+
+        # Tiempo máximo: ni un goteo sin fin ni un servidor mudo retienen el hilo
+        start = time.monotonic()
+        title = fetch_title(base + "/lento", TIMEOUT, MAX_BYTES)
+        elapsed = time.monotonic() - start
+        check("servidor que gotea", title == "" and elapsed < TIMEOUT * 2, f"{elapsed:.2f} s")
+        start = time.monotonic()
+        try:
+            fetch_title(base + "/mudo", TIMEOUT, MAX_BYTES)
+            timed_out = False
+        except OSError:
+            timed_out = True
+        elapsed = time.monotonic() - start
+        check("servidor mudo", timed_out and elapsed < TIMEOUT * 2, f"{elapsed:.2f} s")
+
+        # Peticiones simultáneas de la misma URL: una sola descarga
+        unfurler = LinkUnfurler(workers=4, timeout=TIMEOUT, max_bytes=MAX_BYTES, cache=TTLCache())
+        results = request_all(unfurler, base + "/compartida", 10)
+        check("peticiones simultáneas agrupadas",
+              results == ["Compartida"] * 10 and Handler.hits.get("/compartida") == 1,
+              f"{len(results)} respuestas, {Handler.hits.get('/compartida')} descargas")
+        unfurler.shutdown()
+
+        # Caducidad de la caché, con los fallos guardados menos tiempo que los aciertos
+        clock = Clock()
+        unfurler = LinkUnfurler(workers=2, timeout=TIMEOUT, max_bytes=MAX_BYTES,
+                                cache=TTLCache(ttl=60, clock=clock), failure_ttl=5)
+        Handler.hits.clear()
+        request_all(unfurler, base + "/titulo", 1)
+        request_all(unfurler, base + "/titulo", 1)
+        check("acierto servido desde la caché", Handler.hits.get("/titulo") == 1)
+        clock.now += 61
+        results = request_all(unfurler, base + "/titulo", 1)
+        check("acierto caducado se vuelve a descargar",
+              results == ["Solo título"] and Handler.hits.get("/titulo") == 2)
+        request_all(unfurler, base + "/no-existe", 1)
+        clock.now += 4
+        request_all(unfurler, base + "/no-existe", 1)
+        check("fallo servido desde la caché", Handler.hits.get("/no-existe") == 1)
+        clock.now += 2
+        request_all(unfurler, base + "/no-existe", 1)
+        check("fallo caducado antes que un acierto", Handler.hits.get("/no-existe") == 2)
+        unfurler.shutdown()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if failures:
+        print(f"{len(failures)} comprobaciones fallidas")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
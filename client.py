@@ -1,28 +1,77 @@
-import socket
 import sys
 import threading
 import datetime
-import emoji
-import re
 import os
+import time
+import html
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTextEdit, QPushButton, QVBoxLayout, 
                             QWidget, QLabel, QLineEdit, QHBoxLayout, QMessageBox, 
                             QSplitter, QToolButton, QMenu, QAction, QColorDialog, QFontDialog,
                             QTabWidget, QGroupBox, QGridLayout, QComboBox, QCheckBox,
-                            QSystemTrayIcon, QFileDialog, QFrame, QInputDialog)
-from PyQt5.QtCore import QThread, pyqtSignal, Qt, QSize, QTimer, QSettings
-from PyQt5.QtGui import QFont, QIcon, QTextCursor, QColor, QPalette, QPixmap, QTextCharFormat
+                            QSystemTrayIcon, QFileDialog, QInputDialog, QListWidget, QStyle,
+                            QTextBrowser)
+from PyQt5.QtCore import QThread, pyqtSignal, Qt, QSize, QTimer, QSettings, QEvent, QPoint, QUrl
+from PyQt5.QtGui import (QFont, QIcon, QTextCursor, QColor, QPalette, QPixmap, QDesktopServices,
+                         QTextDocument)
+from protocol import (MESSAGE, SYSTEM, TYPING, ROSTER, ROSTER_DELTA, SHUTDOWN, BUSY, ACK, HISTORY,
+                      ATTACH_OFFER, ATTACH, ATTACH_INDEX, CHUNK, DEFAULT_ROOM)
+from client_core import ChatConnection, HISTORY_PAGE
+from latency import LatencyTracker, CLIENT_STAGES
+from outbox import Outbox, outbox_path
+from notifications import NotificationAggregator
+
+# El paquete emoji tarda en importarse; se carga con el primer mensaje.
+# Lo mismo con los módulos de enlaces, adjuntos, miniaturas e historial local:
+# cada uno se importa la primera vez que se usa, no al arrancar la ventana
+_emoji = None
+
+def emojize(text):
+    """Convierte los códigos :nombre: de un texto en emojis"""
+    global _emoji
+    if _emoji is None:
+        import emoji as _emoji
+    return _emoji.emojize(text)
 
 class ClientThread(QThread):
     update_signal = pyqtSignal(str, str)  # mensaje, tipo (normal, sistema, error)
     connection_signal = pyqtSignal(bool)  # estado de conexión
+    typing_signal = pyqtSignal(list)  # usuarios escribiendo en la sala
+    roster_signal = pyqtSignal(list)  # lista completa de usuarios de la sala
+    presence_signal = pyqtSignal(list, list)  # altas, bajas
+    reconnect_delay_signal = pyqtSignal(int)  # retardo de reconexión sugerido por el servidor (ms)
+    trace_signal = pyqtSignal(list)  # [ingesta, reparto, recepción] de un mensaje trazado
+    history_signal = pyqtSignal(list, bool, bool)  # mensajes, quedan más antiguos, primera página
+    attachment_signal = pyqtSignal(dict)  # adjunto compartido {"de", "id", "nombre", "tamano"}
+    fetched_signal = pyqtSignal(str, list)  # adjunto con todos sus trozos en la caché (lista vacía: falló)
+    
+    # Espera máxima de stop() al hilo (solo se nota si aún estaba conectando)
+    STOP_WAIT_MS = 1000
+    # Trozos por ida y vuelta al subir o descargar un adjunto
+    CHUNK_WINDOW = 32
     
-    def __init__(self, host, port, username):
+    def __init__(self, host, port, username, room=DEFAULT_ROOM, use_tls=False, cafile=None, outbox=None,
+                 newest_num=0, history_cache=None):
         super().__init__()
         self.host = host
         self.port = port
         self.username = username
-        self.client_socket = None
+        self.connection = ChatConnection(host, port, username, room, use_tls=use_tls, cafile=cafile)
+        # Mensajes sin confirmar; se reenvían en lote al completar el saludo
+        self.outbox = outbox
+        self.flushed = False
+        self.send_lock = threading.Lock()  # el lote sale antes que los mensajes nuevos
+        # Historial: número del mensaje más reciente ya mostrado (de una conexión anterior
+        # o de la caché local) y números recibidos en directo antes de que llegue la primera página
+        self.history_cache = history_cache
+        self.newest_num = newest_num
+        self.known_num = newest_num
+        self.live_nums = set()
+        self.history_loaded = False
+        # Adjuntos en curso: subidas {id: (ruta, nombre, tamaño, trozos)} y descargas {id: estado};
+        # solo los toca el hilo de red (la interfaz le pasa el trabajo con call_soon)
+        self.uploads = {}
+        self.downloads = {}
+        self.chunk_cache = None  # trozos ya descargados (se abre con la primera descarga)
         self.running = False
     
     def run(self):
@@ -30,76 +79,384 @@ class ClientThread(QThread):
         self.running = True
         
         try:
-            # Crear socket y conectar
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((self.host, self.port))
-            self.connection_signal.emit(True)
-            
-            while self.running:
-                try:
-                    # Recibir datos del servidor
-                    message = self.client_socket.recv(1024).decode('utf-8')
-                    
-                    if message:
-                        if message == "ALIAS":
-                            # Enviar nombre de usuario
-                            self.client_socket.send(self.username.encode('utf-8'))
-                        elif message.startswith("SERVIDOR:"):
-                            # Mensaje del sistema
-                            self.update_signal.emit(message, "sistema")
-                        else:
-                            # Mensaje de otro usuario
-                            self.update_signal.emit(message, "normal")
-                except Exception as e:
-                    if self.running:
-                        self.update_signal.emit(f"Error de conexión: {str(e)}", "error")
-                        self.connection_signal.emit(False)
-                        self.running = False
+            # Conectar (el saludo lo resuelve ChatConnection); lectura y escritura
+            # comparten después un único bucle no bloqueante en este hilo
+            self.connection.connect(loop=True)
         except Exception as e:
-            self.update_signal.emit(f"Error al conectar con el servidor: {str(e)}", "error")
-            self.connection_signal.emit(False)
+            if self.running:
+                self.update_signal.emit(f"Error al conectar con el servidor: {str(e)}", "error")
+                self.connection_signal.emit(False)
+            self.running = False
+            return
+        
+        if self.running:
+            self.connection_signal.emit(True)
+            if self.connection.resumed:
+                self.update_signal.emit("SERVIDOR: Sesión TLS reanudada", "sistema")
+            try:
+                # Vuelve con stop(), al instante; un cierre del servidor llega como excepción
+                self.connection.serve(self.handle_frames)
+                if self.running:
+                    raise ConnectionError("Cola de envío saturada")
+            except Exception as e:
+                if self.running:
+                    self.update_signal.emit(f"Error de conexión: {str(e)}", "error")
+                    self.connection_signal.emit(False)
+                    self.running = False
         
-        # Cerrar conexión al terminar
-        if self.client_socket:
-            self.client_socket.close()
+        # Cerrar conexión al terminar (lo pendiente, como "salir", sale antes)
+        self.connection.close()
+    
+    def handle_frames(self, frames):
+        """Procesa las tramas de una lectura; tras el saludo envía los pendientes y pide historial"""
+        if self.connection.joined and not self.flushed:
+            self.flush_outbox()
+            # Con mensajes ya mostrados solo se pide lo posterior
+            self.connection.request_history(after=self.known_num)
+        for frame in frames:
+            self.handle_frame(frame)
+    
+    def handle_frame(self, frame):
+        """Procesa una trama recibida del servidor"""
+        tipo = frame["tipo"]
+        if tipo == SYSTEM:
+            # Mensaje del sistema
+            self.update_signal.emit(f"SERVIDOR: {frame.get('texto', '')}", "sistema")
+        elif tipo == MESSAGE:
+            # Mensaje de otro usuario
+            received = time.time()
+            num = frame.get("num")
+            if isinstance(num, int):
+                self.newest_num = max(self.newest_num, num)
+                if not self.history_loaded:
+                    self.live_nums.add(num)
+            self.update_signal.emit(f"{frame.get('de', '')}: {frame.get('texto', '')}", "normal")
+            self.cache_records([{"num": num, "de": frame.get("de", ""), "texto": frame.get("texto", ""),
+                                 "hora": round(received, 3)}])
+            trace = frame.get("traza")
+            if isinstance(trace, list) and len(trace) == 2:
+                # Se emite después del mensaje: al llegar a la ventana, ya está pintado
+                self.trace_signal.emit(trace + [received])
+        elif tipo == TYPING:
+            users = [user for user in frame.get("usuarios", []) if user != self.username]
+            self.typing_signal.emit(users)
+        elif tipo in (ROSTER, ROSTER_DELTA):
+            added, removed = self.connection.apply_roster(frame)
+            self.roster_signal.emit(sorted(self.connection.roster))
+            # No anunciar la propia alta
+            added = [user for user in added if user != self.username]
+            if added or removed:
+                self.presence_signal.emit(added, removed)
+        elif tipo == HISTORY:
+            records = [record for record in frame.get("mensajes", [])
+                       if isinstance(record, dict) and isinstance(record.get("num"), int)]
+            self.cache_records(records)
+            initial = not self.history_loaded
+            if initial:
+                # Quitar lo que ya llegó en directo o ya se mostraba antes de reconectar
+                records = [record for record in records
+                           if record["num"] > self.known_num and record["num"] not in self.live_nums]
+                self.history_loaded = True
+                self.live_nums.clear()
+            if records:
+                self.newest_num = max(self.newest_num, records[-1]["num"])
+            self.history_signal.emit(records, bool(frame.get("mas")), initial)
+        elif tipo == ATTACH:
+            num = frame.get("num")
+            if isinstance(num, int):
+                self.newest_num = max(self.newest_num, num)
+                if not self.history_loaded:
+                    self.live_nums.add(num)
+            from attachments import is_hash
+            if is_hash(frame.get("id")):
+                self.attachment_signal.emit(frame)
+                attachment = {key: frame.get(key) for key in ("id", "nombre", "tamano")}
+                self.cache_records([{"num": num, "de": frame.get("de", ""), "texto": f"📎 {frame.get('nombre', '')}",
+                                     "hora": round(time.time(), 3), "adjunto": attachment}])
+        elif tipo == ATTACH_OFFER:
+            self.continue_upload(frame.get("id"), frame.get("faltan", []))
+        elif tipo == ATTACH_INDEX:
+            self.start_download(frame.get("id"), frame.get("trozos"))
+        elif tipo == CHUNK:
+            self.receive_chunk(frame.get("hash"), frame.get("datos"))
+        elif tipo == ACK:
+            if self.outbox is not None:
+                self.cache_own_messages(frame.get("nums"))
+                self.outbox.ack(frame.get("ids", []))
+        elif tipo in (SHUTDOWN, BUSY):
+            # Cierre ordenado o servidor lleno: el servidor indica cuándo volver a conectar
+            self.reconnect_delay_signal.emit(int(frame.get("reintentar_ms", 3000)))
+            self.update_signal.emit(f"SERVIDOR: {frame.get('texto', 'El servidor no está disponible')}", "sistema")
+    
+    def cache_records(self, records):
+        """Guarda en el historial local los registros con número"""
+        if self.history_cache is not None:
+            self.history_cache.add([record for record in records if isinstance(record.get("num"), int)])
+    
+    def cache_own_messages(self, nums):
+        """Guarda los mensajes propios confirmados {id: número}: el servidor no los reenvía al autor"""
+        if not isinstance(nums, dict) or not nums:
+            return
+        now = round(time.time(), 3)
+        records = []
+        for entry in self.outbox.pending():
+            num = nums.get(entry["id"])
+            if isinstance(num, int):
+                self.newest_num = max(self.newest_num, num)
+                records.append({"num": num, "de": self.username, "texto": entry["texto"], "hora": now})
+        self.cache_records(records)
+    
+    def flush_outbox(self):
+        """Reenvía en lote, tras el saludo, los mensajes que quedaron sin confirmar"""
+        with self.send_lock:
+            entries = self.outbox.pending() if self.outbox is not None else []
+            if entries:
+                self.connection.send_batch(entries)
+            self.flushed = True
+        if entries:
+            plural = "s" if len(entries) != 1 else ""
+            self.update_signal.emit(f"Enviando {len(entries)} mensaje{plural} pendiente{plural}...", "sistema")
     
     def send_message(self, message):
-        """Envía un mensaje al servidor"""
-        if self.running and self.client_socket:
-            try:
-                self.client_socket.send(message.encode('utf-8'))
-                if message.lower() == "salir":
+        """Envía un mensaje al servidor; sin conexión lo deja en la bandeja de salida"""
+        if message.lower() == "salir":
+            if self.running:
+                try:
+                    self.connection.send_message(message)
                     self.stop()
+                    return True
+                except:
+                    pass
+            return False
+        # El mensaje queda en la bandeja hasta que el servidor lo confirme; antes del
+        # saludo no se envía suelto porque saldrá en el lote de pendientes
+        with self.send_lock:
+            entry = self.outbox.add(message) if self.outbox is not None else None
+            if self.running and (self.flushed or self.outbox is None):
+                try:
+                    self.connection.send_message(message, entry and entry["id"])
+                    return True
+                except:
+                    pass
+        if entry:
+            if not self.running:
+                self.update_signal.emit("Sin conexión: el mensaje se enviará al reconectar", "sistema")
+            return True
+        self.update_signal.emit("Error al enviar el mensaje", "error")
+        return False
+    
+    def send_typing(self, active):
+        """Notifica al servidor que el usuario empezó o dejó de escribir"""
+        if self.running:
+            try:
+                self.connection.send_typing(active)
                 return True
             except:
-                self.update_signal.emit("Error al enviar el mensaje", "error")
                 return False
         return False
     
-    def stop(self):
-        """Detiene el cliente"""
-        self.running = False
-        if self.client_socket:
+    def request_history(self, before):
+        """Pide la página de historial anterior al mensaje 'before'"""
+        if self.running:
+            try:
+                self.connection.request_history(before)
+                return True
+            except:
+                return False
+        return False
+    
+    def send_latency_report(self, stages):
+        """Envía al servidor el informe de latencias"""
+        if self.running:
             try:
-                self.client_socket.close()
+                self.connection.send_latency(stages)
+                return True
             except:
-                pass
+                return False
+        return False
+    
+    def send_file(self, path):
+        """Sube un adjunto: anuncia sus trozos y después envía solo los que falten en el servidor"""
+        from attachments import split_file
+        try:
+            file_id, size, hashes = split_file(path)
+        except (OSError, ValueError) as e:
+            self.update_signal.emit(f"No se pudo leer el archivo: {str(e)}", "error")
+            return False
+        if not (self.running and self.connection.call_soon(
+                lambda: self.start_upload(file_id, path, size, hashes))):
+            self.update_signal.emit("Sin conexión: no se puede enviar el archivo", "error")
+            return False
+        return True
+    
+    def start_upload(self, file_id, path, size, hashes):
+        """En el hilo de red: registra la subida y ofrece sus trozos al servidor"""
+        self.uploads[file_id] = (path, os.path.basename(path), size, hashes)
+        self.connection.offer_attachment(file_id, size, hashes)
+    
+    def continue_upload(self, file_id, missing):
+        """Envía la siguiente tanda de trozos que faltan y repite la oferta; sin faltas, comparte"""
+        upload = self.uploads.get(file_id)
+        if upload is None:
+            return
+        path, name, size, hashes = upload
+        if not missing:
+            del self.uploads[file_id]
+            self.connection.share_attachment(file_id, name)
+            return
+        import hashlib
+        from attachments import read_chunk
+        positions = {digest: index for index, digest in reversed(list(enumerate(hashes)))}
+        try:
+            for digest in missing[:self.CHUNK_WINDOW]:
+                data = read_chunk(path, positions[digest])
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise ValueError("el archivo cambió durante el envío")
+                self.connection.send_chunk(digest, data)
+        except (KeyError, OSError, ValueError) as e:
+            del self.uploads[file_id]
+            self.update_signal.emit(f"No se pudo enviar {name}: {str(e)}", "error")
+            return
+        self.connection.offer_attachment(file_id, size, hashes)
+    
+    def download(self, file_id, destination=None):
+        """Descarga un adjunto en 'destination' pidiendo solo los trozos que no estén en la caché local.
+
+        Sin destino solo se traen los trozos a la caché y se avisa con fetched_signal
+        (así se obtienen las imágenes para las miniaturas).
+        """
+        return self.running and self.connection.call_soon(lambda: self.begin_download(file_id, destination))
+    
+    def begin_download(self, file_id, destination):
+        """En el hilo de red: registra la descarga y pide el índice de trozos del adjunto"""
+        if file_id in self.downloads:
+            # Ya se está descargando (por ejemplo, para su miniatura): se comparte la descarga
+            self.downloads[file_id]["destinos"].append(destination)
+            return
+        self.downloads[file_id] = {"destinos": [destination], "trozos": None, "pedidos": set()}
+        self.connection.request_attachment(file_id)
+    
+    def start_download(self, file_id, hashes):
+        download = self.downloads.get(file_id)
+        if download is None:
+            return
+        if not hashes:
+            self.fail_download(file_id, "El adjunto ya no está disponible en el servidor")
+            return
+        if self.chunk_cache is None:
+            from attachments import ChunkStore, CLIENT_CACHE_DIR
+            try:
+                self.chunk_cache = ChunkStore(CLIENT_CACHE_DIR)
+            except OSError as e:
+                self.fail_download(file_id, f"No se pudo crear la caché de adjuntos: {str(e)}")
+                return
+        download["trozos"] = hashes
+        self.fetch_chunks(file_id)
+    
+    def fetch_chunks(self, file_id):
+        """Pide la siguiente tanda de trozos; cuando están todos, reconstruye el archivo"""
+        download = self.downloads[file_id]
+        missing = self.chunk_cache.missing(download["trozos"])
+        if missing:
+            download["pedidos"] = set(missing[:self.CHUNK_WINDOW])
+            self.connection.request_chunks(missing[:self.CHUNK_WINDOW])
+            return
+        del self.downloads[file_id]
+        for destination in download["destinos"]:
+            if destination is None:
+                self.fetched_signal.emit(file_id, download["trozos"])
+                continue
+            try:
+                self.chunk_cache.assemble(file_id, download["trozos"], destination)
+                self.update_signal.emit(f"Archivo guardado en {destination}", "sistema")
+            except (OSError, ValueError) as e:
+                self.update_signal.emit(f"No se pudo guardar el archivo: {str(e)}", "error")
+    
+    def receive_chunk(self, digest, text):
+        """Guarda en la caché un trozo pedido y avanza las descargas que lo esperaban"""
+        waiting = [file_id for file_id, download in self.downloads.items() if digest in download["pedidos"]]
+        if not waiting:
+            return
+        from attachments import decode_chunk
+        try:
+            if text is None:
+                raise ValueError("el servidor no tiene uno de sus trozos")
+            self.chunk_cache.put(digest, decode_chunk(text))
+        except (OSError, ValueError) as e:
+            for file_id in waiting:
+                self.fail_download(file_id, f"No se pudo descargar el archivo: {str(e)}")
+            return
+        for file_id in waiting:
+            pending = self.downloads[file_id]["pedidos"]
+            pending.discard(digest)
+            if not pending:
+                self.fetch_chunks(file_id)
+    
+    def fail_download(self, file_id, message):
+        """Abandona una descarga; las que solo llenaban la caché fallan sin mensaje en el chat"""
+        destinations = self.downloads.pop(file_id)["destinos"]
+        if None in destinations:
+            self.fetched_signal.emit(file_id, [])
+        if any(destination is not None for destination in destinations):
+            self.update_signal.emit(message, "error")
+    
+    def stop(self):
+        """Detiene el cliente sin bloquear la interfaz: el bucle de red se despierta y cierra"""
+        self.running = False
+        self.connection.stop()
         self.connection_signal.emit(False)
-        # Esperar a que el hilo termine
-        self.wait()
+        self.wait(self.STOP_WAIT_MS)
 
 class ChatWindow(QMainWindow):
+    link_preview_signal = pyqtSignal(str, str)  # url, título (desde los hilos de vista previa)
+    thumbnail_signal = pyqtSignal(str, str)  # id de adjunto, ruta de su miniatura ('' si falló)
+    
+    # Reenvío del indicador de escritura mientras se sigue escribiendo (segundos)
+    TYPING_RESEND = 2.0
+    # Intervalo de envío de los histogramas de latencia al servidor (segundos)
+    LATENCY_REPORT_INTERVAL = 30.0
+    
     def __init__(self):
         super().__init__()
         self.client_thread = None
+        self.typing_users = []
+        self.last_typing_sent = 0
+        self.reconnect_delay_ms = 3000
+        self.unfurler = None  # se crea con el primer enlace
+        self.link_previews = {}  # url -> números de bloque pendientes de completar
+        self.attachment_names = {}  # id de adjunto -> nombre (para el diálogo de guardar)
+        # Miniaturas: generador e imágenes en memoria (se crean con la primera) y estado de las pedidas
+        self.thumbnailer = None
+        self.pixmaps = None
+        self.thumbnail_state = {}  # id -> "descargando", "generando" o "fallo"
+        self.placeholder = None
+        self.thumbnail_signal.connect(self.install_thumbnail)
+        self.link_preview_signal.connect(self.update_link_preview)
+        self.latency = LatencyTracker(CLIENT_STAGES)
+        self.outbox = None  # se abre al conectar, por servidor y usuario
+        self.history_cache = None  # historial local del servidor en pantalla (por servidor y sala)
+        # Historial paginado: número más antiguo mostrado y página ya descargada por adelantado
+        self.history_started = False  # ya se mostró la primera página de una conexión
+        self.history_oldest = None
+        self.history_more = False
+        self.history_loading = False
+        self.history_prefetched = None
+        self.last_latency_report = time.monotonic()
+        # Notificaciones: un único icono en la bandeja y avisos agrupados por ráfagas
+        self.notifier = NotificationAggregator()
+        self.replaying_history = False  # sin avisos hasta mostrar el historial inicial
+        self.tray_icon = None
         self.text_color = QColor(0, 0, 0)  # Color negro por defecto
         self.text_font = QFont("Arial", 10)
         self.is_dark_mode = True  # Por defecto, tema oscuro
         self.settings = QSettings("ChatApp", "Client")
         self.loadSettings()
         self.initUI()
-        # self.setupTrayIcon()  # Eliminado porque el método no está implementado
+        self.setupTrayIcon()
         self.applyTheme() 
+        # Lo último del servidor guardado se ve al instante, antes de conectar
+        if self.host and self.port:
+            self.open_history_cache(self.host, self.port)
         
     def initUI(self):
         """Configura la interfaz de usuario"""
@@ -175,6 +532,10 @@ class ChatWindow(QMainWindow):
         self.username_input.setText(self.username)
         config_layout.addWidget(self.username_input, 1, 1)
         
+        self.tls_checkbox = QCheckBox("Conexión segura (TLS)")
+        self.tls_checkbox.setChecked(self.use_tls)
+        config_layout.addWidget(self.tls_checkbox, 2, 0, 1, 2)
+        
         # Botones de control
         self.connect_button = QPushButton("CONECTAR")
         self.connect_button.setIcon(QIcon('connect.png'))
@@ -225,11 +586,27 @@ class ChatWindow(QMainWindow):
         chat_group = QGroupBox("Conversación")
         chat_layout = QVBoxLayout(chat_group)
         
-        # Área de chat
-        self.chat_area = QTextEdit()
+        # Área de chat y lista de usuarios de la sala
+        chat_splitter = QSplitter(Qt.Horizontal)
+        self.chat_area = QTextBrowser()
         self.chat_area.setReadOnly(True)
+        self.chat_area.setOpenLinks(False)
+        self.chat_area.anchorClicked.connect(self.open_link)
         self.chat_area.setFont(QFont("Arial", 10))
-        chat_layout.addWidget(self.chat_area)
+        self.chat_area.verticalScrollBar().valueChanged.connect(self.check_scroll_back)
+        # Las miniaturas se cargan al quedar a la vista, cuando el desplazamiento se detiene
+        self.thumbnail_timer = QTimer(self)
+        self.thumbnail_timer.setSingleShot(True)
+        self.thumbnail_timer.setInterval(100)
+        self.thumbnail_timer.timeout.connect(self.load_visible_thumbnails)
+        self.chat_area.verticalScrollBar().valueChanged.connect(lambda value: self.thumbnail_timer.start())
+        chat_splitter.addWidget(self.chat_area)
+        
+        self.user_list = QListWidget()
+        self.user_list.setToolTip("Usuarios conectados")
+        chat_splitter.addWidget(self.user_list)
+        chat_splitter.setSizes([700, 180])
+        chat_layout.addWidget(chat_splitter)
         
         main_tab_layout.addWidget(chat_group, 1)  # Dar más espacio al chat
         
@@ -274,6 +651,7 @@ class ChatWindow(QMainWindow):
         self.message_input.setPlaceholderText("Escribe tu mensaje aquí...")
         self.message_input.setFont(self.text_font)
         self.message_input.setTextColor(self.text_color)
+        self.message_input.textChanged.connect(self.typing_indicator)
         message_layout.addWidget(self.message_input)
         
         # Botón de enviar
@@ -312,9 +690,48 @@ class ChatWindow(QMainWindow):
         # Añadir la pestaña principal
         tab_widget.addTab(main_tab, "Chat")
         
-        # Tab de Configuración
-        settings_tab = QWidget()
-        settings_layout = QVBoxLayout(settings_tab)
+        # Tab de Configuración: se construye la primera vez que se abre
+        self.settings_tab = QWidget()
+        tab_widget.addTab(self.settings_tab, "Configuración")
+        tab_widget.currentChanged.connect(self.ensure_settings_tab)
+        
+        main_layout.addWidget(tab_widget)
+        
+        # Barra de estado
+        self.statusBar().showMessage("Cliente de Chat listo")
+        
+        # Información del desarrollador
+        dev_layout = QHBoxLayout()
+        dev_info = QLabel("© " + str(datetime.datetime.now().year) + " - Cliente de Chat con PyQt5")
+        dev_info.setAlignment(Qt.AlignRight)
+        dev_layout.addWidget(dev_info)
+        
+        # Botón para cambiar tema rápidamente
+        self.theme_button = QPushButton()
+        self.theme_button.setIcon(QIcon('theme.png'))
+        self.theme_button.setToolTip("Cambiar tema")
+        self.theme_button.clicked.connect(self.toggle_theme)
+        self.theme_button.setFixedSize(30, 30)
+        dev_layout.addWidget(self.theme_button)
+        
+        main_layout.addLayout(dev_layout)
+        
+        # Temporizador para actualizar la hora
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_time)
+        self.timer.start(1000)  # Actualizar cada segundo
+        
+        # Temporizador de las notificaciones agrupadas (se arma con el primer mensaje de una ráfaga)
+        self.notify_timer = QTimer(self)
+        self.notify_timer.setSingleShot(True)
+        self.notify_timer.timeout.connect(self.flush_notifications)
+    
+    def ensure_settings_tab(self, index=None):
+        """Construye la pestaña de configuración si aún no existe"""
+        if hasattr(self, 'theme_combo'):
+            return
+        
+        settings_layout = QVBoxLayout(self.settings_tab)
         
         # Grupo de opciones
         options_group = QGroupBox("Opciones")
@@ -357,35 +774,6 @@ class ChatWindow(QMainWindow):
         
         settings_layout.addLayout(buttons_layout)
         settings_layout.addStretch()
-        
-        # Añadir la pestaña de configuración
-        tab_widget.addTab(settings_tab, "Configuración")
-        
-        main_layout.addWidget(tab_widget)
-        
-        # Barra de estado
-        self.statusBar().showMessage("Cliente de Chat listo")
-        
-        # Información del desarrollador
-        dev_layout = QHBoxLayout()
-        dev_info = QLabel("© " + str(datetime.datetime.now().year) + " - Cliente de Chat con PyQt5")
-        dev_info.setAlignment(Qt.AlignRight)
-        dev_layout.addWidget(dev_info)
-        
-        # Botón para cambiar tema rápidamente
-        self.theme_button = QPushButton()
-        self.theme_button.setIcon(QIcon('theme.png'))
-        self.theme_button.setToolTip("Cambiar tema")
-        self.theme_button.clicked.connect(self.toggle_theme)
-        self.theme_button.setFixedSize(30, 30)
-        dev_layout.addWidget(self.theme_button)
-        
-        main_layout.addLayout(dev_layout)
-        
-        # Temporizador para actualizar la hora
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_time)
-        self.timer.start(1000)  # Actualizar cada segundo
     
     def loadSettings(self):
         """Carga configuraciones guardadas"""
@@ -395,6 +783,9 @@ class ChatWindow(QMainWindow):
         self.username = self.settings.value("username", "", type=str)
         self.minimize_to_tray = self.settings.value("minimizeToTray", False, type=bool)
         self.auto_emoji = self.settings.value("autoEmoji", True, type=bool)
+        self.use_tls = self.settings.value("useTls", False, type=bool)
+        # Certificado de confianza propio (por ejemplo uno autofirmado); vacío = CA del sistema
+        self.tls_cafile = self.settings.value("tlsCaFile", "", type=str)
         
         # Cargar fuente y color
         font_family = self.settings.value("fontFamily", "Arial", type=str)
@@ -410,8 +801,10 @@ class ChatWindow(QMainWindow):
         self.settings.setValue("host", self.host_input.text())
         self.settings.setValue("port", self.port_input.text())
         self.settings.setValue("username", self.username_input.text())
-        self.settings.setValue("minimizeToTray", self.tray_checkbox.isChecked() if hasattr(self, 'tray_checkbox') else False)
-        self.settings.setValue("autoEmoji", self.auto_emoji_checkbox.isChecked() if hasattr(self, 'auto_emoji_checkbox') else True)
+        self.settings.setValue("useTls", self.tls_checkbox.isChecked())
+        self.settings.setValue("tlsCaFile", self.tls_cafile)
+        self.settings.setValue("minimizeToTray", self.tray_checkbox.isChecked() if hasattr(self, 'tray_checkbox') else self.minimize_to_tray)
+        self.settings.setValue("autoEmoji", self.auto_emoji_checkbox.isChecked() if hasattr(self, 'auto_emoji_checkbox') else self.auto_emoji)
         
         # Guardar fuente y color
         self.settings.setValue("fontFamily", self.text_font.family())
@@ -431,10 +824,36 @@ class ChatWindow(QMainWindow):
                     QMessageBox.warning(self, "Advertencia", "Por favor, complete todos los campos.")
                     return
                 
+                # Bandeja de salida persistente de este usuario en este servidor
+                path = outbox_path(host, port, username)
+                if self.outbox is None or self.outbox.path != path:
+                    self.outbox = Outbox(path)
+                
+                # Al reconectar solo se piden al servidor los mensajes posteriores a lo ya mostrado
+                # (en la primera conexión, a lo que hay en el historial local)
+                if self.open_history_cache(host, port) or not self.client_thread:
+                    newest_num = self.history_cache.newest() if self.history_cache else 0
+                else:
+                    newest_num = self.client_thread.newest_num
+                self.history_loading = False
+                self.replaying_history = True
+                
                 # Iniciar hilo de cliente
-                self.client_thread = ClientThread(host, port, username)
+                self.client_thread = ClientThread(host, port, username, use_tls=self.tls_checkbox.isChecked(),
+                                                  cafile=self.tls_cafile or None, outbox=self.outbox,
+                                                  newest_num=newest_num, history_cache=self.history_cache)
                 self.client_thread.update_signal.connect(self.update_chat)
                 self.client_thread.connection_signal.connect(self.update_connection_status)
+                self.client_thread.typing_signal.connect(self.update_typing_users)
+                self.client_thread.roster_signal.connect(self.update_user_list)
+                self.client_thread.presence_signal.connect(self.announce_presence)
+                self.client_thread.reconnect_delay_signal.connect(self.set_reconnect_delay)
+                self.client_thread.trace_signal.connect(self.record_latency)
+                self.client_thread.history_signal.connect(self.show_history)
+                self.client_thread.attachment_signal.connect(self.append_attachment)
+                self.client_thread.fetched_signal.connect(self.make_thumbnail)
+                # Reintentar las miniaturas que fallaron o quedaron a medias con la conexión anterior
+                self.thumbnail_state.clear()
                 self.client_thread.start()
                 
                 # Mostrar mensaje de conexión
@@ -459,8 +878,14 @@ class ChatWindow(QMainWindow):
     def attempt_reconnect(self):
         """Intenta reconectar automáticamente si la conexión se pierde"""
         if not self.client_thread or not self.client_thread.isRunning():
-            self.append_system_message("Intentando reconectar en 3 segundos...")
-            QTimer.singleShot(3000, self.connect_to_server)
+            delay = self.reconnect_delay_ms
+            self.reconnect_delay_ms = 3000
+            self.append_system_message(f"Intentando reconectar en {delay / 1000:g} segundos...")
+            QTimer.singleShot(delay, self.connect_to_server)
+    
+    def set_reconnect_delay(self, delay_ms):
+        """Usa el retardo indicado por el servidor en la próxima reconexión"""
+        self.reconnect_delay_ms = delay_ms
 
     def update_connection_status(self, connected):
         """Actualiza el estado de conexión en la interfaz"""
@@ -473,47 +898,113 @@ class ChatWindow(QMainWindow):
             self.host_input.setEnabled(False)
             self.port_input.setEnabled(False)
             self.username_input.setEnabled(False)
+            self.tls_checkbox.setEnabled(False)
         else:
             self.status_label.setText("Desconectado")
             self.status_label.setStyleSheet("color: red;")
             self.connect_button.setEnabled(True)
             self.disconnect_button.setEnabled(False)
-            self.send_button.setEnabled(False)
+            # Sin conexión se puede seguir escribiendo: los mensajes esperan en la bandeja
+            self.send_button.setEnabled(self.outbox is not None)
             self.host_input.setEnabled(True)
             self.port_input.setEnabled(True)
             self.username_input.setEnabled(True)
+            self.tls_checkbox.setEnabled(True)
+            self.typing_users = []
+            self.last_typing_sent = 0
+            self.user_list.clear()
             self.attempt_reconnect()
     
-    def show_notification(self, title, message):
-        """Muestra una notificación de escritorio si la ventana no está activa"""
-        if not self.isActiveWindow():
-            try:
-                from PyQt5.QtWidgets import QSystemTrayIcon
-                tray = QSystemTrayIcon(self)
-                tray.setIcon(QIcon('chat.png'))
-                tray.show()
-                tray.showMessage(title, message, QSystemTrayIcon.Information, 3000)
-            except Exception:
-                pass
+    def setupTrayIcon(self):
+        """Crea el único icono de la bandeja, que se reutiliza para todas las notificaciones"""
+        if not QSystemTrayIcon.isSystemTrayAvailable():
+            return
+        self.tray_icon = QSystemTrayIcon(self)
+        icon = QIcon('chat.png')
+        if icon.isNull():
+            icon = self.style().standardIcon(QStyle.SP_MessageBoxInformation)
+        self.tray_icon.setIcon(icon)
+        self.tray_icon.setToolTip("Cliente de Chat")
+        self.tray_icon.activated.connect(self.show_from_tray)
+        self.tray_icon.messageClicked.connect(self.show_from_tray)
+        self.tray_icon.show()
+    
+    def show_from_tray(self, *args):
+        self.showNormal()
+        self.activateWindow()
+    
+    def show_notification(self, sender, message):
+        """Anota un mensaje para la próxima notificación si la ventana no está activa"""
+        if self.isActiveWindow() or self.replaying_history or self.tray_icon is None:
+            return
+        delay = self.notifier.add(sender, message, time.monotonic())
+        if not self.notify_timer.isActive():
+            self.notify_timer.start(int(delay * 1000))
+    
+    def flush_notifications(self):
+        """Muestra el resumen pendiente o vuelve a esperar si aún no toca"""
+        now = time.monotonic()
+        summary = self.notifier.flush(now)
+        if summary:
+            title, text = summary
+            self.tray_icon.showMessage(title, text, QSystemTrayIcon.Information, 5000)
+            return
+        delay = self.notifier.delay(now)
+        if delay is not None:
+            self.notify_timer.start(int(delay * 1000))
+    
+    def changeEvent(self, event):
+        # Al volver a la ventana los mensajes ya están a la vista: no hace falta avisar
+        if event.type() == QEvent.ActivationChange and self.isActiveWindow():
+            self.notifier.clear()
+            self.notify_timer.stop()
+        super().changeEvent(event)
 
     def update_chat(self, message, message_type):
         """Actualiza el área de chat con nuevos mensajes y muestra notificación si es necesario"""
         if message_type == "normal":
             self.append_normal_message(message)
             # Notificación solo si la ventana no está activa
-            self.show_notification("Nuevo mensaje", message)
+            sender, _, text = message.partition(": ")
+            self.show_notification(sender, text)
         elif message_type == "sistema":
             self.append_system_message(message)
         elif message_type == "error":
             self.append_error_message(message)
     
     def preview_links_in_chat(self, message):
-        """Detecta enlaces en el mensaje y muestra una vista previa básica"""
-        url_pattern = r'(https?://\S+)'  # Simple regex para URLs
-        urls = re.findall(url_pattern, message)
-        for url in urls:
-            # Solo muestra el enlace como clickeable (mejoras: usar requests y extraer título)
-            self.chat_area.append(f"<a href='{url}' style='color:#1976D2;'>{url}</a>")
+        """Detecta enlaces en el mensaje y añade una vista previa que se completa al resolverse"""
+        if "http" not in message:
+            return
+        from unfurl import LinkUnfurler, find_urls, shared_cache
+        for url in find_urls(message):
+            link = html.escape(url, quote=True)
+            self.chat_area.append(f"<a href='{link}' style='color:#1976D2;'>{link}</a> "
+                                  f"<span style='color: #888888;'>(cargando vista previa...)</span>")
+            self.link_previews.setdefault(url, []).append(self.chat_area.document().blockCount() - 1)
+            
+            # Descarga en segundo plano; el resultado vuelve al hilo de la interfaz por señal
+            if self.unfurler is None:
+                self.unfurler = LinkUnfurler(cache=shared_cache)
+            self.unfurler.request(url, self.link_preview_signal.emit)
+    
+    def update_link_preview(self, url, title):
+        """Sustituye en su sitio los marcadores de vista previa de url por el título"""
+        link = html.escape(url, quote=True)
+        if title:
+            preview = f"<a href='{link}' style='color:#1976D2;'>{html.escape(title)}</a> " \
+                      f"<span style='color: #888888;'>{link}</span>"
+        else:
+            preview = f"<a href='{link}' style='color:#1976D2;'>{link}</a>"
+        
+        document = self.chat_area.document()
+        for number in self.link_previews.pop(url, []):
+            block = document.findBlockByNumber(number)
+            if not block.isValid():
+                continue
+            cursor = QTextCursor(block)
+            cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+            cursor.insertHtml(preview)
 
     def append_normal_message(self, message):
         """Añade un mensaje normal al chat"""
@@ -528,17 +1019,244 @@ class ChatWindow(QMainWindow):
             # Formato de hora
             self.chat_area.append(f"<span style='color: #888888; font-size: 8pt;'>[{current_time}]</span>")
             
-            # Formato de usuario y mensaje
-            self.chat_area.append(f"<b>{username}:</b> {emoji.emojize(content)}")
+            # Formato de usuario y mensaje (texto ajeno: escapado, como en el historial)
+            self.chat_area.append(f"<b>{html.escape(username)}:</b> {emojize(html.escape(content))}")
             self.preview_links_in_chat(content)
         else:
             # Si no tiene el formato esperado, mostrar tal cual
-            self.chat_area.append(f"<span style='color: #888888; font-size: 8pt;'>[{current_time}]</span> {message}")
+            self.chat_area.append(f"<span style='color: #888888; font-size: 8pt;'>[{current_time}]</span> "
+                                  f"{html.escape(message)}")
             self.preview_links_in_chat(message)
         
         # Auto-scroll al final
         self.scroll_to_bottom()
     
+    def attachment_html(self, sender, attachment):
+        """HTML de un adjunto: enlace para descargarlo y su tamaño"""
+        name = str(attachment.get("nombre", "archivo"))
+        self.attachment_names[attachment["id"]] = name
+        size = attachment.get("tamano")
+        text = (f"<b>{html.escape(str(sender))}:</b> 📎 <a href='adjunto:{attachment['id']}' "
+                f"style='color:#1976D2;'>{html.escape(name)}</a>")
+        if isinstance(size, int):
+            from attachments import format_size
+            from thumbnails import is_image, THUMBNAIL_SIZE
+            text += f" <span style='color: #888888;'>({format_size(size)})</span>"
+            if is_image(name, size):
+                # Marcador del tamaño final: la miniatura lo sustituye sin recolocar el chat
+                self.show_placeholder(attachment["id"])
+                self.thumbnail_timer.start()
+                text += (f"<br><a href='adjunto:{attachment['id']}'><img src='miniatura:{attachment['id']}' "
+                         f"width='{THUMBNAIL_SIZE}' height='{THUMBNAIL_SIZE}'></a>")
+        return text
+    
+    def show_placeholder(self, file_id):
+        """Pone el marcador gris en lugar de una miniatura que no está en memoria"""
+        if self.pixmaps is not None and file_id in self.pixmaps:
+            return
+        if self.placeholder is None:
+            from thumbnails import THUMBNAIL_SIZE
+            self.placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+            self.placeholder.fill(QColor("#e0e0e0"))
+        self.chat_area.document().addResource(QTextDocument.ImageResource, QUrl(f"miniatura:{file_id}"),
+                                              self.placeholder)
+    
+    def load_visible_thumbnails(self):
+        """Muestra las miniaturas de la zona visible y de una pantalla por encima y por debajo"""
+        height = self.chat_area.viewport().height()
+        block = self.chat_area.cursorForPosition(QPoint(0, -height)).block()
+        last = self.chat_area.cursorForPosition(QPoint(0, 2 * height)).blockNumber()
+        while block.isValid() and block.blockNumber() <= last:
+            fragments = block.begin()
+            while not fragments.atEnd():
+                char_format = fragments.fragment().charFormat()
+                if char_format.isImageFormat():
+                    name = char_format.toImageFormat().name()
+                    if name.startswith("miniatura:"):
+                        self.show_thumbnail(name[len("miniatura:"):])
+                fragments += 1
+            block = block.next()
+    
+    def show_thumbnail(self, file_id):
+        """Pone una miniatura desde la memoria o el disco; si no existe, descarga la imagen"""
+        if self.pixmaps is not None and file_id in self.pixmaps:
+            self.pixmaps.get(file_id)  # recién vista: de las últimas en salir de memoria
+            return
+        if file_id in self.thumbnail_state:
+            return
+        if self.thumbnailer is None:
+            from thumbnails import Thumbnailer, SizedLRU, PIXMAP_CACHE_BYTES
+            self.thumbnailer = Thumbnailer()
+            if self.pixmaps is None:
+                self.pixmaps = SizedLRU(PIXMAP_CACHE_BYTES, on_evict=self.unload_thumbnail)
+        path = self.thumbnailer.cached(file_id)
+        if path:
+            self.install_thumbnail(file_id, path)
+        elif self.client_thread and self.client_thread.isRunning():
+            self.thumbnail_state[file_id] = "descargando"
+            if not self.client_thread.download(file_id):
+                del self.thumbnail_state[file_id]
+    
+    def make_thumbnail(self, file_id, hashes):
+        """Con la imagen ya en la caché de trozos, encarga su miniatura al grupo de procesos"""
+        if self.thumbnail_state.get(file_id) != "descargando":
+            return
+        if not hashes:
+            self.thumbnail_state[file_id] = "fallo"
+            return
+        from attachments import CLIENT_CACHE_DIR
+        self.thumbnail_state[file_id] = "generando"
+        self.thumbnailer.request(file_id, CLIENT_CACHE_DIR, hashes, self.thumbnail_signal.emit)
+    
+    def install_thumbnail(self, file_id, path):
+        """Sustituye el marcador por la miniatura y la guarda en la LRU de memoria"""
+        pixmap = QPixmap(path) if path else QPixmap()
+        if pixmap.isNull():
+            self.thumbnail_state[file_id] = "fallo"
+            return
+        self.thumbnail_state.pop(file_id, None)
+        self.chat_area.document().addResource(QTextDocument.ImageResource, QUrl(f"miniatura:{file_id}"), pixmap)
+        self.pixmaps.put(file_id, pixmap, pixmap.width() * pixmap.height() * pixmap.depth() // 8)
+        self.chat_area.viewport().update()
+    
+    def unload_thumbnail(self, file_id, pixmap):
+        """Al salir de la LRU, el documento vuelve al marcador y la imagen se libera"""
+        self.show_placeholder(file_id)
+    
+    def append_attachment(self, attachment):
+        """Añade al chat un adjunto compartido por otro usuario"""
+        current_time = datetime.datetime.now().strftime("%H:%M:%S")
+        self.chat_area.append(f"<span style='color: #888888; font-size: 8pt;'>[{current_time}]</span>")
+        self.chat_area.append(self.attachment_html(attachment.get("de", ""), attachment))
+        self.scroll_to_bottom()
+        self.show_notification(str(attachment.get("de", "")), f"📎 {attachment.get('nombre', 'archivo')}")
+    
+    def open_link(self, url):
+        """Los enlaces de adjuntos se descargan; los web se abren en el navegador y el resto se ignora"""
+        if url.scheme() == "adjunto":
+            self.save_attachment(url.path())
+        elif url.scheme() in ("http", "https"):
+            QDesktopServices.openUrl(url)
+    
+    def save_attachment(self, file_id):
+        """Pregunta dónde guardar un adjunto y lo descarga"""
+        if not (self.client_thread and self.client_thread.isRunning()):
+            self.append_error_message("Conéctate al servidor para descargar el archivo")
+            return
+        name = self.attachment_names.get(file_id, "archivo")
+        file_path, _ = QFileDialog.getSaveFileName(self, "Guardar archivo", name)
+        if file_path and self.client_thread.download(file_id, file_path):
+            self.append_system_message(f"Descargando {html.escape(name)}...")
+    
+    def history_html(self, record):
+        """HTML de un mensaje del historial, con su hora original"""
+        moment = datetime.datetime.fromtimestamp(record.get("hora", 0))
+        if moment.date() == datetime.date.today():
+            stamp = moment.strftime("%H:%M:%S")
+        else:
+            stamp = moment.strftime("%d/%m/%Y %H:%M")
+        attachment = record.get("adjunto")
+        if isinstance(attachment, dict):
+            from attachments import is_hash
+            if is_hash(attachment.get("id")):
+                return (f"<span style='color: #888888; font-size: 8pt;'>[{stamp}]</span><br>"
+                        + self.attachment_html(record.get("de", ""), attachment))
+        return (f"<span style='color: #888888; font-size: 8pt;'>[{stamp}]</span><br>"
+                f"<b>{html.escape(str(record.get('de', '')))}:</b> "
+                f"{emojize(html.escape(str(record.get('texto', ''))))}")
+    
+    def open_history_cache(self, host, port):
+        """Abre el historial local de un servidor y pinta su última página; True si cambió de servidor"""
+        server = f"{host}:{port}"
+        if self.history_cache is not None and self.history_cache.server == server:
+            return False
+        if self.history_cache is not None:
+            self.history_cache.close()
+            self.history_cache = None
+        if self.history_started:
+            # Lo que hay en pantalla es de otro servidor
+            self.clear_chat_history()
+            self.history_started = False
+            self.history_oldest = None
+            self.history_more = False
+            self.history_prefetched = None
+        import sqlite3
+        from history_cache import HistoryCache
+        try:
+            self.history_cache = HistoryCache(server, DEFAULT_ROOM)
+        except (OSError, sqlite3.Error) as e:
+            self.append_error_message(f"No se pudo abrir el historial local: {str(e)}")
+            return True
+        records = self.history_cache.latest(HISTORY_PAGE)
+        if records:
+            self.history_started = True
+            self.prepend_history(records, records[0]["num"] > 1)
+            self.scroll_to_bottom()
+        return True
+    
+    def show_history(self, records, more, initial):
+        """Muestra una página de historial recibida del servidor"""
+        if initial:
+            # El historial inicial no genera avisos; a partir de aquí, los mensajes nuevos sí
+            self.replaying_history = False
+        if initial and self.history_started and more and self.client_thread.known_num:
+            # Se pidió solo lo nuevo y no cabe en una página: se empieza de nuevo por lo último
+            self.clear_chat_history()
+            self.history_started = False
+            self.history_prefetched = None
+        if initial and self.history_started:
+            # Reconexión o historial local: lo más antiguo ya está en pantalla; añadir al final lo que faltaba
+            for record in records:
+                self.chat_area.append(self.history_html(record))
+            self.scroll_to_bottom()
+            self.prefetch_history()
+            return
+        if initial:
+            self.history_started = True
+            self.prepend_history(records, more)
+            self.scroll_to_bottom()
+            self.prefetch_history()
+            return
+        # Página pedida por adelantado: se guarda hasta que el usuario suba hasta arriba
+        self.history_loading = False
+        self.history_prefetched = (records, more)
+        self.check_scroll_back(self.chat_area.verticalScrollBar().value())
+    
+    def prefetch_history(self):
+        """Pide la siguiente página antigua para tenerla lista antes de que haga falta"""
+        if (self.history_more and not self.history_loading and self.history_prefetched is None
+                and self.client_thread and self.client_thread.isRunning()):
+            self.history_loading = self.client_thread.request_history(self.history_oldest)
+    
+    def check_scroll_back(self, value):
+        """Al acercarse al principio del chat, muestra la página descargada y pide la siguiente"""
+        if value > self.chat_area.verticalScrollBar().pageStep() // 4 or self.history_prefetched is None:
+            return
+        records, more = self.history_prefetched
+        self.history_prefetched = None
+        self.prepend_history(records, more)
+        self.prefetch_history()
+    
+    def prepend_history(self, records, more):
+        """Inserta mensajes antiguos al principio sin mover lo que el usuario está leyendo"""
+        self.history_more = more
+        if not records:
+            return
+        self.history_oldest = records[0]["num"]
+        scrollbar = self.chat_area.verticalScrollBar()
+        old_maximum, old_value = scrollbar.maximum(), scrollbar.value()
+        document = self.chat_area.document()
+        blocks = document.blockCount()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.Start)
+        cursor.insertHtml("<br>".join(self.history_html(record) for record in records))
+        cursor.insertBlock()
+        # Los marcadores de vista previa pendientes se desplazan con el texto insertado
+        added = document.blockCount() - blocks
+        for numbers in self.link_previews.values():
+            numbers[:] = [number + added for number in numbers]
+        scrollbar.setValue(old_value + scrollbar.maximum() - old_maximum)
+    
     def append_system_message(self, message):
         """Añade un mensaje del sistema al chat"""
         current_time = datetime.datetime.now().strftime("%H:%M:%S")
@@ -548,7 +1266,7 @@ class ChatWindow(QMainWindow):
             message = message[10:]
         
         self.chat_area.append(f"<span style='color: #888888; font-size: 8pt;'>[{current_time}]</span>")
-        self.chat_area.append(f"<span style='color: blue;'><i>Sistema: {emoji.emojize(message)}</i></span>")
+        self.chat_area.append(f"<span style='color: blue;'><i>Sistema: {emojize(message)}</i></span>")
         
         # Auto-scroll al final
         self.scroll_to_bottom()
@@ -571,19 +1289,23 @@ class ChatWindow(QMainWindow):
     
     def send_message(self):
         """Envía un mensaje al servidor o ejecuta comando"""
-        if self.client_thread and self.client_thread.isRunning():
+        if self.client_thread:
             message = self.message_input.toPlainText().strip()
             if message:
                 if not self.handle_command(message):
                     success = self.client_thread.send_message(message)
                     if success:
+                        # El servidor retira el indicador al recibir el mensaje
+                        self.last_typing_sent = 0
+                        self.message_input.blockSignals(True)
                         self.message_input.clear()
+                        self.message_input.blockSignals(False)
                 else:
                     self.message_input.clear()
     
     def send_private_message(self, recipient, message):
         """Envía un mensaje privado (DM) a otro usuario (solo formato de mensaje)"""
-        if self.client_thread and self.client_thread.isRunning():
+        if self.client_thread:
             self.client_thread.send_message(f"/dm {recipient} {message}")
             self.append_system_message(f"(Privado a {recipient}): {message}")
 
@@ -616,15 +1338,19 @@ class ChatWindow(QMainWindow):
         return False
 
     def send_file(self):
-        """Permite enviar un archivo al servidor (solo envía la ruta como demo)"""
+        """Envía un archivo a la sala; solo se suben los trozos que el servidor no tenga ya"""
+        if not (self.client_thread and self.client_thread.isRunning()):
+            self.append_error_message("Conéctate al servidor para enviar archivos")
+            return
         file_path, _ = QFileDialog.getOpenFileName(self, "Seleccionar archivo para enviar")
         if file_path:
-            # En una implementación real, aquí se enviaría el archivo por el socket
-            # Por ahora, solo se envía el nombre del archivo como mensaje
-            if self.client_thread and self.client_thread.isRunning():
-                filename = os.path.basename(file_path)
-                self.client_thread.send_message(f"[Archivo enviado]: {filename}")
-                self.append_system_message(f"Has enviado el archivo: {filename}")
+            from attachments import MAX_ATTACHMENT, format_size
+            if os.path.getsize(file_path) > MAX_ATTACHMENT:
+                self.append_error_message(f"El archivo supera el máximo de {format_size(MAX_ATTACHMENT)}")
+                return
+            filename = os.path.basename(file_path)
+            if self.client_thread.send_file(file_path):
+                self.append_system_message(f"Enviando el archivo: {html.escape(filename)}")
 
     def change_text_color(self):
         """Cambia el color del texto para los mensajes"""
@@ -652,12 +1378,34 @@ class ChatWindow(QMainWindow):
             
             if reply == QMessageBox.Yes:
                 self.disconnect_from_server()
+                self.stop_unfurler()
+                self.stop_thumbnailer()
+                self.hide_tray_icon()
                 event.accept()
             else:
                 event.ignore()
         else:
+            self.stop_unfurler()
+            self.stop_thumbnailer()
+            self.hide_tray_icon()
             event.accept()
     
+    def hide_tray_icon(self):
+        if self.tray_icon:
+            self.tray_icon.hide()
+    
+    def stop_unfurler(self):
+        """Detiene los hilos de vista previa de enlaces"""
+        if self.unfurler:
+            self.unfurler.shutdown()
+            self.unfurler = None
+    
+    def stop_thumbnailer(self):
+        """Detiene los procesos de miniaturas"""
+        if self.thumbnailer:
+            self.thumbnailer.shutdown()
+            self.thumbnailer = None
+    
     def applyTheme(self):
         """Aplica el tema claro u oscuro a toda la aplicación"""
         palette = QPalette()
@@ -890,6 +1638,10 @@ class ChatWindow(QMainWindow):
     def clear_chat_history(self):
         """Limpia el área de chat"""
         self.chat_area.clear()
+        # Las vistas previas pendientes apuntaban a bloques que ya no existen
+        self.link_previews = {}
+        # clear() también descarta las imágenes del documento
+        self.pixmaps.clear()
     
     def search_chat_history(self, query):
         """Busca mensajes en el historial de chat"""
@@ -909,9 +1661,39 @@ class ChatWindow(QMainWindow):
         layout.addWidget(search_button)
 
     def update_time(self):
-        """Actualiza la barra de estado con la hora actual"""
+        """Actualiza la barra de estado con la hora actual y quién está escribiendo"""
         current_time = datetime.datetime.now().strftime("%H:%M:%S")
-        self.statusBar().showMessage(f"Cliente de Chat listo - {current_time}")
+        status = f"Cliente de Chat listo - {current_time}"
+        if self.typing_users:
+            if len(self.typing_users) == 1:
+                status += f" | {self.typing_users[0]} está escribiendo..."
+            elif len(self.typing_users) <= 3:
+                status += f" | {', '.join(self.typing_users)} están escribiendo..."
+            else:
+                status += f" | {len(self.typing_users)} personas están escribiendo..."
+        if self.outbox and len(self.outbox):
+            status += f" | {len(self.outbox)} mensaje{'s' if len(self.outbox) != 1 else ''} sin confirmar"
+        latency = self.latency.summary(("total", "cliente"))
+        if latency:
+            status += f" | Latencia: {latency}"
+        self.statusBar().showMessage(status)
+        self.report_latency()
+    
+    def record_latency(self, trace):
+        """Completa la traza de un mensaje ya pintado con el instante actual"""
+        ingest, fanout, received = trace
+        self.latency.record((ingest, fanout), received, time.time())
+    
+    def report_latency(self):
+        """Envía al servidor las muestras nuevas cada LATENCY_REPORT_INTERVAL segundos"""
+        now = time.monotonic()
+        if now - self.last_latency_report < self.LATENCY_REPORT_INTERVAL:
+            return
+        self.last_latency_report = now
+        if self.client_thread and self.client_thread.isRunning():
+            stages = self.latency.report()
+            if stages:
+                self.client_thread.send_latency_report(stages)
 
     def show_emoji_selector(self):
         """Muestra un selector de emojis con más opciones"""
@@ -919,11 +1701,39 @@ class ChatWindow(QMainWindow):
         show_emoji_selector(self)
 
     def typing_indicator(self):
-        """Envía un indicador de escritura al servidor (solo local demo)"""
+        """Envía un indicador de escritura al servidor, como mucho uno cada TYPING_RESEND segundos"""
         if self.client_thread and self.client_thread.isRunning():
-            # En una implementación real, se enviaría un mensaje especial al servidor
-            self.statusBar().showMessage("Escribiendo...")
-            QTimer.singleShot(1500, self.update_time)
+            now = time.monotonic()
+            if not self.message_input.toPlainText():
+                # Campo vacío: dejar de escribir solo si se había avisado
+                if self.last_typing_sent:
+                    self.client_thread.send_typing(False)
+                    self.last_typing_sent = 0
+            elif now - self.last_typing_sent >= self.TYPING_RESEND:
+                self.client_thread.send_typing(True)
+                self.last_typing_sent = now
+    
+    def update_user_list(self, users):
+        """Muestra la lista de usuarios conectados a la sala"""
+        self.user_list.clear()
+        self.user_list.addItems(users)
+    
+    def announce_presence(self, added, removed):
+        """Resume en el chat las altas y bajas de un delta de usuarios"""
+        for users, action in ((added, "unido al"), (removed, "salido del")):
+            if not users:
+                continue
+            if len(users) == 1:
+                self.append_system_message(f"{users[0]} se ha {action} chat")
+            elif len(users) <= 3:
+                self.append_system_message(f"{', '.join(users)} se han {action} chat")
+            else:
+                self.append_system_message(f"{len(users)} usuarios se han {action} chat")
+    
+    def update_typing_users(self, users):
+        """Actualiza la lista de usuarios que están escribiendo en la sala"""
+        self.typing_users = users
+        self.update_time()
         
     def custom_theme_dialog(self):
         """Permite al usuario personalizar el color de fondo y texto del chat"""
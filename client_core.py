@@ -0,0 +1,333 @@
+# Núcleo de red del cliente de chat: conexión, saludo y tramas (sin Qt)
+import selectors
+import socket
+import time
+from collections import deque
+from output import OutputScheduler, set_nodelay, DEFAULT_TICK, MAX_BATCH
+from protocol import (encode_frame, FrameReader, ALIAS, MESSAGE, QUIT, TYPING,
+                      ROSTER, ROSTER_DELTA, LATENCY, BATCH, HISTORY, ATTACH_OFFER, ATTACH, ATTACH_INDEX,
+                      CHUNK, CHUNK_REQUEST, MAX_FRAME, DEFAULT_ROOM)
+
+# Mensajes por página de historial
+HISTORY_PAGE = 50
+
+class SocketLoop:
+    """Bucle de red de un solo hilo sobre un socket no bloqueante.
+
+    Lee y escribe desde el mismo hilo: las tramas se encolan desde cualquier
+    otro (deque más un aviso por un par de sockets) y salen juntas en la
+    siguiente vuelta, sin hilo escritor aparte. call() lleva trabajo de otro
+    hilo a este mismo bucle. stop() interrumpe la espera al instante, también
+    desde otro hilo.
+    """
+
+    def __init__(self, sock, max_pending=1000, retry_errors=()):
+        self.sock = sock
+        self.max_pending = max_pending
+        # Errores que solo indican "aún no": sin datos o, con TLS, registro incompleto
+        self.retry_errors = (BlockingIOError, InterruptedError) + tuple(retry_errors)
+        self.pending = deque()
+        self.calls = deque()  # funciones de otros hilos que se ejecutan en el bucle
+        self.outgoing = bytearray()
+        self.closed = False
+        self.stopping = False
+        self.writes = 0
+        self._woken = False
+        self._events = selectors.EVENT_READ
+        sock.setblocking(False)
+        set_nodelay(sock)
+        self._wake_reader, self._waker = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._waker.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self._wake_reader, selectors.EVENT_READ, None)
+        self.selector.register(sock, self._events, sock)
+
+    def wake(self):
+        """Despierta al bucle (un solo aviso aunque se encolen varias tramas)"""
+        if not self._woken:
+            self._woken = True
+            try:
+                self._waker.send(b"\0")
+            except OSError:
+                pass
+
+    def send(self, data):
+        """Encola una trama; devuelve False si el bucle está cerrado o saturado"""
+        if self.closed:
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.fail()
+            return False
+        self.pending.append(data)
+        self.wake()
+        return True
+
+    def send_many(self, frames):
+        return self.send(b"".join(frames))
+
+    def call(self, function):
+        """Ejecuta function() en el hilo del bucle; devuelve False si el bucle está cerrado"""
+        if self.closed:
+            return False
+        self.calls.append(function)
+        self.wake()
+        return True
+
+    def run(self, on_data):
+        """Atiende el socket hasta stop(); si el servidor cierra, lanza ConnectionError"""
+        while not self.stopping:
+            for key, events in self.selector.select():
+                if key.data is None:
+                    self._woken = False
+                    try:
+                        self._wake_reader.recv(4096)
+                    except OSError:
+                        pass
+                elif events & selectors.EVENT_READ:
+                    self.read(on_data)
+            while self.calls:
+                self.calls.popleft()()
+            self.flush()
+
+    def read(self, on_data):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except self.retry_errors:
+                return
+            if not data:
+                raise ConnectionError("El servidor cerró la conexión")
+            on_data(data)
+            # Con TLS puede quedar texto descifrado sin que el socket vuelva a estar listo
+            pending = getattr(self.sock, "pending", None)
+            if not pending or not pending():
+                return
+
+    def flush(self):
+        """Escribe sin bloquear lo que quepa; lo demás espera a que el socket admita más"""
+        while self.pending and len(self.outgoing) < MAX_BATCH:
+            self.outgoing += self.pending.popleft()
+        if self.outgoing:
+            try:
+                sent = self.sock.send(self.outgoing)
+                del self.outgoing[:sent]
+                self.writes += 1
+            except self.retry_errors:
+                pass
+        events = selectors.EVENT_READ
+        if self.outgoing or self.pending:
+            events |= selectors.EVENT_WRITE
+        if events != self._events:
+            self._events = events
+            self.selector.modify(self.sock, events, self.sock)
+
+    def drain(self, timeout):
+        """Envía lo pendiente esperando como mucho 'timeout' segundos (al cerrar, con el bucle parado)"""
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                self.flush()
+                remaining = deadline - time.monotonic()
+                if not (self.outgoing or self.pending):
+                    return True
+                if remaining <= 0:
+                    return False
+                self.selector.select(min(remaining, 0.05))
+        except (OSError, ValueError):
+            return False
+
+    def stop(self):
+        """Termina run() en cuanto el bucle lo vea, desde cualquier hilo"""
+        self.stopping = True
+        self.wake()
+
+    def fail(self):
+        self.closed = True
+        self.stop()
+
+    def close(self):
+        self.closed = True
+        self.selector.close()
+        self._waker.close()
+        self._wake_reader.close()
+
+class ChatConnection:
+    """Conexión de un cliente con el servidor de chat.
+
+    Responde por sí misma al saludo (ALIAS) y mantiene la lista de usuarios de
+    la sala; el resto de tramas se devuelven a quien llama. Puede usarse desde
+    el QThread de la interfaz, desde scripts o desde los benchmarks.
+    """
+
+    def __init__(self, host, port, username, room=DEFAULT_ROOM, timeout=10,
+                 use_tls=False, cafile=None, verify=True, write_tick=DEFAULT_TICK):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.room = room
+        self.timeout = timeout
+        self.use_tls = use_tls
+        self.cafile = cafile
+        self.verify = verify
+        self.resumed = False  # sesión TLS reanudada en lugar de un saludo completo
+        self.write_tick = write_tick
+        self.sock = None
+        self.output = None
+        self.reader = FrameReader()
+        self.roster = set()
+        self.joined = False
+
+    def connect(self, loop=False):
+        """Abre la conexión TCP con el servidor, cifrada con TLS si se pidió.
+
+        Con loop=True la conexión se atiende después con serve(), en un solo hilo.
+        """
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        retry_errors = ()
+        if self.use_tls:
+            import tls  # ssl solo se carga si se usa
+            # Reanudar la última sesión con este servidor si la hay
+            context = tls.shared_client_context(self.cafile, self.verify)
+            self.sock = context.wrap_socket(self.sock, server_hostname=self.host,
+                                            session=tls.session_cache.get(self.host, self.port))
+            self.resumed = self.sock.session_reused
+            import ssl
+            retry_errors = (ssl.SSLWantReadError, ssl.SSLWantWriteError)
+        if loop:
+            self.output = SocketLoop(self.sock, retry_errors=retry_errors)
+            return
+        # A partir de aquí las lecturas son bloqueantes
+        self.sock.settimeout(None)
+        # Las escrituras pasan por el planificador de salida (TCP_NODELAY + micro-tick)
+        self.output = OutputScheduler(self.sock, self.write_tick)
+        self.output.start()
+
+    def receive(self):
+        """Espera datos del servidor y devuelve las tramas recibidas (excepto el saludo)"""
+        data = self.sock.recv(4096)
+        if not data:
+            raise ConnectionError("El servidor cerró la conexión")
+        return self.process(data)
+
+    def serve(self, on_frames):
+        """Atiende la conexión (abierta con loop=True) hasta stop(); on_frames recibe cada lista de tramas"""
+        self.output.run(lambda data: on_frames(self.process(data)))
+
+    def call_soon(self, function):
+        """Ejecuta function() en el hilo de serve(); devuelve False si la conexión no lo admite"""
+        return isinstance(self.output, SocketLoop) and self.output.call(function)
+
+    def stop(self):
+        """Interrumpe serve() desde cualquier hilo"""
+        if isinstance(self.output, SocketLoop):
+            self.output.stop()
+
+    def process(self, data):
+        """Decodifica los datos recibidos; responde al saludo y devuelve el resto de tramas"""
+        if self.use_tls and not self.joined:
+            # En TLS 1.3 el ticket llega después del saludo, con los primeros datos
+            import tls
+            tls.session_cache.store(self.host, self.port, self.sock)
+        frames = []
+        for frame in self.reader.feed(data):
+            if frame["tipo"] == ALIAS:
+                # Enviar nombre de usuario y sala
+                self.send_frame(encode_frame(ALIAS, alias=self.username, sala=self.room))
+                self.joined = True
+            else:
+                frames.append(frame)
+        return frames
+
+    def apply_roster(self, frame):
+        """Aplica una instantánea o un delta de usuarios; devuelve (altas, bajas)"""
+        if frame["tipo"] == ROSTER:
+            self.roster = set(frame.get("usuarios", []))
+            return [], []
+        if frame["tipo"] == ROSTER_DELTA:
+            added = [user for user in frame.get("altas", []) if user not in self.roster]
+            removed = [user for user in frame.get("bajas", []) if user in self.roster]
+            self.roster.update(added)
+            self.roster.difference_update(removed)
+            return added, removed
+        return [], []
+
+    def send_frame(self, frame):
+        """Encola una trama ya codificada para enviarla en el siguiente micro-tick"""
+        if not self.output.send(frame):
+            raise ConnectionError("La conexión está cerrada")
+
+    def send_message(self, text, msg_id=None):
+        """Envía un mensaje de chat; 'salir' cierra la sesión en el servidor"""
+        if text.lower() == "salir":
+            self.send_frame(encode_frame(QUIT))
+        elif msg_id:
+            # Con clave de idempotencia: el servidor confirma y descarta los duplicados
+            self.send_frame(encode_frame(MESSAGE, texto=text, id=msg_id))
+        else:
+            self.send_frame(encode_frame(MESSAGE, texto=text))
+
+    def send_batch(self, entries):
+        """Envía mensajes pendientes [{"id", "texto"}] en tramas de lote por debajo de MAX_FRAME"""
+        batch = []
+        size = 0
+        for entry in entries:
+            item = {"id": entry["id"], "texto": entry["texto"]}
+            item_size = len(encode_frame(MESSAGE, **item))
+            if batch and size + item_size > MAX_FRAME // 2:
+                self.send_frame(encode_frame(BATCH, mensajes=batch))
+                batch, size = [], 0
+            batch.append(item)
+            size += item_size
+        if batch:
+            self.send_frame(encode_frame(BATCH, mensajes=batch))
+
+    def send_typing(self, active):
+        """Notifica que el usuario empezó o dejó de escribir"""
+        self.send_frame(encode_frame(TYPING, activo=active))
+
+    def request_history(self, before=None, limit=HISTORY_PAGE, after=None):
+        """Pide los mensajes anteriores al número 'before' (los últimos si es None).
+
+        Con 'after' solo se piden los posteriores a ese número (los que faltan en el
+        historial local); si son más de 'limit' llegan los últimos y "mas" lo indica.
+        """
+        if after:
+            self.send_frame(encode_frame(HISTORY, antes=before, limite=limit, desde=after))
+        else:
+            self.send_frame(encode_frame(HISTORY, antes=before, limite=limit))
+
+    def send_latency(self, stages):
+        """Envía al servidor los histogramas de latencia acumulados {etapa: contadores}"""
+        self.send_frame(encode_frame(LATENCY, etapas=stages))
+
+    def offer_attachment(self, file_id, size, hashes):
+        """Anuncia un adjunto; el servidor responde con los trozos que aún no tiene"""
+        self.send_frame(encode_frame(ATTACH_OFFER, id=file_id, tamano=size, trozos=hashes))
+
+    def send_chunk(self, digest, data):
+        from attachments import encode_chunk  # solo se carga al enviar adjuntos
+        self.send_frame(encode_frame(CHUNK, hash=digest, datos=encode_chunk(data)))
+
+    def share_attachment(self, file_id, name):
+        """Comparte en la sala un adjunto ya subido"""
+        self.send_frame(encode_frame(ATTACH, id=file_id, nombre=name))
+
+    def request_attachment(self, file_id):
+        """Pide la lista de trozos de un adjunto"""
+        self.send_frame(encode_frame(ATTACH_INDEX, id=file_id))
+
+    def request_chunks(self, hashes):
+        self.send_frame(encode_frame(CHUNK_REQUEST, trozos=hashes))
+
+    def close(self, timeout=0.5):
+        """Envía lo pendiente (como mucho 'timeout' segundos) y cierra la conexión"""
+        if self.output:
+            self.output.drain(timeout)
+            if isinstance(self.output, SocketLoop):
+                self.output.close()
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
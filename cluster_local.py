@@ -0,0 +1,136 @@
+# Federación local: arranca varios servidores enlazados y comprueba el relevo entre ellos
+#
+# Uso: python cluster_local.py [--nodes 3] [--base-port 11000] [--keep]
+# Los nodos se enlazan en cadena (cada uno con el anterior), de modo que un mensaje del
+# primero tiene que atravesar todos los nodos intermedios para llegar al último. Al final
+# se mata el último nodo y se vuelve a arrancar: sus mensajes tienen que seguir llegando.
+# Con --keep los servidores siguen en marcha hasta pulsar Ctrl+C.
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+from client_core import ChatConnection
+from protocol import MESSAGE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SECRET = "cluster-local"
+
+def start_node(i, base_port):
+    """Arranca el servidor i sin interfaz; se enlaza con el i-1"""
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", RELAY_SECRET=SECRET)
+    command = [sys.executable, "server.py", "--headless", "--host", "127.0.0.1",
+               "--port", str(base_port + i), "--node-id", f"nodo{i + 1}", "--history", ""]
+    if i:
+        command += ["--peer", f"127.0.0.1:{base_port + i - 1}"]
+    return subprocess.Popen(command, cwd=HERE, env=env, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def start_nodes(count, base_port):
+    return [start_node(i, base_port) for i in range(count)]
+
+def join(port, username):
+    """Conecta un cliente y espera a la lista de usuarios inicial"""
+    for _ in range(50):
+        try:
+            conn = ChatConnection("127.0.0.1", port, username, timeout=5)
+            conn.connect()
+            break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        raise RuntimeError(f"el nodo del puerto {port} no arrancó")
+    while not conn.joined or not conn.roster:
+        for frame in conn.receive():
+            conn.apply_roster(frame)
+    return conn
+
+def wait_for(conn, condition, timeout=10):
+    """Lee tramas hasta que condition(trama) se cumpla; devuelve cuánto tardó"""
+    start = time.perf_counter()
+    conn.sock.settimeout(timeout)
+    frame = {"tipo": None}
+    while True:
+        try:
+            frames = conn.receive()
+        except socket.timeout:
+            # Las condiciones sobre la lista de usuarios pueden cumplirse sin trama nueva
+            if condition(frame):
+                conn.sock.settimeout(None)
+                return time.perf_counter() - start
+            raise
+        for frame in frames:
+            conn.apply_roster(frame)
+            if condition(frame):
+                conn.sock.settimeout(None)
+                return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de federación con servidores locales")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=11000)
+    parser.add_argument("--keep", action="store_true", help="dejar los servidores en marcha al terminar")
+    args = parser.parse_args()
+
+    processes = start_nodes(args.nodes, args.base_port)
+    last = args.nodes - 1
+    failed = False
+    try:
+        first = join(args.base_port, "ana")
+        # Presencia: ana (nodo1) tiene que aparecer en la lista del último nodo
+        other = join(args.base_port + last, "luis")
+        remote = "ana@nodo1"
+        # Puede venir ya en la instantánea inicial de la sala
+        elapsed = 0.0 if remote in other.roster else wait_for(other, lambda frame: remote in other.roster)
+        print(f"Presencia nodo1 -> nodo{last + 1}: {remote} visible en {elapsed * 1000:.0f} ms")
+        # Mensajes en los dos sentidos a través de toda la cadena
+        first.send_message("hola desde nodo1")
+        elapsed = wait_for(other, lambda frame: frame["tipo"] == MESSAGE and frame.get("de") == remote)
+        print(f"Mensaje nodo1 -> nodo{last + 1}: {elapsed * 1000:.1f} ms")
+        other.send_message("hola desde el otro extremo")
+        elapsed = wait_for(first, lambda frame: frame["tipo"] == MESSAGE
+                           and frame.get("de") == f"luis@nodo{last + 1}")
+        print(f"Mensaje nodo{last + 1} -> nodo1: {elapsed * 1000:.1f} ms")
+        # Baja: al salir luis desaparece de la lista de nodo1. Antes tiene que haber
+        # llegado su alta: si entra y sale dentro del mismo intervalo de presencia,
+        # las dos se anulan y nodo1 no recibe ningún cambio
+        local = f"luis@nodo{last + 1}"
+        if local not in first.roster:
+            wait_for(first, lambda frame: local in first.roster)
+        other.close()
+        elapsed = wait_for(first, lambda frame: local not in first.roster)
+        print(f"Baja nodo{last + 1} -> nodo1: {elapsed * 1000:.0f} ms")
+        # Reinicio: el nodo vuelve con el mismo nombre y sus eventos no pueden
+        # confundirse con los de antes, que los demás nodos aún recuerdan
+        processes[last].kill()
+        processes[last].wait()
+        processes[last] = start_node(last, args.base_port)
+        start = time.perf_counter()
+        other = join(args.base_port + last, "luis")
+        if local not in first.roster:
+            wait_for(first, lambda frame: local in first.roster)
+        other.send_message("hola tras reiniciar")
+        wait_for(first, lambda frame: frame["tipo"] == MESSAGE and frame.get("de") == local)
+        print(f"Reinicio nodo{last + 1}: mensajes de nuevo en nodo1 a los "
+              f"{(time.perf_counter() - start) * 1000:.0f} ms")
+        other.close()
+        first.close()
+        if args.keep:
+            print("Servidores en marcha; Ctrl+C para terminar")
+            while True:
+                time.sleep(1)
+    except (OSError, RuntimeError) as e:
+        print(f"ERROR: {e}")
+        failed = True
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# Diagnóstico en caliente: muestreo de pilas, tracemalloc y volcado de hilos (sin Qt)
+import datetime
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+
+DEFAULT_DIRECTORY = "diagnostics"
+
+def timestamp():
+    return datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+
+def thread_names():
+    """Mapa ident -> nombre de los hilos vivos"""
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+class StackSampler:
+    """Perfilador estadístico: toma la pila de todos los hilos cada 'interval' segundos.
+
+    A diferencia de cProfile, que solo ve el hilo en el que se activa, el
+    muestreo cubre los hilos de clientes, escritores y presencia sin tener que
+    reiniciar el servidor, y su coste no depende del número de llamadas.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()  # "hilo;func;func" -> muestras
+        self.samples = 0
+        self.started = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.stacks.clear()
+        self.samples = 0
+        self.started = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="diag-sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                calls = []
+                while frame is not None:
+                    code = frame.f_code
+                    calls.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                name = names.get(ident, str(ident))
+                self.stacks[";".join([name] + calls[::-1])] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        """Escribe las pilas en formato "plegado" (compatible con flamegraph.pl y speedscope)"""
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def summary(self, limit=15):
+        """Funciones con más muestras en la cima de la pila (tiempo propio)"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        lines = [f"{self.samples} muestras en {time.monotonic() - self.started:.1f} s"]
+        for function, count in leaves.most_common(limit):
+            lines.append(f"{count * 100 / total:6.1f}%  {function}")
+        return "\n".join(lines)
+
+class MemoryTracker:
+    """Instantáneas de tracemalloc y diferencias entre ellas"""
+
+    def __init__(self, frames=10):
+        self.frames = frames
+        self.previous = None
+
+    @property
+    def running(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self.previous = tracemalloc.take_snapshot()
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def snapshot(self, path=None, limit=15):
+        """Toma una instantánea, la compara con la anterior y devuelve el resumen"""
+        current = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if path:
+            current.dump(path)
+        size, peak = tracemalloc.get_traced_memory()
+        lines = [f"Memoria trazada: {size / 1024:.0f} KiB (pico {peak / 1024:.0f} KiB)"]
+        for stat in current.compare_to(self.previous, "lineno")[:limit]:
+            lines.append(f"{stat.size_diff / 1024:+9.1f} KiB {stat.count_diff:+7d} bloques  {stat.traceback}")
+        self.previous = current
+        return "\n".join(lines)
+
+def dump_thread_stacks(path):
+    """Escribe la pila actual de cada hilo en un fichero"""
+    names = thread_names()
+    frames = sys._current_frames()
+    with open(path, "w", encoding="utf-8") as file:
+        for ident, frame in frames.items():
+            file.write(f"--- Hilo {names.get(ident, '?')} ({ident}) ---\n")
+            file.write("".join(traceback.format_stack(frame)))
+            file.write("\n")
+    return len(frames)
+
+class Diagnostics:
+    """Órdenes de diagnóstico comunes a la pestaña de la interfaz y al modo sin interfaz"""
+
+    HELP = ("Órdenes de diagnóstico:\n"
+            "  perfil iniciar [intervalo_ms]  - empieza el muestreo de pilas\n"
+            "  perfil detener                 - detiene el muestreo y guarda las pilas\n"
+            "  memoria iniciar                - activa tracemalloc\n"
+            "  memoria instantanea            - guarda una instantánea y la compara con la anterior\n"
+            "  memoria detener                - desactiva tracemalloc\n"
+            "  pilas                          - vuelca la pila de cada hilo a un fichero")
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self.directory = directory
+        self.sampler = StackSampler()
+        self.memory = MemoryTracker()
+        self._lock = threading.Lock()
+
+    def path(self, prefix, extension):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{prefix}-{timestamp()}.{extension}")
+
+    def command(self, line):
+        """Ejecuta una orden de texto y devuelve el resultado como texto"""
+        words = line.split()
+        try:
+            with self._lock:
+                return self._dispatch(words)
+        except Exception as e:
+            return f"Error: {e}"
+
+    def _dispatch(self, words):
+        if words[:2] == ["perfil", "iniciar"]:
+            if self.sampler.running:
+                return "El muestreo ya está en marcha"
+            if len(words) > 2:
+                self.sampler.interval = float(words[2]) / 1000
+            self.sampler.start()
+            return f"Muestreo iniciado cada {self.sampler.interval * 1000:g} ms"
+        if words[:2] == ["perfil", "detener"]:
+            if not self.sampler.running:
+                return "El muestreo no está en marcha"
+            self.sampler.stop()
+            path = self.path("perfil", "txt")
+            self.sampler.write_collapsed(path)
+            return f"{self.sampler.summary()}\nPilas guardadas en {path}"
+        if words[:2] == ["memoria", "iniciar"]:
+            if self.memory.running:
+                return "tracemalloc ya está activo"
+            self.memory.start()
+            return "tracemalloc activado"
+        if words[:2] == ["memoria", "instantanea"]:
+            if not self.memory.running:
+                return "tracemalloc no está activo (memoria iniciar)"
+            path = self.path("memoria", "snapshot")
+            return f"{self.memory.snapshot(path)}\nInstantánea guardada en {path}"
+        if words[:2] == ["memoria", "detener"]:
+            self.memory.stop()
+            return "tracemalloc desactivado"
+        if words[:1] == ["pilas"]:
+            path = self.path("pilas", "txt")
+            count = dump_thread_stacks(path)
+            return f"Pilas de {count} hilos guardadas en {path}"
+        return self.HELP
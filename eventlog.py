@@ -0,0 +1,153 @@
+# Registro de eventos del servidor en JSON-lines con escritura en segundo plano y rotación (sin Qt)
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+
+# Eventos en memoria a la espera del disco; por encima se descartan en vez de bloquear
+MAX_PENDING = 100000
+# Tiempo que espera el escritor a que se acumulen más eventos antes de escribir (segundos)
+FLUSH_INTERVAL = 0.2
+# Eventos por escritura
+BATCH = 1000
+# Etiqueta inicial de los mensajes del servidor: "[MENSAJE] a: hola"
+TAG = re.compile(r"\[([^\]]+)\]\s*")
+
+class EventLog:
+    """Fichero de eventos con un hilo escritor, escrituras agrupadas y rotación.
+
+    log() solo encola una tupla y nunca toca el disco, de modo que se puede
+    llamar desde los hilos que atienden a los clientes: el formato JSON, la
+    escritura, la rotación y la compresión ocurren en el hilo escritor. Si el
+    disco no da abasto la cola se llena y los eventos nuevos se descartan
+    (y se cuentan) en lugar de frenar al servidor.
+
+    El fichero rota al superar max_bytes o tras rotate_seconds; el anterior se
+    renombra con la fecha, se comprime con gzip y se conservan 'backups'.
+    """
+
+    def __init__(self, path, max_bytes=10 * 2**20, rotate_seconds=24 * 3600, backups=10):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backups = backups
+        self.pending = deque()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.written = 0
+        self.dropped = 0
+        self.file = None
+        self.opened = None  # instante en que se abrió el fichero actual
+        self.writer = None
+
+    def start(self):
+        """Abre el fichero y arranca el hilo escritor; lanza OSError si no se puede abrir"""
+        self.open()
+        self.running = True
+        self.writer = threading.Thread(target=self.writer_loop, name="registro-eventos")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def open(self):
+        self.file = open(self.path, "ab")
+        self.opened = time.time()
+        if self.file.tell():
+            # Al reabrir un fichero existente, su antigüedad cuenta desde su primer evento
+            with open(self.path, "rb") as file:
+                try:
+                    self.opened = float(json.loads(file.readline())["hora"])
+                except (ValueError, KeyError, TypeError):
+                    pass
+
+    def log(self, message, type="info"):
+        """Encola un evento (mensaje y tipo, como update_signal); no bloquea nunca"""
+        if not self.running:
+            return
+        if len(self.pending) >= MAX_PENDING:
+            self.dropped += 1
+            return
+        self.pending.append((time.time(), type, message))
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+
+    def format(self, event):
+        moment, type, message = event
+        record = {"hora": round(moment, 3), "tipo": type}
+        tag = TAG.match(message)
+        if tag:
+            record["evento"] = tag.group(1)
+            message = message[tag.end():]
+        record["texto"] = message
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode("utf-8") + b"\n"
+
+    def writer_loop(self):
+        while self.running or self.pending:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            if self.running:
+                # Dar tiempo a que se acumulen más eventos: una escritura por lote
+                time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+                if time.time() - self.opened >= self.rotate_seconds:
+                    self.rotate()
+            except OSError:
+                # Disco lleno o fichero inaccesible: se pierde el lote, no el servidor
+                if self.file.closed:
+                    try:
+                        self.open()
+                    except OSError:
+                        time.sleep(1)
+
+    def flush(self):
+        """Escribe la cola en lotes de hasta BATCH eventos, rotando en cuanto se supera max_bytes"""
+        while self.pending:
+            batch = []
+            while self.pending and len(batch) < BATCH:
+                batch.append(self.format(self.pending.popleft()))
+            self.file.write(b"".join(batch))
+            self.file.flush()
+            self.written += len(batch)
+            if self.file.tell() >= self.max_bytes:
+                self.rotate()
+
+    def rotate(self):
+        """Cierra el fichero actual, lo comprime con la fecha en el nombre y abre uno nuevo"""
+        if not self.file.tell():
+            self.opened = time.time()
+            return
+        self.file.close()
+        # Fecha con microsegundos: los nombres se ordenan igual que las rotaciones
+        now = time.time()
+        rotated = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now % 1 * 1e6):06d}"
+        os.replace(self.path, rotated)
+        self.open()
+        with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb", compresslevel=6) as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated)
+        self.prune()
+
+    def prune(self):
+        """Borra los ficheros rotados más antiguos por encima de 'backups'"""
+        directory, name = os.path.split(os.path.abspath(self.path))
+        rotated = sorted(entry for entry in os.listdir(directory)
+                         if entry.startswith(name + ".") and entry.endswith(".gz"))
+        for entry in rotated[:max(len(rotated) - self.backups, 0)]:
+            os.remove(os.path.join(directory, entry))
+
+    def close(self, timeout=5.0):
+        """Escribe lo pendiente y cierra el fichero en como mucho 'timeout' segundos"""
+        if not self.running:
+            return
+        self.running = False
+        self.wakeup.set()
+        self.writer.join(timeout)
+        if not self.writer.is_alive():
+            self.file.close()
+
+    def summary(self):
+        return f"{self.written} eventos en {self.path}, {len(self.pending)} en cola, {self.dropped} descartados"
@@ -0,0 +1,337 @@
+# Federación entre servidores: relevo de mensajes y presencia por TCP (sin Qt)
+import hashlib
+import hmac
+import itertools
+import secrets
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from output import set_nodelay
+from protocol import encode_frame, FrameReader, ALIAS, NODE, RELAY, MAX_FRAME
+
+# Tipos de evento dentro de una trama de relevo
+EVENT_MESSAGE = "mensaje"
+EVENT_PRESENCE = "presencia"
+
+def read_frame(sock, reader, pending):
+    """Devuelve la siguiente trama del socket o None si se cerró la conexión"""
+    while not pending:
+        data = sock.recv(65536)
+        if not data:
+            return None
+        pending.extend(reader.feed(data))
+    return pending.pop(0)
+
+def parse_peer(spec):
+    """Convierte "host:puerto" en (host, puerto)"""
+    host, _, port = spec.strip().rpartition(":")
+    return host, int(port)
+
+class PeerLink:
+    """Enlace con otro servidor: los eventos se acumulan y salen en una trama de relevo por ventana"""
+
+    def __init__(self, sock, peer_id, batch_window=0.01):
+        self.sock = sock
+        self.peer_id = peer_id
+        self.batch_window = batch_window
+        self.pending = deque()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.frames = 0
+        self.events = 0
+        self.writer = threading.Thread(target=self.writer_loop, name=f"relevo-{peer_id}")
+        self.writer.daemon = True
+        set_nodelay(sock)
+
+    def start(self):
+        self.writer.start()
+
+    def send_events(self, events):
+        if self.closed or not events:
+            return
+        self.pending.extend(events)
+        self.wakeup.set()
+
+    def encode_batches(self, events):
+        """Agrupa los eventos en tramas de relevo por debajo de MAX_FRAME"""
+        frames = []
+        batch = []
+        size = 0
+        for event in events:
+            event_size = len(encode_frame(RELAY, eventos=[event]))
+            if batch and size + event_size > MAX_FRAME // 2:
+                frames.append(encode_frame(RELAY, eventos=batch))
+                batch, size = [], 0
+            batch.append(event)
+            size += event_size
+        if batch:
+            frames.append(encode_frame(RELAY, eventos=batch))
+        return frames
+
+    def writer_loop(self):
+        while not self.closed:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            # Ventana de agrupación: lo que llegue mientras tanto sale en la misma trama
+            time.sleep(self.batch_window)
+            events = []
+            while self.pending:
+                events.append(self.pending.popleft())
+            if not events:
+                continue
+            frames = self.encode_batches(events)
+            try:
+                self.sock.sendall(b"".join(frames))
+                self.frames += len(frames)
+                self.events += len(events)
+            except OSError:
+                self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+class Federation:
+    """Une este servidor con otros para repartir mensajes y presencia entre todos.
+
+    Cada evento lleva un id único (nodo de origen, arranque y contador) y se reenvía a
+    todos los enlaces salvo aquel por el que llegó; los ids ya vistos se
+    descartan, así que sirve para cadenas, estrellas y mallas sin bucles.
+    Los usuarios de otros nodos se presentan como "alias@nodo".
+    """
+
+    # Ids de eventos recordados para descartar duplicados
+    SEEN_EVENTS = 50000
+    RECONNECT_MIN = 1.0
+    RECONNECT_MAX = 30.0
+
+    def __init__(self, node_id, secret, on_message, on_presence, local_members, log=None,
+                 batch_window=0.01):
+        self.node_id = node_id
+        self.secret = secret
+        self.on_message = on_message  # (origen, alias, texto, sala)
+        self.on_presence = on_presence  # (origen, sala, altas, bajas)
+        self.local_members = local_members  # () -> {sala: [alias, ...]} de este nodo
+        self.log = log or (lambda message, type: None)
+        self.batch_window = batch_window
+        self.links = []
+        self.lock = threading.Lock()
+        self.seen = OrderedDict()
+        self.remote = {}  # origen -> {sala: set(alias)}
+        self.routes = {}  # origen -> enlace por el que se conoció
+        self.state_lock = threading.RLock()  # remote y routes, compartidos por los hilos de enlace
+        # El contador vuelve a 1 en cada arranque: la marca de arranque evita que los
+        # demás nodos tomen por repetidos los eventos de un nodo reiniciado
+        self.epoch = uuid.uuid4().hex[:8]
+        self.counter = itertools.count(1)
+        self.running = False
+
+    # --- Eventos locales -------------------------------------------------
+
+    def next_id(self):
+        return f"{self.node_id}:{self.epoch}:{next(self.counter)}"
+
+    def publish(self, event):
+        """Envía un evento de este nodo a todos los enlaces"""
+        event["id"] = self.next_id()
+        event["nodo"] = self.node_id
+        self.first_seen(event["id"])
+        with self.lock:
+            links = list(self.links)
+        for link in links:
+            link.send_events([event])
+
+    def publish_message(self, alias, text, room):
+        self.publish({"e": EVENT_MESSAGE, "de": alias, "texto": text, "sala": room})
+
+    def publish_presence(self, room, added, removed):
+        self.publish({"e": EVENT_PRESENCE, "sala": room, "altas": list(added), "bajas": list(removed)})
+
+    # --- Eventos remotos -------------------------------------------------
+
+    def first_seen(self, event_id):
+        """Registra un id de evento; devuelve False si ya se había visto"""
+        with self.lock:
+            if event_id in self.seen:
+                return False
+            self.seen[event_id] = True
+            if len(self.seen) > self.SEEN_EVENTS:
+                self.seen.popitem(last=False)
+            return True
+
+    def receive(self, link, events):
+        """Aplica los eventos nuevos de una trama de relevo y los reenvía al resto de enlaces"""
+        forward = []
+        for event in events:
+            if not isinstance(event, dict) or not self.first_seen(str(event.get("id"))):
+                continue
+            origin = str(event.get("nodo", link.peer_id))
+            if origin == self.node_id:
+                continue
+            if event.get("e") == EVENT_MESSAGE:
+                self.on_message(origin, str(event.get("de", "")), str(event.get("texto", "")),
+                                str(event.get("sala", "")))
+            elif event.get("e") == EVENT_PRESENCE:
+                with self.state_lock:
+                    self.routes[origin] = link
+                    self.apply_presence(origin, event)
+            forward.append(event)
+        with self.lock:
+            others = [other for other in self.links if other is not link]
+        for other in others:
+            other.send_events(forward)
+
+    def apply_presence(self, origin, event):
+        """Actualiza los usuarios de un nodo remoto y avisa de los cambios netos"""
+        rooms = self.remote.setdefault(origin, {})
+        if event.get("completo"):
+            # Instantánea de todas las salas del nodo: sustituye a lo conocido
+            snapshot = {str(room): set(map(str, users)) for room, users in dict(event.get("salas", {})).items()}
+            for room in set(rooms) | set(snapshot):
+                before = rooms.get(room, set())
+                after = snapshot.get(room, set())
+                if before != after:
+                    self.on_presence(origin, room, sorted(after - before), sorted(before - after))
+            self.remote[origin] = snapshot
+            return
+        room = str(event.get("sala", ""))
+        members = rooms.setdefault(room, set())
+        added = [str(user) for user in event.get("altas", []) if str(user) not in members]
+        removed = [str(user) for user in event.get("bajas", []) if str(user) in members]
+        members.update(added)
+        members.difference_update(removed)
+        if added or removed:
+            self.on_presence(origin, room, added, removed)
+
+    def snapshot_events(self):
+        """Instantáneas de presencia de este nodo y de los remotos conocidos, para un enlace nuevo"""
+        snapshots = {self.node_id: self.local_members()}
+        with self.state_lock:
+            for origin, rooms in self.remote.items():
+                snapshots[origin] = {room: sorted(users) for room, users in rooms.items() if users}
+        return [{"e": EVENT_PRESENCE, "id": self.next_id(), "nodo": origin, "completo": True, "salas": rooms}
+                for origin, rooms in snapshots.items()]
+
+    # --- Enlaces ---------------------------------------------------------
+
+    def run_link(self, link, reader, pending):
+        """Atiende un enlace establecido hasta que se cierre (bloquea el hilo que llama)"""
+        with self.lock:
+            self.links.append(link)
+        link.start()
+        link.send_events(self.snapshot_events())
+        self.log(f"[FEDERACIÓN] Enlazado con el nodo {link.peer_id}", "success")
+        try:
+            while self.running:
+                frame = read_frame(link.sock, reader, pending)
+                if frame is None:
+                    break
+                if frame["tipo"] == RELAY and isinstance(frame.get("eventos"), list):
+                    self.receive(link, frame["eventos"])
+        except Exception:
+            pass
+        finally:
+            with self.lock:
+                if link in self.links:
+                    self.links.remove(link)
+            link.close()
+            self.drop_routes(link)
+            if self.running:
+                self.log(f"[FEDERACIÓN] Enlace con el nodo {link.peer_id} perdido", "warning")
+
+    def drop_routes(self, link):
+        """Retira los usuarios de los nodos que se conocían a través de un enlace caído"""
+        with self.state_lock:
+            for origin in [origin for origin, route in self.routes.items() if route is link]:
+                del self.routes[origin]
+                for room, users in self.remote.pop(origin, {}).items():
+                    if users:
+                        self.on_presence(origin, room, [], sorted(users))
+
+    def proof(self, challenge, node_id):
+        """HMAC-SHA256 de la clave compartida sobre el reto y el nodo que se presenta"""
+        return hmac.new(self.secret.encode("utf-8"), (challenge + node_id).encode("utf-8"),
+                        hashlib.sha256).hexdigest()
+
+    def accept(self, sock, hello, reader, pending):
+        """Atiende un nodo que se presentó en el puerto del chat; devuelve False si se rechaza.
+
+        La clave no viaja por la red: el nodo demuestra conocerla respondiendo a un
+        reto aleatorio de un solo uso con proof(reto, su id).
+        """
+        peer_id = str(hello.get("id", ""))
+        if not self.running or not peer_id or peer_id == self.node_id:
+            return False
+        challenge = secrets.token_hex(16)
+        try:
+            sock.sendall(encode_frame(NODE, reto=challenge))
+            # Aún con el tiempo máximo del saludo: un nodo mudo no retiene el hilo
+            frame = read_frame(sock, reader, pending)
+        except (OSError, ValueError):
+            return False
+        if (frame is None or frame["tipo"] != NODE
+                or not hmac.compare_digest(str(frame.get("prueba", "")), self.proof(challenge, peer_id))):
+            return False
+        sock.settimeout(None)
+        sock.sendall(encode_frame(NODE, id=self.node_id))
+        self.run_link(PeerLink(sock, peer_id, self.batch_window), reader, pending)
+        return True
+
+    def connect_loop(self, host, port):
+        """Mantiene un enlace saliente con un nodo, reconectando con espera creciente"""
+        delay = self.RECONNECT_MIN
+        while self.running:
+            try:
+                sock = socket.create_connection((host, port), timeout=10)
+                reader = FrameReader()
+                pending = []
+                # El otro nodo saluda como a un cliente; se responde con la identidad de nodo
+                # y después con la prueba de la clave para su reto
+                frame = read_frame(sock, reader, pending)
+                if frame is None or frame["tipo"] != ALIAS:
+                    raise ConnectionError("el nodo no aceptó la conexión")
+                sock.sendall(encode_frame(NODE, id=self.node_id))
+                frame = read_frame(sock, reader, pending)
+                if frame is None or frame["tipo"] != NODE or not frame.get("reto"):
+                    raise ConnectionError("el nodo no aceptó la conexión")
+                sock.sendall(encode_frame(NODE, prueba=self.proof(str(frame["reto"]), self.node_id)))
+                frame = read_frame(sock, reader, pending)
+                if frame is None or frame["tipo"] != NODE:
+                    raise ConnectionError("clave de federación rechazada")
+                sock.settimeout(None)
+                delay = self.RECONNECT_MIN
+                self.run_link(PeerLink(sock, str(frame.get("id", f"{host}:{port}")), self.batch_window),
+                              reader, pending)
+            except (OSError, ValueError) as e:
+                if self.running:
+                    self.log(f"[FEDERACIÓN] No se pudo enlazar con {host}:{port}: {e}", "warning")
+            # Espera antes de reintentar, atenta a la parada
+            deadline = time.monotonic() + delay
+            while self.running and time.monotonic() < deadline:
+                time.sleep(0.2)
+            delay = min(delay * 2, self.RECONNECT_MAX)
+
+    def start(self, peers):
+        """Arranca los enlaces salientes hacia los nodos indicados ("host:puerto")"""
+        self.running = True
+        for spec in peers:
+            host, port = parse_peer(spec)
+            thread = threading.Thread(target=self.connect_loop, args=(host, port), name=f"federacion-{spec}")
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            links = list(self.links)
+        for link in links:
+            link.close()
@@ -0,0 +1,104 @@
+# Historial de mensajes del servidor: registro en disco con índice de desplazamientos (sin Qt)
+import json
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from itertools import islice
+
+DEFAULT_PAGE = 50
+MAX_PAGE = 200
+
+class MessageStore:
+    """Registro de mensajes en un fichero JSON-lines con numeración global.
+
+    El índice en memoria guarda el desplazamiento de cada línea en el fichero
+    (8 bytes por mensaje), de modo que el mensaje número n está en offsets[n - 1]
+    y una página "anteriores a n" es una única lectura contigua. Los últimos
+    mensajes se sirven además desde memoria, que es lo que piden los clientes al
+    entrar en la sala.
+    """
+
+    def __init__(self, path, recent=500):
+        self.path = path
+        self.offsets = array("Q")
+        self.recent = deque(maxlen=recent)  # últimos registros, del más antiguo al más reciente
+        self._lock = threading.Lock()
+        self._load()
+        self._writer = open(path, "ab")
+        self._reader = open(path, "rb")
+        count = len(self.offsets)
+        self.recent.extend(self._read(max(count - self.recent.maxlen, 0), count))
+
+    def _load(self):
+        """Reconstruye el índice recorriendo el fichero (y descarta una última línea incompleta)"""
+        if not os.path.exists(self.path):
+            return
+        position = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                self.offsets.append(position)
+                position += len(line)
+        if position != os.path.getsize(self.path):
+            # Escritura interrumpida: el último registro no llegó a completarse
+            with open(self.path, "r+b") as file:
+                file.truncate(position)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, alias, text, room, attachment=None):
+        """Guarda un mensaje (con la referencia de un adjunto si la hay) y devuelve su registro"""
+        with self._lock:
+            record = {"num": len(self.offsets) + 1, "de": alias, "texto": text,
+                      "sala": room, "hora": round(time.time(), 3)}
+            if attachment:
+                record["adjunto"] = attachment
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode("utf-8") + b"\n"
+            self.offsets.append(self._writer.tell())
+            self._writer.write(line)
+            self._writer.flush()
+            self.recent.append(record)
+            return record
+
+    def _read(self, start, end):
+        """Lee los registros de las posiciones [start, end) del índice"""
+        if start >= end:
+            return []
+        self._reader.seek(self.offsets[start])
+        size = (self.offsets[end] if end < len(self.offsets) else os.path.getsize(self.path)) - self.offsets[start]
+        return [json.loads(line) for line in self._reader.read(size).splitlines()]
+
+    def page(self, before=None, limit=DEFAULT_PAGE, max_bytes=None, after=0):
+        """Mensajes anteriores al número 'before' (los últimos si es None), del más antiguo al más reciente.
+
+        Devuelve (registros, quedan_más). Con 'after' solo cuentan los posteriores a ese
+        número (lo que le falta a un cliente que ya tiene hasta 'after'), y quedan_más
+        indica que hubo que dejar fuera algunos de ellos. Con max_bytes la página se
+        recorta por el lado más antiguo para que quepa en una trama.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE))
+        with self._lock:
+            count = len(self.offsets)
+            end = count if before is None else max(0, min(int(before) - 1, count))
+            after = max(0, min(int(after), end))
+            start = max(end - limit, after)
+            if max_bytes:
+                # El tamaño de cada línea se conoce por el índice, sin leer el fichero
+                limit_end = self.offsets[end] if end < count else self._writer.tell()
+                while start < end - 1 and limit_end - self.offsets[start] > max_bytes:
+                    start += 1
+            first_recent = count - len(self.recent)
+            if start >= first_recent:
+                records = list(islice(self.recent, start - first_recent, end - first_recent))
+            else:
+                records = self._read(start, end)
+            return records, start > after
+
+    def close(self):
+        with self._lock:
+            self._writer.close()
+            self._reader.close()
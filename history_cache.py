@@ -0,0 +1,93 @@
+# Caché local del historial en el cliente: últimos mensajes por servidor y sala en SQLite (sin Qt)
+import json
+import os
+import sqlite3
+import threading
+
+HISTORY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".chatapp", "historial.db")
+# Mensajes que se conservan por servidor y sala (los más recientes)
+MAX_CACHED = 5000
+# Mensajes guardados entre dos recortes de la caché
+PRUNE_EVERY = 500
+
+class HistoryCache:
+    """Historial de una sala de un servidor guardado en el propio equipo.
+
+    Al abrir el cliente se pinta al instante la última página guardada y al
+    servidor solo se le pide lo posterior al mensaje más reciente que hay aquí,
+    así que ni el arranque ni la reconexión dependen de cuánto historial exista.
+    Escribe el hilo de red y lee la interfaz: una sola conexión con cerrojo.
+    Los errores de SQLite no se propagan: sin caché el cliente sigue funcionando.
+    """
+
+    def __init__(self, server, room, path=HISTORY_CACHE_FILE, limit=MAX_CACHED):
+        self.server = server
+        self.room = room
+        self.path = path
+        self.limit = limit
+        self.added = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # WAL: las escrituras del hilo de red no bloquean la lectura inicial
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS mensajes (servidor TEXT NOT NULL, sala TEXT NOT NULL, "
+                            "num INTEGER NOT NULL, registro TEXT NOT NULL, "
+                            "PRIMARY KEY (servidor, sala, num)) WITHOUT ROWID")
+
+    def add(self, records):
+        """Guarda registros del historial (los que ya estaban se sustituyen); devuelve False si falló"""
+        rows = [(self.server, self.room, record["num"],
+                 json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                for record in records if isinstance(record.get("num"), int)]
+        if not rows:
+            return True
+        with self._lock:
+            try:
+                with self.db:
+                    self.db.executemany("INSERT OR REPLACE INTO mensajes VALUES (?, ?, ?, ?)", rows)
+                    self.added += len(rows)
+                    if self.added >= PRUNE_EVERY:
+                        self.added = 0
+                        self.prune()
+                return True
+            except sqlite3.Error:
+                return False
+
+    def prune(self):
+        """Borra lo que exceda de los 'limit' mensajes más recientes (con el cerrojo tomado)"""
+        self.db.execute("DELETE FROM mensajes WHERE servidor = ? AND sala = ? AND num <= "
+                        "(SELECT num FROM mensajes WHERE servidor = ? AND sala = ? ORDER BY num DESC "
+                        "LIMIT 1 OFFSET ?)", (self.server, self.room, self.server, self.room, self.limit))
+
+    def latest(self, limit):
+        """Últimos 'limit' registros, del más antiguo al más reciente"""
+        with self._lock:
+            try:
+                rows = self.db.execute("SELECT registro FROM mensajes WHERE servidor = ? AND sala = ? "
+                                       "ORDER BY num DESC LIMIT ?", (self.server, self.room, limit)).fetchall()
+            except sqlite3.Error:
+                return []
+        records = []
+        for (text,) in reversed(rows):
+            try:
+                records.append(json.loads(text))
+            except ValueError:
+                pass
+        return records
+
+    def newest(self):
+        """Número del mensaje más reciente guardado (0 si no hay ninguno)"""
+        with self._lock:
+            try:
+                row = self.db.execute("SELECT MAX(num) FROM mensajes WHERE servidor = ? AND sala = ?",
+                                      (self.server, self.room)).fetchone()
+            except sqlite3.Error:
+                return 0
+        return row[0] or 0
+
+    def close(self):
+        with self._lock:
+            self.db.close()
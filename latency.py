@@ -0,0 +1,119 @@
+# Trazas de latencia de extremo a extremo e histogramas agregables (sin Qt)
+import bisect
+import threading
+
+# Límites superiores de los cubos en milisegundos (progresión 1-2-5); el último es "más"
+BUCKETS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+# Etapas de un mensaje trazado:
+#   servidor: de la recepción en handle_client al inicio del reparto
+#   difusion: lo que tarda el bucle de reparto en encolar la trama en todas las sesiones
+#   red:      del reparto a la recepción en el cliente (colas de salida, socket y red)
+#   cliente:  de la recepción en el cliente al final del pintado en update_chat
+#   total:    de la recepción en el servidor al pintado en el cliente
+# "red" y "total" comparan relojes de dos máquinas: solo son exactas si están sincronizados
+# (NTP); los valores negativos por desfase se cuentan como 0.
+STAGES = ("servidor", "difusion", "red", "cliente", "total")
+CLIENT_STAGES = ("red", "cliente", "total")
+# Máximo de muestras por cubo en un informe ajeno: más es un informe falso o corrupto
+MAX_MERGE_COUNT = 10**6
+
+class Histogram:
+    """Histograma de latencias con cubos fijos: se puede sumar entre procesos"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS, max(ms, 0))] += 1
+
+    def merge(self, counts):
+        """Suma los contadores de otro histograma (por ejemplo, el informe de un cliente)"""
+        if len(counts) != len(self.counts):
+            raise ValueError("Histograma con cubos distintos")
+        # Los contadores vienen de la red: JSON admite Infinity, NaN, negativos y enteros
+        # enormes; la comparación los rechaza todos sin convertir a float (NaN nunca cumple)
+        values = []
+        for value in counts:
+            if (isinstance(value, bool) or not isinstance(value, (int, float))
+                    or not 0 <= value <= MAX_MERGE_COUNT):
+                raise ValueError("Contador no válido")
+            values.append(int(value))
+        for index, value in enumerate(values):
+            self.counts[index] += value
+
+    def percentile(self, fraction):
+        """Límite superior del cubo que contiene el percentil pedido (None si está vacío)"""
+        total = self.count
+        if not total:
+            return None
+        target = fraction * total
+        seen = 0
+        for index, value in enumerate(self.counts):
+            seen += value
+            if seen >= target and value:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return float("inf")
+
+def format_ms(value):
+    if value is None:
+        return "-"
+    if value == float("inf"):
+        return f">{BUCKETS[-1]:g}"
+    return f"≤{value:g}"
+
+class LatencyTracker:
+    """Histogramas por etapa, con informes incrementales para enviar al servidor"""
+
+    def __init__(self, stages=STAGES):
+        self.histograms = {stage: Histogram() for stage in stages}
+        self.reported = {stage: [0] * (len(BUCKETS) + 1) for stage in stages}
+        self._lock = threading.Lock()
+
+    def add(self, stage, ms):
+        with self._lock:
+            self.histograms[stage].add(ms)
+
+    def record(self, trace, received, rendered):
+        """Completa una traza del servidor [ingesta, reparto] con los instantes del cliente"""
+        ingest, fanout = trace[0], trace[1]
+        with self._lock:
+            self.histograms["red"].add((received - fanout) * 1000)
+            self.histograms["cliente"].add((rendered - received) * 1000)
+            self.histograms["total"].add((rendered - ingest) * 1000)
+
+    def merge(self, stages, allowed=CLIENT_STAGES):
+        """Añade un informe {etapa: contadores}; ignora etapas no permitidas o mal formadas"""
+        with self._lock:
+            for stage, counts in stages.items():
+                if stage in allowed and stage in self.histograms:
+                    try:
+                        self.histograms[stage].merge(counts)
+                    except (ValueError, TypeError, OverflowError):
+                        pass
+
+    def report(self):
+        """Contadores acumulados desde el último informe (vacío si no hay muestras nuevas)"""
+        with self._lock:
+            delta = {}
+            for stage, histogram in self.histograms.items():
+                counts = [now - before for now, before in zip(histogram.counts, self.reported[stage])]
+                if any(counts):
+                    delta[stage] = counts
+                self.reported[stage] = list(histogram.counts)
+            return delta
+
+    def summary(self, stages=None):
+        """Texto breve con p50/p99 por etapa, para barras de estado y registros"""
+        with self._lock:
+            parts = []
+            for stage in stages or self.histograms:
+                histogram = self.histograms[stage]
+                if histogram.count:
+                    parts.append(f"{stage} p50 {format_ms(histogram.percentile(0.5))} "
+                                 f"p99 {format_ms(histogram.percentile(0.99))} ms")
+            return " · ".join(parts)
@@ -0,0 +1,76 @@
+# Agrupación de notificaciones de escritorio del cliente (sin Qt)
+
+# Tiempo que se esperan más mensajes antes de avisar de una ráfaga (segundos)
+COALESCE_WINDOW = 2.0
+# Separación mínima entre dos notificaciones (segundos)
+MIN_INTERVAL = 10.0
+# Longitud máxima del texto de un mensaje dentro de una notificación
+PREVIEW_LENGTH = 100
+
+class NotificationAggregator:
+    """Acumula los mensajes llegados con la ventana inactiva y los resume en una notificación.
+
+    El primer mensaje abre una ventana de COALESCE_WINDOW segundos; lo que llegue
+    mientras tanto se suma al mismo aviso. Entre dos avisos pasan al menos
+    MIN_INTERVAL segundos: lo que llega antes espera y se resume en el siguiente.
+    """
+
+    def __init__(self, window=COALESCE_WINDOW, min_interval=MIN_INTERVAL):
+        self.window = window
+        self.min_interval = min_interval
+        self.senders = {}  # remitente -> mensajes pendientes (en orden de llegada)
+        self.count = 0
+        self.last_text = ""
+        self.first = None  # instante del primer mensaje pendiente
+        self.last_shown = None  # instante de la última notificación
+
+    def add(self, sender, text, now):
+        """Registra un mensaje; devuelve los segundos que faltan para poder avisar"""
+        if self.first is None:
+            self.first = now
+        self.senders[sender] = self.senders.get(sender, 0) + 1
+        self.count += 1
+        self.last_text = text
+        return self.delay(now)
+
+    def delay(self, now):
+        """Segundos hasta que la notificación pendiente se puede mostrar (None si no hay ninguna)"""
+        if self.first is None:
+            return None
+        due = self.first + self.window
+        if self.last_shown is not None:
+            due = max(due, self.last_shown + self.min_interval)
+        return max(due - now, 0)
+
+    def flush(self, now):
+        """Devuelve (título, texto) si toca avisar y vacía lo pendiente; si no, None"""
+        delay = self.delay(now)
+        if delay is None or delay > 0:
+            return None
+        summary = self.summary()
+        self.clear()
+        self.last_shown = now
+        return summary
+
+    def summary(self):
+        if self.count == 1:
+            sender = next(iter(self.senders))
+            return f"Nuevo mensaje de {sender}", self.preview(self.last_text)
+        if len(self.senders) == 1:
+            sender = next(iter(self.senders))
+            return f"{self.count} mensajes nuevos de {sender}", self.preview(self.last_text)
+        names = list(self.senders)
+        listed = ", ".join(names[:3])
+        if len(names) > 3:
+            listed += f" y {len(names) - 3} más"
+        return f"{self.count} mensajes nuevos de {len(names)} usuarios", listed
+
+    def preview(self, text):
+        return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1] + "…"
+
+    def clear(self):
+        """Descarta lo pendiente (por ejemplo, cuando el usuario vuelve a la ventana)"""
+        self.senders.clear()
+        self.count = 0
+        self.last_text = ""
+        self.first = None
@@ -0,0 +1,69 @@
+# Bandeja de salida persistente del cliente: mensajes pendientes de confirmación (sin Qt)
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+OUTBOX_DIR = os.path.join(os.path.expanduser("~"), ".chatapp", "outbox")
+
+def outbox_path(host, port, username):
+    """Fichero de la bandeja de salida de un usuario en un servidor"""
+    name = re.sub(r"[^\w.-]", "_", f"{host}_{port}_{username}")
+    return os.path.join(OUTBOX_DIR, f"{name}.json")
+
+class Outbox:
+    """Mensajes enviados o por enviar que el servidor aún no ha confirmado.
+
+    Cada mensaje lleva una clave de idempotencia: si la conexión cae después de
+    que el servidor lo recibiera pero antes de la confirmación, el reenvío al
+    reconectar no lo duplica. Se guarda en disco en cada cambio, de modo que lo
+    escrito sin conexión sobrevive también a cerrar el cliente.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = []
+        try:
+            with open(path, encoding="utf-8") as file:
+                self._entries = [entry for entry in json.load(file)
+                                 if isinstance(entry, dict) and "id" in entry and "texto" in entry]
+        except (OSError, ValueError):
+            pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self):
+        """Escribe la bandeja de forma atómica (fichero temporal + renombrado)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self._entries, file, ensure_ascii=False)
+        os.replace(temporary, self.path)
+
+    def add(self, text):
+        """Añade un mensaje y devuelve su entrada {"id", "texto", "hora"}"""
+        entry = {"id": uuid.uuid4().hex, "texto": text, "hora": time.time()}
+        with self._lock:
+            self._entries.append(entry)
+            self.save()
+        return entry
+
+    def pending(self):
+        """Copia de los mensajes sin confirmar, en el orden en que se escribieron"""
+        with self._lock:
+            return list(self._entries)
+
+    def ack(self, ids):
+        """Retira los mensajes confirmados por el servidor; devuelve cuántos se retiraron"""
+        ids = set(ids)
+        with self._lock:
+            before = len(self._entries)
+            self._entries = [entry for entry in self._entries if entry["id"] not in ids]
+            removed = before - len(self._entries)
+            if removed:
+                self.save()
+            return removed
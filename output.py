@@ -0,0 +1,168 @@
+# Planificador de salida por socket: agrupa tramas en micro-ticks (sin Qt)
+import socket
+import threading
+import time
+from collections import deque
+
+# Valores por defecto del micro-tick y de los lotes
+DEFAULT_TICK = 0.001  # segundos que se esperan a más tramas tras la primera
+MAX_BATCH = 256 * 1024  # bytes por escritura
+CORK_THRESHOLD = 64 * 1024  # a partir de aquí una ráfaga se envía con TCP_CORK
+
+def set_nodelay(sock):
+    """Desactiva Nagle: la latencia la controla el micro-tick, no el kernel"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
+
+def set_cork(sock, enabled):
+    """Activa o desactiva TCP_CORK (solo Linux; en otros sistemas no hace nada)"""
+    if hasattr(socket, "TCP_CORK"):
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, 1 if enabled else 0)
+        except OSError:
+            pass
+
+class OutputScheduler:
+    """Cola de salida de un socket con escritura agrupada.
+
+    La primera trama despierta al hilo escritor, que espera un micro-tick a que
+    lleguen más y las envía todas en una sola escritura. Si la cola acumula una
+    ráfaga grande (por ejemplo al reenviar historial), el socket se "tapona"
+    con TCP_CORK hasta vaciarla para que el kernel emita segmentos completos.
+    Con idle_timeout el hilo escritor termina tras ese tiempo sin nada que
+    enviar y se vuelve a crear con la siguiente trama.
+    """
+
+    __slots__ = ("sock", "tick", "max_pending", "on_error", "idle_timeout", "pending", "wakeup",
+                 "closed", "writes", "frames", "sent", "writer", "_idle", "_lock")
+
+    def __init__(self, sock, tick=DEFAULT_TICK, max_pending=1000, on_error=None, idle_timeout=None):
+        self.sock = sock
+        self.tick = tick
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self.idle_timeout = idle_timeout
+        # deque.append es atómico: encolar no toma ningún cerrojo salvo para despertar
+        self.pending = deque()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.writes = 0  # escrituras al socket (para métricas y benchmarks)
+        self.frames = 0
+        self.sent = 0  # bytes escritos
+        self._idle = False
+        self._lock = threading.Lock()
+        self.writer = self.new_writer()
+        set_nodelay(sock)
+
+    def new_writer(self):
+        writer = threading.Thread(target=self.writer_loop)
+        writer.daemon = True
+        return writer
+
+    def start(self):
+        """Arranca el hilo escritor"""
+        self.writer.start()
+
+    def put(self, data):
+        """Añade un elemento a la cola y despierta al escritor si está dormido"""
+        self.pending.append(data)
+        if self._idle:
+            self.resume()
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+
+    def resume(self):
+        """Vuelve a crear el hilo escritor si terminó por inactividad"""
+        with self._lock:
+            if self._idle:
+                self._idle = False
+                self.writer = self.new_writer()
+                self.writer.start()
+
+    def retire(self):
+        """Decide si el hilo escritor puede terminar: solo si la cola sigue vacía"""
+        with self._lock:
+            # Se marca antes de mirar la cola: put() ve la marca o el escritor ve la trama
+            self._idle = True
+            if self.pending:
+                self._idle = False
+                return False
+            return True
+
+    def send(self, data):
+        """Encola una trama; devuelve False si el planificador está cerrado o saturado"""
+        if self.closed:
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.fail()
+            return False
+        self.put(data)
+        return True
+
+    def send_many(self, frames):
+        """Encola varias tramas como un único bloque (ráfagas como el historial)"""
+        return self.send(b"".join(frames))
+
+    def collect(self):
+        """Saca de la cola hasta MAX_BATCH bytes; el segundo valor indica el marcador de fin (None)"""
+        batch = []
+        size = 0
+        while size < MAX_BATCH and self.pending:
+            data = self.pending.popleft()
+            if data is None:
+                return batch, True
+            batch.append(data)
+            size += len(data)
+        return batch, False
+
+    def writer_loop(self):
+        """Envía las tramas encoladas en lotes hasta recibir el marcador de fin (None)"""
+        corked = False
+        finished = False
+        while not finished:
+            if not self.wakeup.wait(self.idle_timeout) and self.retire():
+                return
+            self.wakeup.clear()
+            # Micro-tick: dar tiempo a que lleguen más tramas antes de escribir
+            if self.tick > 0:
+                time.sleep(self.tick)
+            while self.pending and not finished:
+                batch, finished = self.collect()
+                if not batch:
+                    continue
+                payload = b"".join(batch)
+                try:
+                    # Ráfaga: taponar mientras quede cola para no emitir segmentos pequeños
+                    burst = len(payload) >= CORK_THRESHOLD and bool(self.pending)
+                    if burst and not corked:
+                        set_cork(self.sock, True)
+                        corked = True
+                    self.sock.sendall(payload)
+                    self.writes += 1
+                    self.frames += len(batch)
+                    self.sent += len(payload)
+                    if corked and (finished or not self.pending):
+                        set_cork(self.sock, False)
+                        corked = False
+                except OSError:
+                    self.fail()
+                    return
+
+    def drain(self, timeout):
+        """Envía lo pendiente y espera al hilo escritor como mucho 'timeout' segundos"""
+        self.put(None)
+        writer = self.writer
+        if writer.is_alive():
+            writer.join(max(timeout, 0))
+        return not writer.is_alive()
+
+    def fail(self):
+        """Marca el planificador como cerrado y avisa al propietario"""
+        if self.closed:
+            return
+        self.closed = True
+        self.put(None)
+        if self.on_error:
+            self.on_error()
@@ -0,0 +1,182 @@
+# Cadena de etapas que procesa cada mensaje de chat en el servidor (sin Qt)
+import threading
+import time
+from latency import Histogram, format_ms
+from protocol import encode_frame, SYSTEM, MAX_FRAME
+
+# Longitud máxima de un mensaje en caracteres (la trama completa debe caber en MAX_FRAME)
+MAX_TEXT = MAX_FRAME // 4
+# Segundos de mensajes que un usuario puede enviar de golpe por encima del ritmo permitido
+BURST_SECONDS = 5
+# Usuarios a partir de los cuales se olvidan los cubos de fichas ya llenos
+MAX_BUCKETS = 10000
+
+class Message:
+    """Mensaje de chat en tránsito por la cadena"""
+
+    __slots__ = ("session", "alias", "room", "text", "id", "ingest", "extra", "dropped")
+
+    def __init__(self, session, frame, ingest):
+        self.session = session
+        self.alias = session.alias
+        self.room = session.room
+        self.text = frame.get("texto", "")
+        self.id = str(frame["id"]) if "id" in frame else None  # clave de idempotencia
+        self.ingest = ingest  # instante de recepción (time.time) para las trazas
+        self.extra = {}  # campos añadidos a la trama repartida, como el número de historial
+        self.dropped = None  # etapa que detuvo el mensaje
+
+    def reply(self, text):
+        """Aviso del sistema solo para el remitente"""
+        self.session.send(encode_frame(SYSTEM, texto=text))
+
+class Stage:
+    """Etapa de la cadena: process() devuelve False para detener el mensaje.
+
+    Una etapa 'transient' detiene mensajes solo por ahora (como el límite de ritmo):
+    el servidor no los confirma y el cliente los conserva para reenviarlos.
+    """
+
+    name = "etapa"
+    transient = False
+
+    def process(self, message):
+        return True
+
+class Step(Stage):
+    """Etapa hecha con una función (message) -> False para detener"""
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def process(self, message):
+        return self.function(message)
+
+class Validate(Stage):
+    """Descarta mensajes vacíos y avisa al remitente de los demasiado largos"""
+
+    name = "validacion"
+
+    def __init__(self, max_length=MAX_TEXT):
+        self.max_length = max_length
+
+    def process(self, message):
+        if not isinstance(message.text, str):
+            message.text = str(message.text)
+        if not message.text.strip():
+            return False
+        if len(message.text) > self.max_length:
+            message.reply(f"Mensaje no enviado: supera los {self.max_length} caracteres")
+            return False
+        return True
+
+class RateLimit(Stage):
+    """Cubo de fichas por usuario: 'rate' mensajes por segundo con ráfagas de 'burst'"""
+
+    name = "limite"
+    transient = True
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate * BURST_SECONDS, 1)
+        self.buckets = {}  # alias -> [fichas, último instante]
+        self._lock = threading.Lock()
+
+    def process(self, message):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self.buckets.get(message.alias)
+            if bucket is None:
+                if len(self.buckets) >= MAX_BUCKETS:
+                    self.prune(now)
+                bucket = self.buckets[message.alias] = [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            allowed = bucket[0] >= 1
+            if allowed:
+                bucket[0] -= 1
+        if not allowed:
+            message.reply("Estás enviando mensajes demasiado rápido; el último no se ha enviado")
+        return allowed
+
+    def prune(self, now):
+        """Olvida los usuarios cuyo cubo ya se ha vuelto a llenar"""
+        self.buckets = {alias: bucket for alias, bucket in self.buckets.items()
+                        if bucket[0] + (now - bucket[1]) * self.rate < self.burst}
+
+class Pipeline:
+    """Etapas en orden, cada una con su histograma de tiempos.
+
+    Añadir o quitar etapas sustituye la lista entera, de modo que run() recorre
+    siempre una lista coherente sin tomar el cerrojo más que para anotar tiempos.
+    """
+
+    def __init__(self, stages=()):
+        self.stages = []
+        self.timings = {}  # etapa -> Histogram en milisegundos
+        self.totals = {}  # etapa -> [mensajes, segundos acumulados, mensajes detenidos]
+        self._lock = threading.Lock()
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage, before=None, after=None):
+        """Añade una etapa al final o junto a otra ya presente"""
+        with self._lock:
+            names = [current.name for current in self.stages]
+            if stage.name in names:
+                raise ValueError(f"ya hay una etapa {stage.name}")
+            anchor = before or after
+            if anchor and anchor not in names:
+                raise ValueError(f"no hay ninguna etapa {anchor}")
+            if before:
+                index = names.index(before)
+            elif after:
+                index = names.index(after) + 1
+            else:
+                index = len(names)
+            self.timings.setdefault(stage.name, Histogram())
+            self.totals.setdefault(stage.name, [0, 0.0, 0])
+            self.stages = self.stages[:index] + [stage] + self.stages[index:]
+
+    def remove(self, name):
+        """Quita una etapa; devuelve False si no estaba"""
+        with self._lock:
+            stages = [stage for stage in self.stages if stage.name != name]
+            removed = len(stages) != len(self.stages)
+            self.stages = stages
+            return removed
+
+    def get(self, name):
+        return next((stage for stage in self.stages if stage.name == name), None)
+
+    def run(self, message):
+        """Pasa el mensaje por las etapas; devuelve False si alguna lo detuvo"""
+        clock = time.perf_counter
+        for stage in self.stages:
+            start = clock()
+            passed = stage.process(message) is not False
+            elapsed = clock() - start
+            with self._lock:
+                self.timings[stage.name].add(elapsed * 1000)
+                totals = self.totals[stage.name]
+                totals[0] += 1
+                totals[1] += elapsed
+                if not passed:
+                    totals[2] += 1
+            if not passed:
+                message.dropped = stage.name
+                return False
+        return True
+
+    def summary(self):
+        """Una línea por etapa en orden: mensajes, tiempo medio, p99 y detenidos"""
+        with self._lock:
+            lines = []
+            for stage in self.stages:
+                count, seconds, dropped = self.totals[stage.name]
+                mean = f"{seconds / count * 1e6:.1f} µs" if count else "-"
+                p99 = format_ms(self.timings[stage.name].percentile(0.99))
+                lines.append(f"{stage.name:12} {count:>9} mensajes  media {mean:>10}  p99 {p99} ms"
+                             f"  detenidos {dropped}")
+            return "\n".join(lines)
@@ -0,0 +1,137 @@
+# Espera de lectura compartida por todas las sesiones del servidor (sin Qt)
+import selectors
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Tamaño de los búferes de recepción reutilizables
+RECV_BUFFER = 16 * 1024
+
+def raise_fd_limit(wanted):
+    """Sube el límite blando de descriptores abiertos hasta 'wanted' (o el máximo permitido)"""
+    try:
+        import resource  # solo existe en Unix
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY:
+        wanted = min(wanted, hard)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        except (ValueError, OSError):
+            pass
+
+class BufferPool:
+    """Búferes de recepción reutilizables: uno por lectura en curso, no uno por conexión"""
+
+    __slots__ = ("size", "limit", "_free", "_lock")
+
+    def __init__(self, size=RECV_BUFFER, limit=64):
+        self.size = size
+        self.limit = limit
+        self._free = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                return self._free.pop()
+        return bytearray(self.size)
+
+    def release(self, buffer):
+        with self._lock:
+            if len(self._free) < self.limit:
+                self._free.append(buffer)
+
+class SessionPoller:
+    """Un único hilo espera a que llegue algo por cualquiera de las sesiones.
+
+    Una sesión inactiva no ocupa ningún hilo: solo su registro en el selector.
+    Cuando un socket tiene datos se retira del selector y se entrega a un
+    conjunto fijo de hilos lectores; el manejador vuelve a registrarlo al
+    terminar, de modo que las tramas de una misma sesión se procesan siempre
+    en orden y por un solo hilo a la vez.
+    """
+
+    def __init__(self, handler, workers=8, timeout=0.5):
+        self.handler = handler  # (sesión) -> None, en un hilo lector
+        self.timeout = timeout
+        self.selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lector")
+        self.running = False
+        self.thread = threading.Thread(target=self.poll_loop, name="sesiones")
+        self.thread.daemon = True
+        # epoll y kqueue ven los registros hechos desde otros hilos mientras esperan;
+        # select y poll no, así que se les despierta con un par de sockets
+        self._waker = None
+        if type(self.selector).__name__ not in ("EpollSelector", "KqueueSelector"):
+            self._wake_reader, self._waker = socket.socketpair()
+            self._wake_reader.setblocking(False)
+            self._waker.setblocking(False)
+            self.selector.register(self._wake_reader, selectors.EVENT_READ, None)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def register(self, session):
+        """Espera datos de la sesión; devuelve False si está cerrada o no se pudo registrar"""
+        with self._lock:
+            if session.closed or not self.running:
+                return False
+            try:
+                self.selector.register(session.conn, selectors.EVENT_READ, session)
+            except (KeyError, ValueError, OSError):
+                # Descriptor ya cerrado o reutilizado por otro socket
+                return False
+        if self._waker:
+            try:
+                self._waker.send(b"\0")
+            except OSError:
+                pass
+        return True
+
+    def discard(self, session):
+        """Deja de esperar datos de la sesión y cierra su socket.
+
+        Ambas cosas con el cerrojo tomado: así register no puede volver a
+        registrar un socket que se está cerrando (ni su descriptor reutilizado).
+        """
+        with self._lock:
+            try:
+                self.selector.unregister(session.conn)
+            except (KeyError, ValueError):
+                pass
+            session.close()
+
+    def poll_loop(self):
+        while self.running:
+            for key, _ in self.selector.select(self.timeout):
+                if key.data is None:
+                    try:
+                        self._wake_reader.recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                with self._lock:
+                    try:
+                        self.selector.unregister(key.fileobj)
+                    except (KeyError, ValueError):
+                        continue
+                try:
+                    self.executor.submit(self.handler, key.data)
+                except RuntimeError:
+                    # Intérprete o conjunto de lectores ya cerrándose
+                    return
+
+    def stop(self):
+        self.running = False
+        self.thread.join(self.timeout * 2)
+        self.executor.shutdown(wait=False)
+        with self._lock:
+            self.selector.close()
+        if self._waker:
+            self._waker.close()
+            self._wake_reader.close()
@@ -0,0 +1,125 @@
+# Estado de presencia del servidor: indicadores de escritura (sin Qt)
+import threading
+import time
+
+class TypingTracker:
+    """Registra quién está escribiendo en cada sala, con antirrebote por usuario y expiración.
+
+    Los eventos no se reenvían al llegar: las salas con cambios se marcan como
+    pendientes y collect() devuelve, como mucho, un estado agregado por sala en
+    cada intervalo de envío.
+    """
+
+    def __init__(self, debounce=1.0, expiry=5.0, clock=time.monotonic):
+        self.debounce = debounce
+        self.expiry = expiry
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._typing = {}  # sala -> {alias: instante de expiración}
+        self._last_event = {}  # (sala, alias) -> instante del último evento aceptado
+        self._dirty = set()  # salas con cambios aún no enviados
+
+    def update(self, room, alias, typing=True):
+        """Registra un evento de escritura; devuelve False si se descarta por antirrebote"""
+        now = self.clock()
+        key = (room, alias)
+        with self._lock:
+            users = self._typing.setdefault(room, {})
+            if not typing:
+                self._last_event.pop(key, None)
+                if users.pop(alias, None) is not None:
+                    self._dirty.add(room)
+                return True
+            if alias in users and now - self._last_event.get(key, 0) < self.debounce:
+                return False
+            self._last_event[key] = now
+            if alias not in users:
+                self._dirty.add(room)
+            users[alias] = now + self.expiry
+            return True
+
+    def remove_user(self, alias):
+        """Elimina al usuario de todas las salas (por ejemplo al desconectarse)"""
+        for room in list(self._typing):
+            self.update(room, alias, False)
+
+    def collect(self):
+        """Expira usuarios inactivos y devuelve {sala: [alias, ...]} de las salas con cambios"""
+        now = self.clock()
+        with self._lock:
+            for room, users in self._typing.items():
+                expired = [alias for alias, deadline in users.items() if deadline <= now]
+                for alias in expired:
+                    del users[alias]
+                    self._last_event.pop((room, alias), None)
+                if expired:
+                    self._dirty.add(room)
+            changes = {room: sorted(self._typing.get(room, {})) for room in self._dirty}
+            self._dirty.clear()
+            for room in [room for room, users in self._typing.items() if not users]:
+                del self._typing[room]
+            return changes
+
+class Roster:
+    """Lista de usuarios por sala, publicada como instantánea más deltas agregados.
+
+    Las altas y bajas solo actualizan el estado actual; collect() compara ese
+    estado con el último publicado, de modo que una ráfaga de reconexiones
+    dentro de un intervalo se resume en un único delta por sala.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = {}  # sala -> {alias: número de sesiones}
+        self._published = {}  # sala -> set de alias ya enviados a los clientes
+        self._dirty = set()
+
+    def join(self, room, alias):
+        """Registra una sesión del usuario en la sala; devuelve True si es la primera"""
+        with self._lock:
+            members = self._members.setdefault(room, {})
+            members[alias] = members.get(alias, 0) + 1
+            self._dirty.add(room)
+            return members[alias] == 1
+
+    def leave(self, room, alias):
+        """Retira una sesión del usuario de la sala; devuelve True si era la última"""
+        with self._lock:
+            members = self._members.get(room, {})
+            if alias not in members:
+                return False
+            members[alias] -= 1
+            self._dirty.add(room)
+            if members[alias] <= 0:
+                del members[alias]
+                return True
+            return False
+
+    def snapshot(self, room):
+        """Devuelve la lista publicada de la sala; los cambios posteriores llegan como deltas"""
+        with self._lock:
+            return sorted(self._published.get(room, ()))
+
+    def members(self, room):
+        """Devuelve los usuarios conectados ahora mismo a la sala"""
+        with self._lock:
+            return sorted(self._members.get(room, {}))
+
+    def collect(self):
+        """Devuelve {sala: (altas, bajas)} con los cambios netos desde la última publicación"""
+        with self._lock:
+            changes = {}
+            for room in self._dirty:
+                current = set(self._members.get(room, {}))
+                published = self._published.get(room, set())
+                added = sorted(current - published)
+                removed = sorted(published - current)
+                if added or removed:
+                    changes[room] = (added, removed)
+                if current:
+                    self._published[room] = current
+                else:
+                    self._published.pop(room, None)
+                    self._members.pop(room, None)
+            self._dirty.clear()
+            return changes
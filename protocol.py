@@ -0,0 +1,73 @@
+# Protocolo de tramas compartido entre el cliente y el servidor (sin Qt)
+import json
+
+# Cada trama es un objeto JSON en una sola línea terminada en salto de línea
+SEPARADOR = b'\n'
+MAX_FRAME = 64 * 1024
+
+# Tipos de trama
+ALIAS = "alias"
+MESSAGE = "mensaje"
+SYSTEM = "sistema"
+QUIT = "salir"
+TYPING = "escribiendo"
+ROSTER = "usuarios"
+ROSTER_DELTA = "usuarios_delta"
+SHUTDOWN = "cierre"
+BUSY = "ocupado"
+LATENCY = "latencia"
+BATCH = "lote"
+ACK = "confirmacion"
+HISTORY = "historial"
+NODE = "nodo"
+RELAY = "relevo"
+ATTACH_OFFER = "adjunto_oferta"
+ATTACH = "adjunto"
+ATTACH_INDEX = "adjunto_indice"
+CHUNK = "trozo"
+CHUNK_REQUEST = "trozo_pedir"
+
+DEFAULT_ROOM = "general"
+
+class ProtocolError(Exception):
+    """Trama mal formada o demasiado grande"""
+
+def encode_frame(tipo, **datos):
+    """Codifica una trama como una línea JSON en UTF-8"""
+    datos["tipo"] = tipo
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + SEPARADOR
+
+class FrameReader:
+    """Acumula los bytes recibidos de un socket y devuelve las tramas completas"""
+
+    __slots__ = ("max_frame", "buffer")
+
+    def __init__(self, max_frame=MAX_FRAME):
+        self.max_frame = max_frame
+        self.buffer = b''
+
+    def feed(self, data):
+        """Añade datos recibidos y devuelve la lista de tramas decodificadas"""
+        self.buffer += data
+        frames = []
+        while True:
+            end = self.buffer.find(SEPARADOR)
+            if end < 0:
+                break
+            line = self.buffer[:end]
+            self.buffer = self.buffer[end + 1:]
+            if line:
+                frames.append(decode_frame(line))
+        if len(self.buffer) > self.max_frame:
+            raise ProtocolError("Trama demasiado grande")
+        return frames
+
+def decode_frame(line):
+    """Decodifica una línea JSON en un diccionario con al menos la clave 'tipo'"""
+    try:
+        frame = json.loads(line.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ProtocolError(f"Trama inválida: {e}")
+    if not isinstance(frame, dict) or "tipo" not in frame:
+        raise ProtocolError("Trama sin tipo")
+    return frame
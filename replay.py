@@ -0,0 +1,127 @@
+# Reproduce una captura de tráfico del servidor (server.py --capture) contra un servidor
+#
+# Uso: python replay.py captura.bin.gz [--host HOST] [--port PUERTO] [--speed 1|10|0]
+# Repite las conexiones, los datos enviados y las desconexiones con sus tiempos originales
+# divididos por --speed (0 = lo más rápido posible). Lo que responde el servidor se lee y
+# se descarta para que las colas de salida no saturen a las sesiones.
+import argparse
+import selectors
+import socket
+import time
+from capture import read_capture, CONNECT, DATA, DISCONNECT
+
+class Replayer:
+    """Reproduce los eventos de una captura por sockets reales"""
+
+    def __init__(self, host, port, speed=1.0):
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.selector = selectors.DefaultSelector()
+        self.sockets = {}  # id de conexión en la captura -> socket
+        self.stats = {"eventos": 0, "conexiones": 0, "enviados": 0, "recibidos": 0,
+                      "errores": 0, "retraso_max": 0.0}
+
+    def open(self, conn_id):
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=5)
+        except OSError:
+            self.stats["errores"] += 1
+            return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ, conn_id)
+        self.sockets[conn_id] = sock
+        self.stats["conexiones"] += 1
+
+    def close(self, conn_id):
+        sock = self.sockets.pop(conn_id, None)
+        if sock:
+            self.selector.unregister(sock)
+            sock.close()
+
+    def send(self, conn_id, data):
+        sock = self.sockets.get(conn_id)
+        if sock is None:
+            return
+        try:
+            sock.setblocking(True)
+            sock.sendall(data)
+            sock.setblocking(False)
+            self.stats["enviados"] += len(data)
+        except OSError:
+            # El servidor cerró la conexión (por ejemplo, sesión rechazada por sobrecarga)
+            self.stats["errores"] += 1
+            self.close(conn_id)
+
+    def poll(self, timeout):
+        """Lee y descarta lo que haya enviado el servidor, esperando como mucho 'timeout'"""
+        for key, _ in self.selector.select(timeout):
+            try:
+                data = key.fileobj.recv(1 << 16)
+            except BlockingIOError:
+                continue
+            except OSError:
+                data = b""
+            if data:
+                self.stats["recibidos"] += len(data)
+            else:
+                self.close(key.data)
+
+    def wait_until(self, deadline):
+        """Atiende las lecturas hasta la hora programada del siguiente evento"""
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            if self.sockets:
+                self.poll(remaining)
+            else:
+                time.sleep(remaining)
+
+    def run(self, path):
+        start = time.perf_counter()
+        last = 0.0
+        for kind, conn_id, elapsed, data in read_capture(path):
+            last = elapsed
+            if self.speed:
+                scheduled = start + elapsed / self.speed
+                self.wait_until(scheduled)
+                self.stats["retraso_max"] = max(self.stats["retraso_max"], time.perf_counter() - scheduled)
+            elif self.stats["eventos"] % 64 == 0 and self.sockets:
+                self.poll(0)
+            if kind == CONNECT:
+                self.open(conn_id)
+            elif kind == DATA:
+                self.send(conn_id, data)
+            elif kind == DISCONNECT:
+                self.close(conn_id)
+            self.stats["eventos"] += 1
+        wall = time.perf_counter() - start
+        # Conexiones que seguían abiertas al terminar la captura
+        self.poll(0)
+        for conn_id in list(self.sockets):
+            self.close(conn_id)
+        return last, wall
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce una captura de tráfico del servidor de chat")
+    parser.add_argument("capture", help="fichero generado con server.py --capture")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10000)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="factor de aceleración (1 = tiempo real, 10 = diez veces, 0 = sin esperas)")
+    args = parser.parse_args()
+
+    replayer = Replayer(args.host, args.port, args.speed)
+    captured, wall = replayer.run(args.capture)
+    stats = replayer.stats
+    print(f"{stats['eventos']} eventos, {stats['conexiones']} conexiones, {stats['errores']} errores")
+    print(f"Duración capturada {captured:.2f} s, reproducida en {wall:.2f} s "
+          f"(x{captured / wall if wall else 0:.1f}, {stats['eventos'] / wall if wall else 0:.0f} eventos/s)")
+    print(f"Enviados {stats['enviados']} bytes, recibidos {stats['recibidos']} bytes")
+    if args.speed:
+        print(f"Retraso máximo respecto al calendario: {stats['retraso_max'] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
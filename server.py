@@ -4,88 +4,780 @@ import sys
 import datetime
 import os
 import json
+import time
+import random
+import signal
+import argparse
+import select
+import ssl
+from collections import OrderedDict
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTextEdit, QPushButton, QVBoxLayout, 
                            QWidget, QLabel, QLineEdit, QHBoxLayout, QMessageBox, 
                            QTabWidget, QGroupBox, QGridLayout, QComboBox, QCheckBox,
-                           QSystemTrayIcon, QMenu, QAction, QStyle, QSplitter)
-from PyQt5.QtCore import QThread, pyqtSignal, Qt, QTimer, QSettings
-from PyQt5.QtGui import QFont, QIcon, QTextCursor, QColor, QPalette, QPixmap, QTextCharFormat
+                           QSystemTrayIcon, QMenu, QAction, QStyle, QSplitter, QSpinBox,
+                           QDoubleSpinBox, QFileDialog)
+from PyQt5.QtCore import QThread, pyqtSignal, Qt, QTimer, QSettings, QCoreApplication, QPointF
+from PyQt5.QtGui import (QFont, QIcon, QTextCursor, QColor, QPalette, QPixmap, QTextCharFormat,
+                         QPainter, QPen)
+from protocol import (encode_frame, FrameReader, ALIAS, MESSAGE, SYSTEM, QUIT, TYPING,
+                      ROSTER, ROSTER_DELTA, SHUTDOWN, BUSY, LATENCY, BATCH, ACK, HISTORY,
+                      NODE, ATTACH_OFFER, ATTACH, ATTACH_INDEX, CHUNK, CHUNK_REQUEST, MAX_FRAME,
+                      DEFAULT_ROOM)
+from presence import TypingTracker, Roster
+from session import ClientSession
+from output import DEFAULT_TICK
+from diagnostics import Diagnostics, DEFAULT_DIRECTORY
+from admin import AdminServer, AdminCommands, default_path as admin_socket_path
+from latency import LatencyTracker
+from capture import CaptureWriter, CapturingReader
+from history import MessageStore, DEFAULT_PAGE
+from federation import Federation
+from poller import SessionPoller, BufferPool, raise_fd_limit
+from pipeline import Pipeline, Message, Step, Validate, RateLimit
+from wordfilter import WordFilter
+from eventlog import EventLog
+from throughput import ThroughputSampler
+from attachments import (AttachmentStore, ATTACHMENTS_DIR, MAX_ATTACHMENT, is_hash, chunk_count,
+                         encode_chunk, decode_chunk, format_size)
+import tls
+
+# Fichero del historial de mensajes del servidor
+HISTORY_FILE = "historial_servidor.jsonl"
+# Registro de eventos del servidor (JSON-lines, rotado y comprimido)
+EVENT_LOG_FILE = "eventos_servidor.jsonl"
 
 class ServerThread(QThread):
     update_signal = pyqtSignal(str, str)  # mensaje, tipo
     client_count_signal = pyqtSignal(int)
     
-    def __init__(self, host, port):
+    # Intervalo de envío agregado de presencia: escritura y lista de usuarios (segundos)
+    PRESENCE_INTERVAL = 0.5
+    # Tiempo máximo para que un cliente recién aceptado envíe su alias (segundos)
+    HANDSHAKE_TIMEOUT = 10
+    # Claves de idempotencia recordadas para descartar reenvíos de mensajes ya entregados
+    DELIVERED_IDS = 10000
+    # Hilos que procesan lo recibido por las sesiones (las inactivas no ocupan ninguno)
+    READ_WORKERS = 8
+    # Adjuntos que una sesión puede tener a medio subir a la vez
+    MAX_UPLOADS = 4
+    # Trozos que se envían como mucho por cada petición de descarga
+    CHUNK_WINDOW = 64
+    # Niveles del registro y gravedad de cada tipo de mensaje
+    LOG_LEVELS = {"info": 0, "sistema": 1, "aviso": 2, "error": 3}
+    LOG_SEVERITY = {"info": 0, "success": 1, "system": 1, "warning": 2, "error": 3}
+    
+    def __init__(self, host, port, drain_timeout=5.0, reconnect_hint_ms=2000, reconnect_spread_ms=8000,
+                 backlog=128, max_sessions=1000, accept_batch=64, busy_retry_ms=5000,
+                 certfile=None, keyfile=None, write_tick=DEFAULT_TICK, trace_sample=0.05,
+                 history_path=HISTORY_FILE, node_id=None, peers=(), relay_secret=None, rate_limit=0,
+                 filter_path=None, event_log_path=None, event_log_max_bytes=10 * 2**20,
+                 event_log_rotate_seconds=24 * 3600, attachments_path=ATTACHMENTS_DIR):
         super().__init__()
         self.host = host
         self.port = port
         self.server_socket = None
-        self.clients = []
-        self.aliases = []
+        self.clients = []  # sesiones activas (ClientSession)
+        self.clients_lock = threading.Lock()
+        self.handlers = []
+        self.typing = TypingTracker()
+        self.roster = Roster()
+        self.presence_lock = threading.Lock()  # instantánea y deltas en orden
+        # Cierre ordenado: tiempo máximo para vaciar colas y aviso de reconexión
+        self.drain_timeout = drain_timeout
+        self.reconnect_hint_ms = reconnect_hint_ms
+        self.reconnect_spread_ms = reconnect_spread_ms
+        # Control de admisión
+        self.backlog = backlog
+        self.max_sessions = max_sessions
+        self.accept_batch = accept_batch
+        self.busy_retry_ms = busy_retry_ms
+        self.handshaking = 0  # conexiones aceptadas que aún no enviaron su alias
+        self.metrics = {"aceptadas": 0, "rechazadas": 0, "tls_completos": 0, "tls_reanudados": 0,
+                        "duplicados": 0, "vetadas": 0, "mensajes": 0, "bytes_recibidos": 0}
+        self.retired_sent = 0  # bytes enviados por las sesiones ya cerradas
+        # TLS opcional: sin certificado se usa TCP sin cifrar
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.tls_context = None
+        # Micro-tick de agrupación de escrituras por sesión (segundos)
+        self.write_tick = write_tick
+        # Trazado de latencia: fracción de mensajes que llevan marcas de tiempo
+        self.trace_sample = trace_sample
+        self.latency = LatencyTracker()
+        # (alias, clave) de los últimos mensajes entregados, del más antiguo al más reciente
+        self.delivered = OrderedDict()
+        self.delivered_lock = threading.Lock()
+        # Captura del tráfico entrante (None = desactivada)
+        self.capture = None
+        # Historial paginado (se abre al arrancar; None = sin historial)
+        self.history_path = history_path
+        self.history = None
+        # Adjuntos por contenido (se abre al arrancar; None = sin adjuntos)
+        self.attachments_path = attachments_path
+        self.attachments = None
+        self.uploads = {}  # sesión -> {id: subida en curso}
+        # Federación con otros servidores (solo si hay clave compartida)
+        self.node_id = node_id or f"{socket.gethostname()}:{port}"
+        self.peers = list(peers)
+        self.relay_secret = relay_secret
+        self.federation = None
+        self.poller = None
+        self.buffers = BufferPool()
+        self.banned = {}  # dirección -> instante en que caduca el veto (None = sin límite)
+        self.log_level = "info"
+        # Registro de eventos en disco: se conecta directamente para que encolar ocurra en
+        # el hilo que emite, sin pasar por el bucle de eventos de Qt
+        self.events = None
+        if event_log_path:
+            self.events = EventLog(event_log_path, event_log_max_bytes, event_log_rotate_seconds)
+            self.update_signal.connect(self.events.log, Qt.DirectConnection)
+        # Filtro de términos prohibidos (None = sin filtro); se recarga solo al cambiar el fichero
+        self.filter = WordFilter(filter_path, log=self.update_signal.emit) if filter_path else None
+        # Etapas por las que pasa cada mensaje de chat (rate_limit = mensajes/s por usuario, 0 = sin límite)
+        self.pipeline = self.build_pipeline(rate_limit)
         self.running = False
     
-    def broadcast(self, message, sender_conn=None):
+    def log_enabled(self, type):
+        """Indica si un mensaje del tipo dado alcanza el nivel actual del registro"""
+        return self.LOG_SEVERITY.get(type, 0) >= self.LOG_LEVELS[self.log_level]
+    
+    def set_log_level(self, level):
+        if level not in self.LOG_LEVELS:
+            raise ValueError(f"nivel desconocido: {level} (niveles: {', '.join(self.LOG_LEVELS)})")
+        self.log_level = level
+    
+    def ban(self, address, seconds=None):
+        """Rechaza las conexiones nuevas desde una dirección (para siempre si seconds es None)"""
+        self.banned[address] = time.monotonic() + seconds if seconds else None
+    
+    def unban(self, address):
+        return self.banned.pop(address, False) is not False
+    
+    def is_banned(self, address):
+        if address not in self.banned:
+            return False
+        expiry = self.banned.get(address)
+        if expiry is not None and expiry <= time.monotonic():
+            self.banned.pop(address, None)
+            return False
+        return True
+    
+    def bans(self):
+        """Vetos vigentes: {dirección: segundos restantes o None}"""
+        now = time.monotonic()
+        return {address: None if expiry is None else expiry - now
+                for address, expiry in list(self.banned.items()) if self.is_banned(address)}
+    
+    def kick(self, session, notice, drain_timeout=0.5):
+        """Desconecta una sesión tras enviarle un aviso"""
+        session.send(encode_frame(SYSTEM, texto=notice))
+        session.drain(drain_timeout)
+        self.update_signal.emit(f"[ADMIN] {session.alias} desconectado: {notice}", "warning")
+        self.remove_client(session)
+    
+    def announce(self, text):
+        """Envía un aviso del sistema a todas las sesiones; devuelve a cuántas"""
+        with self.clients_lock:
+            count = len(self.clients)
+        self.broadcast(encode_frame(SYSTEM, texto=text))
+        self.update_signal.emit(f"[ADMIN] Aviso a {count} sesiones: {text}", "system")
+        return count
+    
+    def broadcast(self, message, sender=None):
         """Envía un mensaje a todos los clientes conectados excepto al remitente"""
-        for client in self.clients:
-            if client != sender_conn:  # No enviar mensaje al remitente
-                try:
-                    client.send(message)
-                except:
-                    # Si hay un error, eliminar cliente
-                    index = self.clients.index(client)
-                    self.clients.remove(client)
-                    client.close()
-                    alias = self.aliases[index]
-                    self.aliases.remove(alias)
-                    self.broadcast(f'SERVIDOR: {alias} ha dejado el chat!'.encode('utf-8'))
-                    self.update_signal.emit(f"[DESCONEXIÓN] {alias} ha dejado el chat", "error")
-                    self.client_count_signal.emit(len(self.clients))
-    
-    def handle_client(self, conn, addr, alias):
-        """Maneja la comunicación con un cliente individual"""
+        with self.clients_lock:
+            sessions = list(self.clients)
+        for session in sessions:
+            if session is not sender:  # No enviar mensaje al remitente
+                # Solo encola; si el cliente está caído o saturado su hilo lo dará de baja
+                session.send(message)
+    
+    def was_delivered(self, alias, msg_id):
+        """Indica si la clave de un mensaje ya se entregó (sin registrarla)"""
+        key = (alias, msg_id)
+        with self.delivered_lock:
+            if key in self.delivered:
+                self.delivered.move_to_end(key)
+                self.metrics["duplicados"] += 1
+                return True
+            return False
+    
+    def first_delivery(self, alias, msg_id):
+        """Registra la clave de un mensaje; devuelve False si ya se había entregado"""
+        key = (alias, msg_id)
+        with self.delivered_lock:
+            if key in self.delivered:
+                self.delivered.move_to_end(key)
+                self.metrics["duplicados"] += 1
+                return False
+            self.delivered[key] = True
+            if len(self.delivered) > self.DELIVERED_IDS:
+                self.delivered.popitem(last=False)
+            return True
+    
+    def build_pipeline(self, rate_limit):
+        """Cadena por defecto: validación, duplicados, límite de ritmo, filtro, clave, historial, reparto y registro"""
+        stages = [Validate(), Step("duplicados", self.check_duplicate)]
+        if rate_limit:
+            stages.append(RateLimit(rate_limit))
+        if self.filter:
+            stages.append(self.filter)
+        # La clave se registra solo cuando el mensaje ya no se va a detener: uno frenado
+        # por el límite de ritmo no se confirma y su reenvío no debe parecer un duplicado
+        stages += [Step("clave", self.record_delivery), Step("historial", self.persist_message), Step("reparto", self.route_message),
+                   Step("registro", self.log_message)]
+        return Pipeline(stages)
+    
+    def deliver_message(self, session, frame):
+        """Pasa un mensaje de chat por la cadena de etapas y lo devuelve (con dropped si alguna lo detuvo)"""
+        message = Message(session, frame, time.time())
+        self.pipeline.run(message)
+        return message
+    
+    def check_duplicate(self, message):
+        """Detiene pronto los reenvíos de un mensaje con una clave de idempotencia ya vista"""
+        return message.id is None or not self.was_delivered(message.alias, message.id)
+    
+    def record_delivery(self, message):
+        """Registra la clave de un mensaje aceptado (y detiene una copia que llegara a la vez)"""
+        return message.id is None or self.first_delivery(message.alias, message.id)
+    
+    def persist_message(self, message):
+        # Número de mensaje en el historial: los clientes piden páginas anteriores a él
+        if self.history is not None:
+            message.extra["num"] = self.history.append(message.alias, message.text, message.room)["num"]
+    
+    def route_message(self, message):
+        """Reparte el mensaje a las sesiones locales y a los nodos federados"""
+        # Formato: alias: mensaje
+        self.typing.update(message.room, message.alias, False)
+        if self.trace_sample and random.random() < self.trace_sample:
+            self.broadcast_traced(message.alias, message.text, message.ingest, message.session, message.extra)
+        else:
+            self.broadcast(encode_frame(MESSAGE, de=message.alias, texto=message.text, **message.extra),
+                           message.session)
+        if self.federation:
+            self.federation.publish_message(message.alias, message.text, message.room)
+        self.metrics["mensajes"] += 1
+    
+    def log_message(self, message):
+        if self.log_enabled("info"):
+            self.update_signal.emit(f"[MENSAJE] {message.alias}: {message.text}", "info")
+    
+    def deliver_remote(self, origin, alias, text, room):
+        """Reparte a los clientes locales un mensaje llegado de otro nodo"""
+        name = f"{alias}@{origin}"
+        extra = {"num": self.history.append(name, text, room)["num"]} if self.history is not None else {}
+        self.broadcast(encode_frame(MESSAGE, de=name, texto=text, **extra))
+        self.update_signal.emit(f"[FEDERACIÓN] {name}: {text}", "info")
+    
+    def remote_presence(self, origin, room, added, removed):
+        """Refleja en la lista de usuarios local las altas y bajas de otro nodo"""
+        with self.presence_lock:
+            for alias in added:
+                self.roster.join(room, f"{alias}@{origin}")
+            for alias in removed:
+                self.roster.leave(room, f"{alias}@{origin}")
+    
+    def sample(self):
+        """Contadores acumulados y estado instantáneo para el panel (una sola pasada por las sesiones)"""
+        with self.clients_lock:
+            sessions = list(self.clients)
+        queues = [len(session.output.pending) for session in sessions]
+        return {"hora": time.monotonic(), "mensajes": self.metrics["mensajes"],
+                "bytes_recibidos": self.metrics["bytes_recibidos"],
+                "bytes_enviados": self.retired_sent + sum(session.output.sent for session in sessions),
+                "sesiones": len(sessions), "cola_total": sum(queues), "cola_maxima": max(queues, default=0),
+                "difusion": list(self.latency.histograms["difusion"].counts)}
+    
+    def local_members(self):
+        """Usuarios conectados a este nodo por sala"""
+        members = {}
+        with self.clients_lock:
+            for session in self.clients:
+                members.setdefault(session.room, []).append(session.alias)
+        return members
+    
+    def broadcast_traced(self, alias, text, ingest, sender, extra):
+        """Reparte un mensaje muestreado con sus marcas de ingesta y reparto"""
+        fanout = time.time()
+        self.broadcast(encode_frame(MESSAGE, de=alias, texto=text, traza=[ingest, fanout], **extra), sender)
+        self.latency.add("servidor", (fanout - ingest) * 1000)
+        self.latency.add("difusion", (time.time() - fanout) * 1000)
+    
+    def send_ack(self, session, messages):
+        """Confirma mensajes con clave de idempotencia, con el número de historial de los guardados.
+
+        Los detenidos por una etapa temporal no se confirman: el cliente los reenviará.
+        """
+        messages = [message for message in messages
+                    if message.dropped is None or not getattr(self.pipeline.get(message.dropped), "transient", False)]
+        if not messages:
+            return
+        # Con los números, el autor guarda sus propios mensajes en su historial local
+        nums = {message.id: message.extra["num"] for message in messages if "num" in message.extra}
+        session.send(encode_frame(ACK, ids=[message.id for message in messages], nums=nums))
+    
+    def send_history(self, session, frame):
+        """Responde con una página de mensajes anteriores a 'antes' (los últimos si no se indica).
+
+        Con 'desde' solo van los posteriores a ese número: un cliente con historial
+        local pide únicamente lo que se perdió.
+        """
+        if self.history is None:
+            session.send(encode_frame(HISTORY, mensajes=[], mas=False))
+            return
+        try:
+            before = frame.get("antes")
+            before = int(before) if before is not None else None
+            limit = int(frame.get("limite", DEFAULT_PAGE))
+            after = int(frame.get("desde") or 0)
+        except (TypeError, ValueError):
+            return
+        # La página debe caber en una trama; si se recorta, el cliente pide el resto después
+        records, more = self.history.page(before, limit, max_bytes=MAX_FRAME // 2, after=after)
+        session.send(encode_frame(HISTORY, mensajes=records, mas=more))
+    
+    def handle_attachment(self, session, frame):
+        """Tramas de subida y descarga de adjuntos"""
+        if self.attachments is None:
+            if frame["tipo"] == ATTACH_OFFER:
+                session.send(encode_frame(SYSTEM, texto="Este servidor no admite adjuntos"))
+            return
+        handler = {ATTACH_OFFER: self.offer_attachment, CHUNK: self.receive_chunk,
+                   ATTACH: self.share_attachment, ATTACH_INDEX: self.send_attachment_index,
+                   CHUNK_REQUEST: self.send_chunks}[frame["tipo"]]
+        try:
+            handler(session, frame)
+        except OSError as e:
+            session.send(encode_frame(SYSTEM, texto="Error del almacén de adjuntos"))
+            self.update_signal.emit(f"[ERROR] Almacén de adjuntos: {str(e)}", "error")
+    
+    def offer_attachment(self, session, frame):
+        """Responde al anuncio de un adjunto con los trozos que el servidor aún no tiene"""
+        file_id, hashes = frame.get("id"), frame.get("trozos")
+        try:
+            size = int(frame.get("tamano"))
+        except (TypeError, ValueError):
+            size = -1
+        if (not is_hash(file_id) or not isinstance(hashes, list) or not 0 <= size <= MAX_ATTACHMENT
+                or len(hashes) != chunk_count(size) or not all(is_hash(digest) for digest in hashes)):
+            session.send(encode_frame(SYSTEM, texto=f"Adjunto no válido o mayor de {format_size(MAX_ATTACHMENT)}"))
+            return
+        uploads = self.uploads.setdefault(session, {})
+        if file_id not in uploads and len(uploads) >= self.MAX_UPLOADS:
+            session.send(encode_frame(SYSTEM, texto="Demasiados adjuntos subiéndose a la vez"))
+            return
+        # Un fichero ya guardado no necesita ningún trozo, aunque se comparta con otro nombre.
+        # El cliente repite la oferta tras cada tanda de trozos hasta que no falte ninguno
+        missing = [] if self.attachments.manifest(file_id) is not None else self.attachments.missing(hashes)
+        uploaded = uploads[file_id]["subidos"] if file_id in uploads else 0
+        uploads[file_id] = {"tamano": size, "trozos": hashes, "faltan": set(missing), "subidos": uploaded}
+        session.send(encode_frame(ATTACH_OFFER, id=file_id, faltan=missing))
+    
+    def receive_chunk(self, session, frame):
+        """Guarda un trozo que el servidor pidió en una oferta de esta sesión"""
+        digest = frame.get("hash")
+        uploads = [upload for upload in self.uploads.get(session, {}).values() if digest in upload["faltan"]]
+        if not uploads:
+            return
+        try:
+            data = decode_chunk(frame.get("datos", ""))
+            self.attachments.put(digest, data)
+        except ValueError:
+            session.send(encode_frame(SYSTEM, texto="Trozo de adjunto dañado; vuelve a enviar el archivo"))
+            return
+        for upload in uploads:
+            upload["faltan"].discard(digest)
+            upload["subidos"] += len(data)
+    
+    def share_attachment(self, session, frame):
+        """Registra un adjunto ya subido y envía a los demás solo su referencia"""
+        upload = self.uploads.get(session, {}).pop(frame.get("id"), None)
+        if upload is None:
+            return
+        name = os.path.basename(str(frame.get("nombre", "")))[:200] or "archivo"
+        if upload["faltan"]:
+            session.send(encode_frame(SYSTEM, texto=f"No se pudo compartir {name}: faltan "
+                                                     f"{len(upload['faltan'])} trozos"))
+            return
+        try:
+            new = self.attachments.commit(frame["id"], upload["tamano"], upload["trozos"])
+        except ValueError as e:
+            session.send(encode_frame(SYSTEM, texto=f"No se pudo compartir {name}: {e}"))
+            return
+        attachment = {"id": frame["id"], "nombre": name, "tamano": upload["tamano"]}
+        text = f"📎 {name}"
+        extra = {}
+        if self.history is not None:
+            extra["num"] = self.history.append(session.alias, text, session.room, attachment)["num"]
+        self.broadcast(encode_frame(ATTACH, de=session.alias, **attachment, **extra), session)
+        session.send(encode_frame(SYSTEM, texto=f"Archivo {name} compartido ({format_size(upload['tamano'])}; "
+                                                 f"subidos {format_size(upload['subidos'])})"))
+        self.update_signal.emit(f"[ADJUNTO] {session.alias}: {name} ({format_size(upload['tamano'])}, "
+                                f"{'nuevo' if new else 'ya guardado'}, subidos {format_size(upload['subidos'])})",
+                                "info")
+    
+    def send_attachment_index(self, session, frame):
+        """Envía la lista de trozos de un adjunto (trozos vacío si no existe)"""
+        file_id = frame.get("id")
+        manifest = self.attachments.manifest(file_id) if is_hash(file_id) else None
+        if manifest is None:
+            session.send(encode_frame(ATTACH_INDEX, id=str(file_id), tamano=0, trozos=[]))
+        else:
+            session.send(encode_frame(ATTACH_INDEX, **manifest))
+    
+    def send_chunks(self, session, frame):
+        """Envía los trozos pedidos (como mucho CHUNK_WINDOW por petición); sin datos si no existen"""
+        hashes = frame.get("trozos")
+        if not isinstance(hashes, list):
+            return
+        for digest in hashes[:self.CHUNK_WINDOW]:
+            if not is_hash(digest):
+                continue
+            if self.attachments.has(digest):
+                session.send(encode_frame(CHUNK, hash=digest, datos=encode_chunk(self.attachments.get(digest))))
+            else:
+                session.send(encode_frame(CHUNK, hash=digest, datos=None))
+    
+    def broadcast_room(self, room, message):
+        """Envía un mensaje a todos los clientes de una sala"""
+        with self.clients_lock:
+            sessions = [session for session in self.clients if session.room == room]
+        for session in sessions:
+            session.send(message)
+    
+    def remove_client(self, session):
+        """Da de baja una sesión y actualiza la presencia"""
+        with self.clients_lock:
+            if session not in self.clients:
+                return
+            self.clients.remove(session)
+            count = len(self.clients)
+        if self.poller:
+            self.poller.discard(session)
+        else:
+            session.close()
+        self.uploads.pop(session, None)
+        self.retired_sent += session.output.sent
+        if isinstance(session.reader, CapturingReader):
+            session.reader.disconnect()
+        # Como las altas, bajo presence_lock: instantáneas, deltas y el orden de lo
+        # publicado a otros nodos (solo guardan el alias: la baja va con la última sesión)
+        with self.presence_lock:
+            if self.roster.leave(session.room, session.alias) and self.federation:
+                self.federation.publish_presence(session.room, [], [session.alias])
+        self.typing.remove_user(session.alias)
+        self.client_count_signal.emit(count)
+    
+    def flush_typing(self):
+        """Envía una única trama agregada de "quién escribe" por cada sala con cambios"""
+        for room, users in self.typing.collect().items():
+            self.broadcast_room(room, encode_frame(TYPING, sala=room, usuarios=users))
+    
+    def flush_roster(self):
+        """Envía un único delta de altas y bajas por cada sala con cambios"""
+        with self.presence_lock:
+            for room, (added, removed) in self.roster.collect().items():
+                self.broadcast_room(room, encode_frame(ROSTER_DELTA, sala=room, altas=added, bajas=removed))
+    
+    def presence_loop(self):
+        """Agrega los cambios de presencia y los envía en intervalos fijos"""
+        while self.running:
+            time.sleep(self.PRESENCE_INTERVAL)
+            self.flush_roster()
+            self.flush_typing()
+    
+    def receive_frame(self, conn, reader, pending):
+        """Devuelve la siguiente trama del cliente o None si se cerró la conexión"""
+        while not pending:
+            data = conn.recv(4096)
+            if not data:
+                return None
+            self.metrics["bytes_recibidos"] += len(data)
+            pending.extend(reader.feed(data))
+        return pending.pop(0)
+    
+    def session_count(self):
+        """Sesiones activas más conexiones aún en el saludo"""
+        with self.clients_lock:
+            return len(self.clients) + self.handshaking
+    
+    def shed(self, conn):
+        """Rechaza una conexión al instante con una trama de "ocupado" sin bloquear"""
+        self.metrics["rechazadas"] += 1
+        delay = self.busy_retry_ms + random.randint(0, self.busy_retry_ms)
+        try:
+            conn.setblocking(False)
+            conn.send(encode_frame(BUSY, reintentar_ms=delay,
+                                   texto=f"Servidor ocupado. Reintentando en {delay / 1000:.1f} s..."))
+        except OSError:
+            pass
+        conn.close()
+    
+    def accept_pending(self):
+        """Acepta de una vez las conexiones pendientes (hasta accept_batch por despertar)"""
+        shed = 0
+        for _ in range(self.accept_batch):
+            try:
+                conn, addr = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                break
+            conn.setblocking(True)
+            if self.banned and self.is_banned(addr[0]):
+                self.metrics["vetadas"] += 1
+                conn.close()
+                continue
+            if self.session_count() >= self.max_sessions:
+                self.shed(conn)
+                shed += 1
+                continue
+            
+            self.metrics["aceptadas"] += 1
+            with self.clients_lock:
+                self.handshaking += 1
+            
+            # Iniciar un hilo para manejar el cliente (el saludo no bloquea la aceptación)
+            thread = threading.Thread(target=self.handle_connection, args=(conn, addr))
+            thread.daemon = True
+            thread.start()
+            self.handlers = [handler for handler in self.handlers if handler.is_alive()]
+            self.handlers.append(thread)
+        
+        # Un único aviso por lote para no saturar el registro durante una avalancha
+        if shed:
+            self.update_signal.emit(f"[SOBRECARGA] {shed} conexiones rechazadas "
+                                    f"({self.metrics['rechazadas']} en total)", "warning")
+    
+    def tls_handshake(self, conn):
+        """Completa el saludo TLS en el hilo del cliente, fuera del bucle de aceptación"""
+        conn = self.tls_context.wrap_socket(conn, server_side=True, do_handshake_on_connect=False)
+        conn.settimeout(self.HANDSHAKE_TIMEOUT)
+        conn.do_handshake()
+        key = "tls_reanudados" if conn.session_reused else "tls_completos"
+        with self.clients_lock:
+            self.metrics[key] += 1
+        return conn
+    
+    def start_capture(self, path):
+        """Empieza a grabar el tráfico entrante de las conexiones nuevas"""
+        self.stop_capture()
+        self.capture = CaptureWriter(path)
+        self.update_signal.emit(f"[CAPTURA] Grabando las conexiones nuevas en {path}", "system")
+    
+    def stop_capture(self):
+        """Cierra la captura en curso, si la hay"""
+        capture, self.capture = self.capture, None
+        if capture:
+            capture.close()
+            self.update_signal.emit(f"[CAPTURA] {capture.events} eventos guardados en {capture.path}", "system")
+    
+    def handshake(self, conn, addr, reader):
+        """Solicita el alias al cliente y crea su sesión; devuelve None si no responde"""
+        conn.settimeout(self.HANDSHAKE_TIMEOUT)
+        if self.tls_context:
+            conn = self.tls_handshake(conn)
+        conn.send(encode_frame(ALIAS))
+        pending = []
+        frame = self.receive_frame(conn, reader, pending)
+        if frame is not None and frame["tipo"] == NODE and self.federation:
+            # Otro servidor de la federación: el enlace se atiende en serve_connection
+            return NODE, conn, frame, pending
+        if frame is None or frame["tipo"] != ALIAS:
+            return None
+        conn.settimeout(None)
+        alias = str(frame.get("alias", ""))
+        room = str(frame.get("sala", DEFAULT_ROOM))
+        
+        # Crear la sesión con su hilo escritor
+        session = ClientSession(conn, addr, alias, room, self.write_tick, reader)
+        session.start()
+        return session, pending
+    
+    def handle_connection(self, conn, addr):
+        """Completa el saludo de una conexión aceptada y atiende al cliente"""
+        # Con la captura activa, el lector graba todo lo que llega por esta conexión
+        capture = self.capture
+        reader = capture.reader() if capture else FrameReader()
+        served = False
+        try:
+            served = self.serve_connection(conn, addr, reader)
+        finally:
+            # Las sesiones registran su desconexión al darse de baja (remove_client)
+            if capture and not served:
+                reader.disconnect()
+    
+    def serve_connection(self, conn, addr, reader):
+        """Saludo y atención del cliente; devuelve True si se creó una sesión"""
+        try:
+            result = self.handshake(conn, addr, reader)
+        except Exception as e:
+            if self.tls_context and isinstance(e, ssl.SSLError):
+                self.update_signal.emit(f"[TLS] Saludo fallido con {addr[0]}: {e.reason or e}", "warning")
+            result = None
+        finally:
+            with self.clients_lock:
+                self.handshaking -= 1
+        if result is None:
+            conn.close()
+            return
+        if result[0] == NODE:
+            _, conn, hello, pending = result
+            if not self.federation.accept(conn, hello, reader, pending):
+                conn.close()
+            return
+        if not self.running:
+            result[0].close()
+            return
+        self.handle_client(*result)
+        return True
+    
+    def handle_client(self, session, pending):
+        """Da de alta a un cliente y deja su conexión a la espera de datos"""
+        addr, alias, room = session.addr, session.alias, session.room
         self.update_signal.emit(f"[CONEXIÓN] {addr[0]}:{addr[1]} se ha conectado como {alias}", "success")
         
-        # Notificar a todos que el cliente se ha unido
-        self.broadcast(f"SERVIDOR: {alias} se ha unido al chat!".encode('utf-8'))
-        
-        # Enviar mensaje de bienvenida al cliente
-        conn.send("SERVIDOR: ¡Bienvenido al chat! Escribe 'salir' para desconectarte.".encode('utf-8'))
-        
+        # Enviar mensaje de bienvenida y la lista de usuarios publicada de la sala;
+        # el alta del propio cliente llega a todos en el siguiente delta agregado
+        session.send(encode_frame(SYSTEM, texto="¡Bienvenido al chat! Escribe 'salir' para desconectarte."))
+        with self.presence_lock:
+            session.send(encode_frame(ROSTER, sala=room, usuarios=self.roster.snapshot(room)))
+            with self.clients_lock:
+                self.clients.append(session)
+                count = len(self.clients)
+            if self.roster.join(room, alias) and self.federation:
+                self.federation.publish_presence(room, [alias], [])
+        self.client_count_signal.emit(count)
+        self.update_signal.emit(f"[CONEXIONES ACTIVAS] {count}", "info")
+        
+        # Tramas que llegaron junto con el saludo
+        try:
+            connected = all(self.handle_frame(session, frame) for frame in pending)
+        except Exception:
+            connected = False
+        if not connected:
+            self.end_session(session)
+        elif self.tls_context:
+            # En TLS un registro puede llegar a trozos y la lectura bloquearía a un
+            # hilo lector compartido: estas sesiones conservan su propio hilo
+            self.read_blocking(session)
+        elif not self.poller.register(session):
+            self.end_session(session)
+    
+    def handle_frame(self, session, frame):
+        """Atiende una trama de un cliente; devuelve False si el cliente se despide"""
+        session.received += 1
+        if frame["tipo"] == QUIT:
+            return False
+        elif frame["tipo"] == TYPING:
+            # Solo se registra; el envío se agrupa en flush_typing
+            self.typing.update(session.room, session.alias, bool(frame.get("activo", True)))
+        elif frame["tipo"] == MESSAGE:
+            message = self.deliver_message(session, frame)
+            if "id" in frame:
+                self.send_ack(session, [message])
+        elif frame["tipo"] == BATCH:
+            # Mensajes escritos sin conexión: se entregan en orden y se confirman juntos
+            items = [item for item in frame.get("mensajes", []) if isinstance(item, dict)]
+            messages = [self.deliver_message(session, item) for item in items]
+            self.send_ack(session, [message for message in messages if message.id is not None])
+        elif frame["tipo"] == HISTORY:
+            self.send_history(session, frame)
+        elif frame["tipo"] in (ATTACH_OFFER, CHUNK, ATTACH, ATTACH_INDEX, CHUNK_REQUEST):
+            self.handle_attachment(session, frame)
+        elif frame["tipo"] == LATENCY:
+            # Informe de histogramas de un cliente: red, pintado y total
+            etapas = frame.get("etapas")
+            if isinstance(etapas, dict):
+                self.latency.merge(etapas)
+        return True
+    
+    def read_session(self, session):
+        """Lee lo que ha llegado por una sesión (en un hilo lector) y la vuelve a poner a la espera"""
+        buffer = self.buffers.acquire()
+        try:
+            received = session.conn.recv_into(buffer)
+            connected = received > 0
+            if connected:
+                self.metrics["bytes_recibidos"] += received
+                for frame in session.reader.feed(bytes(memoryview(buffer)[:received])):
+                    if not self.handle_frame(session, frame):
+                        connected = False
+                        break
+        except Exception:
+            connected = False
+        finally:
+            self.buffers.release(buffer)
+        if not self.running:
+            return
+        if not connected or not self.poller.register(session):
+            self.end_session(session)
+    
+    def read_blocking(self, session):
+        """Atiende a un cliente desde su propio hilo hasta que se desconecte"""
+        pending = []
         connected = True
         while connected and self.running:
             try:
-                # Recibir mensaje
-                message = conn.recv(1024)
-                if message:
-                    # Si el mensaje es 'salir', desconectar cliente
-                    if message.decode('utf-8').lower() == 'salir':
-                        connected = False
-                    else:
-                        # Formato: alias: mensaje
-                        formatted_msg = f"{alias}: {message.decode('utf-8')}"
-                        self.broadcast(formatted_msg.encode('utf-8'), conn)
-                        self.update_signal.emit(f"[MENSAJE] {formatted_msg}", "info")
-                else:
-                    connected = False
-            except:
+                frame = self.receive_frame(session.conn, session.reader, pending)
+                connected = frame is not None and self.handle_frame(session, frame)
+            except Exception:
                 connected = False
-        
-        # Cliente desconectado
-        self.update_signal.emit(f"[DESCONEXIÓN] {alias} se ha desconectado", "error")
-        if conn in self.clients:
-            index = self.clients.index(conn)
-            self.clients.remove(conn)
-            conn.close()
-            alias = self.aliases[index]
-            self.broadcast(f'SERVIDOR: {alias} ha dejado el chat!'.encode('utf-8'))
-            self.aliases.remove(alias)
-            self.client_count_signal.emit(len(self.clients))
+        self.end_session(session)
+    
+    def end_session(self, session):
+        """Cliente desconectado (durante un cierre ordenado, drain_clients se encarga)"""
+        if self.running:
+            self.update_signal.emit(f"[DESCONEXIÓN] {session.alias} se ha desconectado", "error")
+            self.remove_client(session)
+    
+    def drain_clients(self):
+        """Avisa a los clientes del cierre, vacía sus colas y cierra en un tiempo acotado"""
+        with self.clients_lock:
+            sessions = list(self.clients)
+        if not sessions:
+            return
+        deadline = time.monotonic() + self.drain_timeout
+        self.update_signal.emit(f"[CIERRE] Vaciando colas de {len(sessions)} clientes "
+                                f"(máximo {self.drain_timeout:g} s)...", "warning")
+        
+        # Cada cliente recibe un retardo distinto para repartir las reconexiones
+        for session in sessions:
+            delay = self.reconnect_hint_ms + random.randint(0, self.reconnect_spread_ms)
+            session.send(encode_frame(SHUTDOWN, reintentar_ms=delay,
+                                      texto=f"El servidor se está reiniciando. Reconectando en {delay / 1000:.1f} s..."))
+        
+        pending = 0
+        for session in sessions:
+            if not session.drain(deadline - time.monotonic()):
+                pending += 1
+        if pending:
+            self.update_signal.emit(f"[CIERRE] {pending} clientes no vaciaron su cola a tiempo", "warning")
+        
+        for session in sessions:
+            self.remove_client(session)
+        for thread in self.handlers:
+            thread.join(max(deadline - time.monotonic(), 0))
     
     def run(self):
         """Inicia el servidor en un hilo separado"""
         self.running = True
+        if self.events:
+            try:
+                self.events.start()
+            except OSError as e:
+                self.update_signal.emit(f"[ERROR] No se pudo abrir el registro de eventos: {str(e)}", "error")
         self.update_signal.emit(f"[INICIANDO] El servidor está iniciando en {self.host}:{self.port}...", "system")
         
+        if self.certfile:
+            try:
+                self.tls_context = tls.server_context(self.certfile, self.keyfile or None)
+                self.update_signal.emit("[TLS] Conexiones cifradas con reanudación de sesión activada", "system")
+            except Exception as e:
+                self.update_signal.emit(f"[ERROR] No se pudo cargar el certificado TLS: {str(e)}", "error")
+                self.abort_start()
+                return
+        
         # Creamos un objeto socket tipo TCP
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         
@@ -97,63 +789,166 @@ class ServerThread(QThread):
             self.update_signal.emit(f"[ACTIVO] Servidor activo en {self.host}:{self.port}", "success")
         except Exception as e:
             self.update_signal.emit(f"[ERROR] Error al iniciar el servidor: {str(e)}", "error")
+            self.abort_start()
             return
         
-        self.server_socket.listen(5)
-        self.update_signal.emit("[ESCUCHANDO] Esperando conexiones...", "system")
+        if self.history_path:
+            try:
+                self.history = MessageStore(self.history_path)
+                self.update_signal.emit(f"[HISTORIAL] {len(self.history)} mensajes en {self.history_path}", "system")
+            except OSError as e:
+                self.update_signal.emit(f"[ERROR] No se pudo abrir el historial: {str(e)}", "error")
+        
+        if self.attachments_path:
+            try:
+                self.attachments = AttachmentStore(self.attachments_path)
+                self.update_signal.emit(f"[ADJUNTOS] Almacén en {self.attachments_path}", "system")
+            except OSError as e:
+                self.update_signal.emit(f"[ERROR] No se pudo abrir el almacén de adjuntos: {str(e)}", "error")
+        
+        if self.relay_secret:
+            self.federation = Federation(self.node_id, self.relay_secret, self.deliver_remote,
+                                         self.remote_presence, self.local_members,
+                                         log=self.update_signal.emit)
+            try:
+                self.federation.start(self.peers)
+                self.update_signal.emit(f"[FEDERACIÓN] Nodo {self.node_id}, "
+                                        f"{len(self.peers)} nodos configurados", "system")
+            except ValueError as e:
+                self.update_signal.emit(f"[ERROR] Lista de nodos no válida: {str(e)}", "error")
+        
+        if self.filter:
+            self.filter.start()
+        
+        # Cada sesión es un descriptor: subir el límite del proceso si se queda corto
+        raise_fd_limit(self.max_sessions + 256)
+        self.poller = SessionPoller(self.read_session, self.READ_WORKERS)
+        self.poller.start()
+        
+        self.server_socket.listen(self.backlog)
+        self.update_signal.emit(f"[ESCUCHANDO] Esperando conexiones (cola {self.backlog}, "
+                                f"máximo {self.max_sessions} sesiones)...", "system")
+        
+        # Socket no bloqueante: cada despertar acepta todas las conexiones pendientes
+        self.server_socket.setblocking(False)
         
-        # Configurar tiempo de espera para poder cerrar el hilo correctamente
-        self.server_socket.settimeout(1)
+        # Hilo que agrega y envía los cambios de presencia
+        presence_thread = threading.Thread(target=self.presence_loop)
+        presence_thread.daemon = True
+        presence_thread.start()
         
         while self.running:
             try:
-                # Aceptar conexiones
-                conn, addr = self.server_socket.accept()
-                
-                # Solicitar nombre de usuario
-                conn.send("ALIAS".encode('utf-8'))
-                alias = conn.recv(1024).decode('utf-8')
-                
-                # Almacenar conexión y alias
-                self.clients.append(conn)
-                self.aliases.append(alias)
-                self.client_count_signal.emit(len(self.clients))
-                
-                # Iniciar un hilo para manejar el cliente
-                thread = threading.Thread(target=self.handle_client, args=(conn, addr, alias))
-                thread.daemon = True
-                thread.start()
-                
-                self.update_signal.emit(f"[CONEXIONES ACTIVAS] {len(self.clients)}", "info")
-            except socket.timeout:
-                continue
+                # Esperar conexiones con tiempo límite para poder cerrar el hilo correctamente
+                readable, _, _ = select.select([self.server_socket], [], [], 1)
+                if readable:
+                    self.accept_pending()
             except Exception as e:
                 if self.running:
                     self.update_signal.emit(f"[ERROR] Error al aceptar conexión: {str(e)}", "error")
         
-        # Cerrar todas las conexiones al detener el servidor
-        for client in self.clients:
-            try:
-                client.close()
-            except:
-                pass
-        
+        # Dejar de aceptar conexiones antes de vaciar las sesiones existentes
         if self.server_socket:
             self.server_socket.close()
-            self.update_signal.emit("[DETENIDO] Servidor detenido correctamente", "system")
+        if self.federation:
+            self.federation.stop()
+        if self.filter:
+            self.filter.stop()
+        self.drain_clients()
+        self.poller.stop()
+        self.stop_capture()
+        if self.history is not None:
+            self.history.close()
+        self.update_signal.emit("[DETENIDO] Servidor detenido correctamente", "system")
+        if self.events:
+            self.events.close(self.drain_timeout)
+    
+    def abort_start(self):
+        """Arranque fallido: libera el socket y el registro de eventos (con el error ya anotado)"""
+        self.running = False
+        if self.server_socket:
+            self.server_socket.close()
+            self.server_socket = None
+        if self.events:
+            self.events.close(self.drain_timeout)
     
     def stop(self):
-        """Detiene el servidor"""
+        """Detiene el servidor de forma ordenada"""
         self.running = False
-        # Esperar a que el hilo termine
+        # Esperar a que el hilo termine (acotado por drain_timeout)
         self.wait()
 
+def format_quantity(value):
+    """Cantidad abreviada para los ejes y leyendas: 950, 12.3 k, 4.1 M"""
+    if value is None:
+        return "-"
+    for limit, suffix in ((1e9, " G"), (1e6, " M"), (1e3, " k")):
+        if abs(value) >= limit:
+            return f"{value / limit:.1f}{suffix}"
+    return f"{value:.0f}" if abs(value) >= 10 or value == int(value) else f"{value:.2f}"
+
+class ChartWidget(QWidget):
+    """Gráfica de líneas con las últimas muestras de una o varias series del panel"""
+    
+    COLORS = ("#4CAF50", "#2196F3", "#FF9800", "#E91E63")
+    
+    def __init__(self, title, series, sampler, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.names = [name for name, _ in series]  # series de ThroughputSampler
+        self.labels = [label for _, label in series]
+        self.sampler = sampler
+        self.setMinimumSize(280, 150)
+    
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        text_color = self.palette().color(QPalette.WindowText)
+        grid_color = QColor(text_color)
+        grid_color.setAlpha(60)
+        area = self.rect().adjusted(8, 26, -8, -8)
+        
+        # Título y leyenda con el último valor de cada serie
+        painter.setPen(text_color)
+        painter.drawText(8, 16, self.title)
+        x = 8 + painter.fontMetrics().width(self.title) + 16
+        for index, name in enumerate(self.names):
+            painter.setPen(QColor(self.COLORS[index % len(self.COLORS)]))
+            label = f"{self.labels[index]} {format_quantity(self.sampler.latest(name))}"
+            painter.drawText(x, 16, label)
+            x += painter.fontMetrics().width(label) + 12
+        
+        painter.setPen(QPen(grid_color, 1))
+        painter.drawRect(area)
+        series = [list(self.sampler.series.get(name, ())) for name in self.names]
+        peak = max((value for values in series for value in values if value is not None), default=0) or 1
+        painter.setPen(text_color)
+        painter.drawText(area.left() + 4, area.top() + 14, format_quantity(peak))
+        
+        # Las muestras más recientes quedan a la derecha; los huecos (None) cortan la línea
+        step = area.width() / max(self.sampler.length - 1, 1)
+        for index, values in enumerate(series):
+            painter.setPen(QPen(QColor(self.COLORS[index % len(self.COLORS)]), 1.5))
+            start = area.right() - (len(values) - 1) * step
+            points = []
+            for position, value in enumerate(values + [None]):
+                if value is None:
+                    if len(points) > 1:
+                        painter.drawPolyline(*points)
+                    points = []
+                    continue
+                points.append(QPointF(start + position * step,
+                                      area.bottom() - value / peak * (area.height() - 16)))
+        painter.end()
+
 class ServerWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.server_thread = None
         self.is_dark_mode = True  # Por defecto, tema oscuro
         self.settings = QSettings("ChatApp", "Server")
+        self.diagnostics = Diagnostics()
+        self.throughput = ThroughputSampler()  # series del panel
         self.loadSettings()
         self.initUI()
         self.setupTrayIcon()
@@ -170,6 +965,19 @@ class ServerWindow(QMainWindow):
         self.port = self.settings.value("port", default_port, type=str)
         self.auto_start = self.settings.value("autoStart", False, type=bool)
         self.minimize_to_tray = self.settings.value("minimizeToTray", False, type=bool)
+        self.drain_timeout = self.settings.value("drainTimeout", 5, type=int)
+        self.backlog = self.settings.value("backlog", 128, type=int)
+        self.max_sessions = self.settings.value("maxSessions", 1000, type=int)
+        self.certfile = self.settings.value("tlsCertFile", "", type=str)
+        self.keyfile = self.settings.value("tlsKeyFile", "", type=str)
+        self.write_tick_ms = self.settings.value("writeTickMs", DEFAULT_TICK * 1000, type=float)
+        self.trace_percent = self.settings.value("traceSamplePercent", 5.0, type=float)
+        self.rate_limit = self.settings.value("rateLimit", 0.0, type=float)
+        self.filter_path = self.settings.value("filterFile", "", type=str)
+        self.event_log_path = self.settings.value("eventLogFile", EVENT_LOG_FILE, type=str)
+        self.node_id = self.settings.value("nodeId", "", type=str)
+        self.peers = self.settings.value("peers", "", type=str)
+        self.relay_secret = self.settings.value("relaySecret", "", type=str)
     
     def saveSettings(self):
         """Guarda configuraciones"""
@@ -178,6 +986,19 @@ class ServerWindow(QMainWindow):
         self.settings.setValue("port", self.port_input.text())
         self.settings.setValue("autoStart", self.auto_start_checkbox.isChecked())
         self.settings.setValue("minimizeToTray", self.tray_checkbox.isChecked())
+        self.settings.setValue("drainTimeout", self.drain_spin.value())
+        self.settings.setValue("backlog", self.backlog_spin.value())
+        self.settings.setValue("maxSessions", self.max_sessions_spin.value())
+        self.settings.setValue("tlsCertFile", self.cert_input.text())
+        self.settings.setValue("tlsKeyFile", self.key_input.text())
+        self.settings.setValue("writeTickMs", self.write_tick_spin.value())
+        self.settings.setValue("traceSamplePercent", self.trace_spin.value())
+        self.settings.setValue("rateLimit", self.rate_limit_spin.value())
+        self.settings.setValue("filterFile", self.filter_input.text())
+        self.settings.setValue("eventLogFile", self.event_log_input.text())
+        self.settings.setValue("nodeId", self.node_input.text())
+        self.settings.setValue("peers", self.peers_input.text())
+        self.settings.setValue("relaySecret", self.relay_secret_input.text())
     
     def initUI(self):
         """Configura la interfaz de usuario"""
@@ -227,6 +1048,10 @@ class ServerWindow(QMainWindow):
         self.client_count.setAlignment(Qt.AlignCenter)
         status_layout.addWidget(self.client_count)
         
+        self.shed_count = QLabel("0 conexiones rechazadas")
+        self.shed_count.setAlignment(Qt.AlignCenter)
+        status_layout.addWidget(self.shed_count)
+        
         header_layout.addWidget(status_box)
         
         main_layout.addLayout(header_layout)
@@ -313,6 +1138,24 @@ class ServerWindow(QMainWindow):
         # Añadir la pestaña principal
         tab_widget.addTab(main_tab, "Principal")
         
+        # Tab del panel: gráficas de contadores muestreados una vez por segundo en update_time,
+        # de modo que mirarlas no añade trabajo por mensaje
+        dashboard_tab = QWidget()
+        dashboard_layout = QGridLayout(dashboard_tab)
+        self.charts = [
+            ChartWidget("Mensajes/s", [("mensajes/s", "")], self.throughput),
+            ChartWidget("Bytes/s", [("bytes_recibidos/s", "entrada"), ("bytes_enviados/s", "salida")],
+                        self.throughput),
+            ChartWidget("Sesiones activas", [("sesiones", "")], self.throughput),
+            ChartWidget("Latencia de difusión (ms)", [("difusion p50", "p50"), ("difusion p99", "p99")],
+                        self.throughput),
+            ChartWidget("Colas de salida (tramas)", [("cola_total", "total"), ("cola_maxima", "máxima")],
+                        self.throughput),
+        ]
+        for index, chart in enumerate(self.charts):
+            dashboard_layout.addWidget(chart, index // 2, index % 2)
+        tab_widget.addTab(dashboard_tab, "Panel")
+        
         # Tab de Configuración
         settings_tab = QWidget()
         settings_layout = QVBoxLayout(settings_tab)
@@ -341,12 +1184,157 @@ class ServerWindow(QMainWindow):
         self.tray_checkbox.setChecked(self.minimize_to_tray)
         options_layout.addWidget(self.tray_checkbox)
         
+        # Tiempo máximo para vaciar colas al detener el servidor
+        drain_layout = QHBoxLayout()
+        drain_layout.addWidget(QLabel("Tiempo máximo de cierre ordenado (s):"))
+        self.drain_spin = QSpinBox()
+        self.drain_spin.setRange(1, 120)
+        self.drain_spin.setValue(self.drain_timeout)
+        drain_layout.addWidget(self.drain_spin)
+        drain_layout.addStretch()
+        options_layout.addLayout(drain_layout)
+        
+        # Control de admisión
+        admission_layout = QHBoxLayout()
+        admission_layout.addWidget(QLabel("Cola de conexiones:"))
+        self.backlog_spin = QSpinBox()
+        self.backlog_spin.setRange(5, 65535)
+        self.backlog_spin.setValue(self.backlog)
+        admission_layout.addWidget(self.backlog_spin)
+        admission_layout.addWidget(QLabel("Máximo de sesiones:"))
+        self.max_sessions_spin = QSpinBox()
+        self.max_sessions_spin.setRange(1, 100000)
+        self.max_sessions_spin.setValue(self.max_sessions)
+        admission_layout.addWidget(self.max_sessions_spin)
+        admission_layout.addStretch()
+        options_layout.addLayout(admission_layout)
+        
+        # Agrupación de escrituras: más tick = menos escrituras pero más latencia
+        tick_layout = QHBoxLayout()
+        tick_layout.addWidget(QLabel("Micro-tick de envío (ms):"))
+        self.write_tick_spin = QDoubleSpinBox()
+        self.write_tick_spin.setRange(0, 50)
+        self.write_tick_spin.setSingleStep(0.5)
+        self.write_tick_spin.setValue(self.write_tick_ms)
+        tick_layout.addWidget(self.write_tick_spin)
+        # Muestreo de trazas de latencia (0 = desactivado)
+        tick_layout.addWidget(QLabel("Mensajes trazados (%):"))
+        self.trace_spin = QDoubleSpinBox()
+        self.trace_spin.setRange(0, 100)
+        self.trace_spin.setValue(self.trace_percent)
+        tick_layout.addWidget(self.trace_spin)
+        # Límite de ritmo por usuario en la cadena de mensajes (0 = sin límite)
+        tick_layout.addWidget(QLabel("Mensajes/s por usuario:"))
+        self.rate_limit_spin = QDoubleSpinBox()
+        self.rate_limit_spin.setRange(0, 1000)
+        self.rate_limit_spin.setSpecialValueText("Sin límite")
+        self.rate_limit_spin.setValue(self.rate_limit)
+        tick_layout.addWidget(self.rate_limit_spin)
+        tick_layout.addStretch()
+        options_layout.addLayout(tick_layout)
+        
+        # TLS: si se indica un certificado, las conexiones se cifran
+        tls_layout = QGridLayout()
+        tls_layout.addWidget(QLabel("Certificado TLS (PEM):"), 0, 0)
+        self.cert_input = QLineEdit()
+        self.cert_input.setPlaceholderText("Vacío = sin cifrar")
+        self.cert_input.setToolTip("La reanudación de sesiones ahorra CPU sobre todo con TLS 1.2; "
+                                   "en TLS 1.3 se repite el intercambio de claves y, con una clave EC, "
+                                   "la mejora es mínima")
+        self.cert_input.setText(self.certfile)
+        tls_layout.addWidget(self.cert_input, 0, 1)
+        tls_layout.addWidget(QLabel("Clave privada (PEM):"), 1, 0)
+        self.key_input = QLineEdit()
+        self.key_input.setPlaceholderText("Vacío = incluida en el certificado")
+        self.key_input.setText(self.keyfile)
+        tls_layout.addWidget(self.key_input, 1, 1)
+        options_layout.addLayout(tls_layout)
+        
+        # Filtro de términos: el fichero se recarga solo cuando se modifica
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Términos prohibidos:"))
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Vacío = sin filtro")
+        self.filter_input.setText(self.filter_path)
+        filter_layout.addWidget(self.filter_input)
+        # Registro de eventos en disco (rota a los 10 MB o cada día)
+        filter_layout.addWidget(QLabel("Registro de eventos:"))
+        self.event_log_input = QLineEdit()
+        self.event_log_input.setPlaceholderText("Vacío = sin registro")
+        self.event_log_input.setText(self.event_log_path)
+        filter_layout.addWidget(self.event_log_input)
+        options_layout.addLayout(filter_layout)
+        
+        # Federación: enlaces con otros servidores (solo si hay clave compartida)
+        federation_layout = QGridLayout()
+        federation_layout.addWidget(QLabel("Nombre del nodo:"), 0, 0)
+        self.node_input = QLineEdit()
+        self.node_input.setPlaceholderText("Vacío = host:puerto")
+        self.node_input.setText(self.node_id)
+        federation_layout.addWidget(self.node_input, 0, 1)
+        federation_layout.addWidget(QLabel("Otros nodos:"), 1, 0)
+        self.peers_input = QLineEdit()
+        self.peers_input.setPlaceholderText("host:puerto, host:puerto")
+        self.peers_input.setText(self.peers)
+        federation_layout.addWidget(self.peers_input, 1, 1)
+        federation_layout.addWidget(QLabel("Clave de federación:"), 2, 0)
+        self.relay_secret_input = QLineEdit()
+        self.relay_secret_input.setEchoMode(QLineEdit.Password)
+        self.relay_secret_input.setPlaceholderText("Vacío = sin federación")
+        self.relay_secret_input.setText(self.relay_secret)
+        federation_layout.addWidget(self.relay_secret_input, 2, 1)
+        options_layout.addLayout(federation_layout)
+        
         settings_layout.addWidget(options_group)
         settings_layout.addStretch()
         
         # Añadir la pestaña de configuración
         tab_widget.addTab(settings_tab, "Configuración")
         
+        # Tab de Diagnóstico: perfilado y memoria sin reiniciar el servidor
+        diagnostics_tab = QWidget()
+        diagnostics_layout = QVBoxLayout(diagnostics_tab)
+        
+        profile_group = QGroupBox("Perfilado y memoria")
+        profile_layout = QGridLayout(profile_group)
+        profile_layout.addWidget(QLabel("Intervalo de muestreo (ms):"), 0, 0)
+        self.sample_interval_spin = QDoubleSpinBox()
+        self.sample_interval_spin.setRange(0.5, 100)
+        self.sample_interval_spin.setValue(5)
+        profile_layout.addWidget(self.sample_interval_spin, 0, 1)
+        self.profile_button = QPushButton("Iniciar muestreo")
+        self.profile_button.clicked.connect(self.toggle_profiler)
+        profile_layout.addWidget(self.profile_button, 0, 2)
+        self.memory_button = QPushButton("Activar tracemalloc")
+        self.memory_button.clicked.connect(self.toggle_memory_tracing)
+        profile_layout.addWidget(self.memory_button, 1, 0)
+        self.snapshot_button = QPushButton("Instantánea de memoria")
+        self.snapshot_button.setEnabled(False)
+        self.snapshot_button.clicked.connect(lambda: self.run_diagnostic("memoria instantanea"))
+        profile_layout.addWidget(self.snapshot_button, 1, 1)
+        stacks_button = QPushButton("Volcar pilas de hilos")
+        stacks_button.clicked.connect(lambda: self.run_diagnostic("pilas"))
+        profile_layout.addWidget(stacks_button, 1, 2)
+        diagnostics_layout.addWidget(profile_group)
+        
+        # Captura del tráfico entrante para reproducirlo después con replay.py
+        capture_group = QGroupBox("Captura de tráfico")
+        capture_layout = QHBoxLayout(capture_group)
+        capture_layout.addWidget(QLabel("Graba lo que envían las conexiones nuevas, con sus tiempos"))
+        self.capture_button = QPushButton("Iniciar captura")
+        self.capture_button.clicked.connect(self.toggle_capture)
+        capture_layout.addWidget(self.capture_button)
+        diagnostics_layout.addWidget(capture_group)
+        
+        self.diagnostics_output = QTextEdit()
+        self.diagnostics_output.setReadOnly(True)
+        self.diagnostics_output.setFont(QFont("Consolas", 9))
+        self.diagnostics_output.setPlaceholderText(
+            f"Los resultados se guardan en la carpeta '{self.diagnostics.directory}'")
+        diagnostics_layout.addWidget(self.diagnostics_output)
+        
+        tab_widget.addTab(diagnostics_tab, "Diagnóstico")
+        
         main_layout.addWidget(tab_widget)
         
         # Barra de estado
@@ -421,7 +1409,68 @@ class ServerWindow(QMainWindow):
     def update_time(self):
         """Actualiza el tiempo en la barra de estado"""
         current_time = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        self.statusBar().showMessage(f"Servidor de Chat | {current_time}")
+        status = f"Servidor de Chat | {current_time}"
+        
+        # Métricas muestreadas una vez por segundo
+        if self.server_thread and self.server_thread.isRunning():
+            self.throughput.add(self.server_thread.sample())
+            for chart in self.charts:
+                chart.update()
+        if self.server_thread:
+            shed = self.server_thread.metrics["rechazadas"]
+            self.shed_count.setText(f"{shed} conexi{'ones' if shed != 1 else 'ón'} rechazada{'s' if shed != 1 else ''}")
+            latency = self.server_thread.latency.summary(("servidor", "total"))
+            if latency:
+                status += f" | Latencia: {latency}"
+            if self.server_thread.capture:
+                status += f" | Capturando ({self.server_thread.capture.events} eventos)"
+            else:
+                self.capture_button.setText("Iniciar captura")
+        self.statusBar().showMessage(status)
+    
+    def run_diagnostic(self, command):
+        """Ejecuta una orden de diagnóstico y muestra el resultado"""
+        result = self.diagnostics.command(command)
+        self.diagnostics_output.append(f"> {command}\n{result}\n")
+        self.append_log(f"[DIAGNÓSTICO] {result.splitlines()[-1]}", "system")
+    
+    def toggle_profiler(self):
+        """Inicia o detiene el muestreo de pilas"""
+        if self.diagnostics.sampler.running:
+            self.run_diagnostic("perfil detener")
+            self.profile_button.setText("Iniciar muestreo")
+        else:
+            self.run_diagnostic(f"perfil iniciar {self.sample_interval_spin.value():g}")
+            self.profile_button.setText("Detener muestreo")
+    
+    def toggle_capture(self):
+        """Inicia o detiene la captura de tráfico del servidor en marcha"""
+        if not self.server_thread or not self.server_thread.isRunning():
+            QMessageBox.warning(self, "Advertencia", "Inicie el servidor antes de capturar tráfico.")
+            return
+        if self.server_thread.capture:
+            self.server_thread.stop_capture()
+        else:
+            name = f"captura-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.bin.gz"
+            path, _ = QFileDialog.getSaveFileName(self, "Guardar captura", name,
+                                                  "Capturas (*.bin.gz *.bin)")
+            if not path:
+                return
+            try:
+                self.server_thread.start_capture(path)
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"No se pudo crear la captura: {str(e)}")
+        self.capture_button.setText("Detener captura" if self.server_thread.capture else "Iniciar captura")
+    
+    def toggle_memory_tracing(self):
+        """Activa o desactiva tracemalloc"""
+        if self.diagnostics.memory.running:
+            self.run_diagnostic("memoria detener")
+        else:
+            self.run_diagnostic("memoria iniciar")
+        tracing = self.diagnostics.memory.running
+        self.memory_button.setText("Desactivar tracemalloc" if tracing else "Activar tracemalloc")
+        self.snapshot_button.setEnabled(tracing)
     
     def change_theme(self, index):
         """Cambia el tema según la selección del combobox"""
@@ -576,6 +1625,8 @@ class ServerWindow(QMainWindow):
     
     def append_log(self, message, type="info"):
         """Añade un mensaje al área de registro con formato por tipo"""
+        if self.server_thread and not self.server_thread.log_enabled(type):
+            return
         current_time = datetime.datetime.now().strftime("%H:%M:%S")
         
         # Define formatos para diferentes tipos de mensajes
@@ -625,7 +1676,21 @@ class ServerWindow(QMainWindow):
                 if not host:
                     QMessageBox.warning(self, "Advertencia", "Por favor, ingrese una dirección IP válida.")
                     return
-                self.server_thread = ServerThread(host, port)
+                self.throughput.clear()
+                self.server_thread = ServerThread(host, port, drain_timeout=self.drain_spin.value(),
+                                                  backlog=self.backlog_spin.value(),
+                                                  max_sessions=self.max_sessions_spin.value(),
+                                                  certfile=self.cert_input.text() or None,
+                                                  keyfile=self.key_input.text() or None,
+                                                  write_tick=self.write_tick_spin.value() / 1000,
+                                                  trace_sample=self.trace_spin.value() / 100,
+                                                  node_id=self.node_input.text() or None,
+                                                  peers=[peer for peer in self.peers_input.text().split(",")
+                                                         if peer.strip()],
+                                                  relay_secret=self.relay_secret_input.text() or None,
+                                                  rate_limit=self.rate_limit_spin.value(),
+                                                  filter_path=self.filter_input.text() or None,
+                                                  event_log_path=self.event_log_input.text() or None)
                 self.server_thread.update_signal.connect(self.append_log)
                 self.server_thread.client_count_signal.connect(self.update_client_count)
                 self.server_thread.start()
@@ -722,7 +1787,177 @@ class ServerWindow(QMainWindow):
             else:
                 event.accept()
 
+def main_headless(args):
+    """Ejecuta el servidor sin interfaz gráfica (por ejemplo en Render)"""
+    app = QCoreApplication(sys.argv)
+    server_thread = ServerThread(args.host, args.port, drain_timeout=args.drain_timeout,
+                                 backlog=args.backlog, max_sessions=args.max_sessions,
+                                 certfile=args.certfile, keyfile=args.keyfile,
+                                 write_tick=args.write_tick_ms / 1000,
+                                 trace_sample=args.trace_sample,
+                                 history_path=args.history, node_id=args.node_id,
+                                 peers=args.peer, relay_secret=args.relay_secret,
+                                 rate_limit=args.rate_limit, filter_path=args.filter,
+                                 event_log_path=args.event_log,
+                                 event_log_max_bytes=int(args.event_log_max_mb * 2**20),
+                                 event_log_rotate_seconds=args.event_log_hours * 3600,
+                                 attachments_path=args.attachments)
+    
+    def print_log(message, type):
+        if not server_thread.log_enabled(type):
+            return
+        current_time = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{current_time}] {message}", flush=True)
+    
+    def request_stop(signum, frame):
+        # El hilo avisa a los clientes, vacía las colas y termina por sí mismo
+        server_thread.running = False
+    
+    diagnostics = Diagnostics(args.diagnostics_dir)
+    
+    def run_diagnostic(command):
+        for line in diagnostics.command(command).splitlines():
+            print_log(f"[DIAGNÓSTICO] {line}", "system")
+    
+    def diagnostic_signal(signum, frame):
+        # SIGUSR1 vuelca las pilas; SIGUSR2 inicia o detiene el muestreo
+        if signum == signal.SIGUSR1:
+            run_diagnostic("pilas")
+        elif diagnostics.sampler.running:
+            run_diagnostic("perfil detener")
+        else:
+            run_diagnostic("perfil iniciar")
+    
+    admin = AdminCommands(server_thread)
+    
+    def console_command(line):
+        # Órdenes de la consola y del socket de administración: "diag", "captura" y las de AdminCommands
+        words = line.split(None, 1)
+        argument = words[1].strip() if len(words) > 1 else ""
+        if words and words[0] == "diag":
+            return diagnostics.command(argument)
+        if words and words[0] == "captura":
+            try:
+                if argument and argument != "detener":
+                    server_thread.start_capture(argument)
+                    return f"Grabando las conexiones nuevas en {argument}"
+                server_thread.stop_capture()
+                return "Captura detenida"
+            except OSError as e:
+                return f"No se pudo crear la captura: {e}"
+        reply = admin.command(line)
+        if reply == admin.HELP:
+            reply += "\n  diag <orden>               diagnóstico (diag ayuda)\n  captura <fichero>|detener  captura de tráfico"
+        return reply
+    
+    def command_loop():
+        # Consola de administración por la entrada estándar
+        for line in sys.stdin:
+            if line.strip():
+                for reply_line in console_command(line).splitlines():
+                    print(reply_line, flush=True)
+    
+    admin_server = None
+    if args.admin_socket:
+        admin_server = AdminServer(args.admin_socket, console_command)
+        try:
+            admin_server.start()
+            print_log(f"[ADMIN] Socket de administración en {args.admin_socket} (python admin.py)", "system")
+        except OSError as e:
+            print_log(f"[ADMIN] No se pudo crear el socket de administración: {e}", "warning")
+            admin_server = None
+    
+    server_thread.update_signal.connect(print_log)
+    server_thread.finished.connect(app.quit)
+    if args.capture:
+        server_thread.start_capture(args.capture)
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, diagnostic_signal)
+        signal.signal(signal.SIGUSR2, diagnostic_signal)
+    if sys.stdin and not sys.stdin.closed:
+        threading.Thread(target=command_loop, daemon=True).start()
+    
+    # Resumen de latencias una vez por minuto, solo si ha cambiado
+    last_latency = [""]
+    
+    def print_latency():
+        summary = server_thread.latency.summary()
+        if summary and summary != last_latency[0]:
+            print_log(f"[LATENCIA] {summary}", "info")
+            for line in server_thread.pipeline.summary().splitlines():
+                print_log(f"[ETAPAS] {line}", "info")
+            last_latency[0] = summary
+    
+    latency_timer = QTimer()
+    latency_timer.timeout.connect(print_latency)
+    latency_timer.start(60000)
+    
+    # Devolver el control a Python periódicamente para atender las señales
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(200)
+    
+    server_thread.start()
+    code = app.exec_()
+    if admin_server:
+        admin_server.stop()
+    sys.exit(code)
+
+def parse_args():
+    """Argumentos de línea de comandos del servidor"""
+    parser = argparse.ArgumentParser(description="Servidor de Chat")
+    parser.add_argument("--headless", action="store_true", help="ejecutar sin interfaz gráfica")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "10000")))
+    parser.add_argument("--drain-timeout", type=float, default=5.0,
+                        help="segundos máximos para vaciar colas al detenerse")
+    parser.add_argument("--backlog", type=int, default=128, help="cola de conexiones pendientes")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="máximo de sesiones simultáneas")
+    parser.add_argument("--certfile", help="certificado TLS en PEM (activa el cifrado; la reanudación "
+                        "de sesiones solo ahorra CPU de forma apreciable con TLS 1.2 o claves RSA)")
+    parser.add_argument("--keyfile", help="clave privada TLS en PEM")
+    parser.add_argument("--write-tick-ms", type=float, default=DEFAULT_TICK * 1000,
+                        help="micro-tick de agrupación de escrituras en milisegundos")
+    parser.add_argument("--history", default=HISTORY_FILE,
+                        help="fichero del historial de mensajes (vacío = sin historial)")
+    parser.add_argument("--attachments", default=ATTACHMENTS_DIR,
+                        help="carpeta del almacén de adjuntos (vacío = sin adjuntos)")
+    parser.add_argument("--event-log", default=EVENT_LOG_FILE,
+                        help="registro de eventos en JSON-lines (vacío = sin registro)")
+    parser.add_argument("--event-log-max-mb", type=float, default=10,
+                        help="tamaño a partir del cual rota el registro de eventos")
+    parser.add_argument("--event-log-hours", type=float, default=24,
+                        help="horas tras las que rota el registro de eventos")
+    parser.add_argument("--node-id", help="nombre de este servidor en la federación (por defecto host:puerto)")
+    parser.add_argument("--peer", action="append", default=[],
+                        help="otro servidor con el que enlazar, host:puerto (se puede repetir)")
+    parser.add_argument("--relay-secret", default=os.environ.get("RELAY_SECRET"),
+                        help="clave compartida de la federación (o variable RELAY_SECRET)")
+    parser.add_argument("--admin-socket",
+                        help="socket Unix de administración (por defecto uno por puerto en el directorio "
+                             "temporal; vacío para desactivarlo)")
+    parser.add_argument("--capture", help="grabar el tráfico entrante en este fichero (.gz = comprimido)")
+    parser.add_argument("--filter", help="fichero de términos prohibidos (se recarga al modificarlo)")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="mensajes por segundo permitidos a cada usuario (0 = sin límite)")
+    parser.add_argument("--trace-sample", type=float, default=0.05,
+                        help="fracción de mensajes con trazas de latencia (0 = desactivado)")
+    parser.add_argument("--diagnostics-dir", default=DEFAULT_DIRECTORY,
+                        help="carpeta donde se guardan perfiles, instantáneas y volcados de pilas")
+    # Los argumentos desconocidos se dejan para Qt
+    args, _ = parser.parse_known_args()
+    if args.admin_socket is None:
+        args.admin_socket = admin_socket_path(args.port)
+    return args
+
 def main():
+    args = parse_args()
+    if args.headless:
+        main_headless(args)
+        return
+    
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # Estilo moderno
     window = ServerWindow()
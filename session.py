@@ -0,0 +1,71 @@
+# Sesión de un cliente conectado al servidor (sin Qt)
+import socket
+import time
+from output import OutputScheduler, DEFAULT_TICK
+
+class ClientSession:
+    """Conexión de un cliente con su propia cola de salida.
+
+    Los envíos solo encolan la trama; el planificador de salida de la sesión
+    la vuelca al socket agrupada por micro-ticks, de modo que un cliente lento
+    no bloquea el reparto a los demás.
+    """
+
+    # Tramas pendientes a partir de las cuales se considera que el cliente no da abasto
+    MAX_PENDING = 1000
+    # Segundos sin nada que enviar tras los que el hilo escritor termina
+    WRITER_IDLE = 5.0
+
+    # Una sesión inactiva es solo este objeto, su lector y su cola de salida
+    __slots__ = ("conn", "addr", "alias", "room", "reader", "output", "closed", "since", "received")
+
+    def __init__(self, conn, addr, alias, room, tick=DEFAULT_TICK, reader=None):
+        self.conn = conn
+        self.addr = addr
+        self.alias = alias
+        self.room = room
+        self.reader = reader
+        self.output = OutputScheduler(conn, tick, self.MAX_PENDING, on_error=self.abort,
+                                      idle_timeout=self.WRITER_IDLE)
+        self.closed = False
+        self.since = time.time()
+        self.received = 0  # tramas recibidas del cliente
+
+    def start(self):
+        """Arranca el hilo escritor"""
+        self.output.start()
+
+    def send(self, data):
+        """Encola una trama; devuelve False si la sesión está cerrada o saturada"""
+        if self.closed:
+            return False
+        return self.output.send(data)
+
+    def send_many(self, frames):
+        """Encola una ráfaga de tramas como un único bloque"""
+        if self.closed:
+            return False
+        return self.output.send_many(frames)
+
+    def drain(self, timeout):
+        """Envía lo pendiente y espera al hilo escritor como mucho 'timeout' segundos"""
+        return self.output.drain(timeout)
+
+    def abort(self):
+        """Corta la conexión sin cerrar el socket: quien lee recibe fin de datos y da de baja la sesión"""
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        """Cierra el socket; desbloquea tanto al lector como al escritor"""
+        if self.closed:
+            return
+        self.closed = True
+        self.output.fail()
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
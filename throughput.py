@@ -0,0 +1,56 @@
+# Series temporales del panel del servidor a partir de contadores muestreados (sin Qt)
+from collections import deque
+from latency import Histogram, BUCKETS
+
+# Puntos que se conservan por serie (uno por muestra: 5 minutos a una muestra por segundo)
+HISTORY_POINTS = 300
+# Contadores acumulados que se muestran como ritmo por segundo
+RATES = ("mensajes", "bytes_recibidos", "bytes_enviados")
+# Valores instantáneos que se muestran tal cual
+GAUGES = ("sesiones", "cola_total", "cola_maxima")
+# Histogramas acumulados de los que se muestran percentiles del último intervalo
+PERCENTILES = {"difusion": (0.5, 0.99)}
+
+class ThroughputSampler:
+    """Convierte muestras de contadores acumulados en series de ritmos y percentiles.
+
+    Cada muestra es un diccionario con "hora" (time.monotonic), los contadores de
+    RATES, los valores de GAUGES y los contadores de cubos de los histogramas de
+    PERCENTILES. Un contador que retrocede (servidor reiniciado) reinicia el ritmo.
+    """
+
+    def __init__(self, length=HISTORY_POINTS):
+        self.length = length
+        self.series = {}  # nombre -> deque de valores (None = sin datos en ese intervalo)
+        self.previous = None
+
+    def append(self, name, value):
+        self.series.setdefault(name, deque(maxlen=self.length)).append(value)
+
+    def add(self, sample):
+        previous, self.previous = self.previous, sample
+        elapsed = sample["hora"] - previous["hora"] if previous else 0
+        for name in RATES:
+            if elapsed > 0 and sample[name] >= previous[name]:
+                self.append(f"{name}/s", (sample[name] - previous[name]) / elapsed)
+            else:
+                self.append(f"{name}/s", None)
+        for name in GAUGES:
+            self.append(name, sample[name])
+        for name, fractions in PERCENTILES.items():
+            histogram = Histogram()
+            if previous:
+                histogram.counts = [max(now - before, 0) for now, before in zip(sample[name], previous[name])]
+            for fraction in fractions:
+                value = histogram.percentile(fraction)
+                # Por encima del último cubo solo se sabe que es "más de"
+                self.append(f"{name} p{fraction * 100:g}", min(value, BUCKETS[-1]) if value is not None else None)
+
+    def latest(self, name):
+        """Último valor de una serie (None si no hay)"""
+        values = self.series.get(name)
+        return values[-1] if values else None
+
+    def clear(self):
+        self.series.clear()
+        self.previous = None
@@ -0,0 +1,189 @@
+# Miniaturas de imágenes adjuntas: grupo de procesos, caché en disco y LRU acotada en memoria
+#
+# Decodificar una foto de varios megapíxeles lleva decenas de milisegundos y mucha
+# memoria: se hace en otros procesos (sin bloquear la interfaz ni competir por el GIL),
+# el resultado se guarda en disco por hash de contenido y tamaño, y la ventana solo
+# mantiene en memoria las miniaturas que se han visto hace poco.
+import hashlib
+import multiprocessing
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from attachments import ChunkStore
+
+THUMBNAIL_SIZE = 240  # lado del cuadrado de la miniatura (píxeles)
+THUMBNAIL_DIR = os.path.join(os.path.expanduser("~"), ".chatapp", "miniaturas")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+# Imágenes más grandes no se descargan solo para la miniatura
+MAX_SOURCE = 8 * 2**20
+# Por encima de estos píxeles la imagen no se decodifica (bombas de descompresión)
+MAX_PIXELS = 50 * 10**6
+# Memoria máxima de las miniaturas decodificadas en la ventana
+PIXMAP_CACHE_BYTES = 32 * 2**20
+
+def is_image(name, size=None):
+    """Indica si un adjunto tiene miniatura: extensión de imagen y no más de MAX_SOURCE"""
+    return str(name).lower().endswith(IMAGE_EXTENSIONS) and (size is None or 0 < size <= MAX_SOURCE)
+
+def render_thumbnail(chunk_dir, file_id, hashes, target, size):
+    """Se ejecuta en un proceso del grupo: une los trozos, decodifica a escala y guarda un PNG.
+
+    La imagen se reduce sin deformarla y se centra en un cuadrado transparente de
+    size x size: todas las miniaturas ocupan lo mismo y el chat no se recoloca al
+    sustituir el marcador.
+    """
+    from PyQt5.QtCore import Qt, QBuffer, QByteArray
+    from PyQt5.QtGui import QImage, QImageReader, QPainter
+    store = ChunkStore(chunk_dir)
+    data = b"".join(store.get(digest) for digest in hashes)
+    if hashlib.sha256(data).hexdigest() != file_id:
+        raise ValueError("los trozos no forman la imagen")
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QBuffer.ReadOnly)
+    reader = QImageReader(buffer)
+    original = reader.size()
+    if original.isValid():
+        if original.width() * original.height() > MAX_PIXELS:
+            raise ValueError("imagen demasiado grande")
+        # Con JPEG el decodificador ya reduce al leer: menos tiempo y memoria
+        reader.setScaledSize(original.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(f"no se pudo decodificar: {reader.errorString()}")
+    image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    canvas = QImage(size, size, QImage.Format_ARGB32_Premultiplied)
+    canvas.fill(Qt.transparent)
+    painter = QPainter(canvas)
+    painter.drawImage((size - image.width()) // 2, (size - image.height()) // 2, image)
+    painter.end()
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temporary = f"{target}.{uuid.uuid4().hex}.tmp"
+    if not canvas.save(temporary, "PNG"):
+        raise OSError("no se pudo guardar la miniatura")
+    os.replace(temporary, target)
+    return target
+
+class Thumbnailer:
+    """Genera miniaturas en un grupo de procesos con caché en disco.
+
+    Las peticiones simultáneas de una misma imagen comparten un solo trabajo. El
+    callback(id, ruta) (ruta vacía si falló) se llama desde un hilo auxiliar: la
+    interfaz debe pasarlo a su propio hilo con una señal de Qt.
+    """
+
+    def __init__(self, directory=THUMBNAIL_DIR, size=THUMBNAIL_SIZE, workers=2):
+        self.directory = directory
+        self.size = size
+        self.workers = workers
+        self._executor = None  # arrancar procesos cuesta: se crea con la primera miniatura
+        self._lock = threading.Lock()
+        self._waiters = {}  # id -> [callback, ...] de los trabajos en curso
+
+    def path(self, file_id):
+        return os.path.join(self.directory, file_id[:2], f"{file_id}-{self.size}.png")
+
+    def cached(self, file_id):
+        """Ruta de la miniatura si ya está en disco; None si hay que generarla"""
+        path = self.path(file_id)
+        return path if os.path.exists(path) else None
+
+    def request(self, file_id, chunk_dir, hashes, callback):
+        """Pide la miniatura de una imagen cuyos trozos están en chunk_dir"""
+        path = self.cached(file_id)
+        if path:
+            callback(file_id, path)
+            return
+        with self._lock:
+            if file_id in self._waiters:
+                self._waiters[file_id].append(callback)
+                return
+            self._waiters[file_id] = [callback]
+            if self._executor is None:
+                # spawn: un fork de un proceso con Qt e hilos no es seguro
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            executor = self._executor
+        try:
+            future = executor.submit(render_thumbnail, chunk_dir, file_id, hashes, self.path(file_id), self.size)
+        except (BrokenProcessPool, RuntimeError):
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            self._resolve(file_id, "")
+            return
+        future.add_done_callback(lambda future: self._finish(file_id, executor, future))
+
+    def _finish(self, file_id, executor, future):
+        try:
+            path = future.result()
+        except BrokenProcessPool:
+            # Un proceso murió (por ejemplo, con una imagen maliciosa): el siguiente trabajo usa otro grupo
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            path = ""
+        except Exception:
+            path = ""
+        self._resolve(file_id, path)
+
+    def _resolve(self, file_id, path):
+        with self._lock:
+            callbacks = self._waiters.pop(file_id, [])
+        for callback in callbacks:
+            try:
+                callback(file_id, path)
+            except Exception:
+                pass
+
+    def shutdown(self):
+        """Detiene el grupo de procesos sin esperar a los trabajos en curso"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+class SizedLRU:
+    """LRU acotada por el coste total de sus entradas (por ejemplo, bytes de imagen).
+
+    on_evict(clave, valor) se llama al expulsar una entrada para que su dueño la
+    sustituya. No es segura entre hilos: se usa desde el hilo de la interfaz.
+    """
+
+    def __init__(self, max_cost=PIXMAP_CACHE_BYTES, on_evict=None):
+        self.max_cost = max_cost
+        self.on_evict = on_evict
+        self.cost = 0
+        self._data = OrderedDict()  # clave -> (valor, coste)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, cost):
+        if key in self._data:
+            self.cost -= self._data.pop(key)[1]
+        self._data[key] = (value, cost)
+        self.cost += cost
+        # La entrada recién puesta se conserva aunque sola supere el máximo
+        while self.cost > self.max_cost and len(self._data) > 1:
+            old_key, (old_value, old_cost) = self._data.popitem(last=False)
+            self.cost -= old_cost
+            if self.on_evict:
+                self.on_evict(old_key, old_value)
+
+    def clear(self):
+        self._data.clear()
+        self.cost = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,79 @@
+# Contextos TLS del cliente y del servidor (sin Qt)
+import ipaddress
+import os
+import ssl
+import subprocess
+import threading
+from functools import lru_cache
+
+def server_context(certfile, keyfile):
+    """Contexto TLS del servidor con tickets de sesión para reanudar conexiones.
+
+    En TLS 1.2 un cliente que reconecta presentando su ticket evita el
+    intercambio de claves y la firma, lo que más CPU consume en una avalancha
+    de reconexiones. En TLS 1.3 (lo que negocian los clientes actuales) la
+    reanudación repite el intercambio ECDHE y solo ahorra la firma: con una
+    clave EC apenas se nota; con una RSA algo más (ver bench_tls.py).
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile)
+    # Tickets de sesión (TLS 1.2 y 1.3); OpenSSL los activa por defecto, pero se explicita
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = 2
+    return context
+
+def client_context(cafile=None, verify=True):
+    """Contexto TLS del cliente; cafile permite confiar en un certificado propio"""
+    context = ssl.create_default_context(cafile=cafile or None)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+@lru_cache(maxsize=None)
+def shared_client_context(cafile=None, verify=True):
+    """Contexto de cliente compartido: una sesión TLS solo se reanuda con el contexto que la creó"""
+    return client_context(cafile, verify)
+
+class SessionCache:
+    """Guarda la última sesión TLS por servidor para reanudarla al reconectar"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # (host, puerto) -> ssl.SSLSession
+
+    def get(self, host, port):
+        with self._lock:
+            return self._sessions.get((host, port))
+
+    def store(self, host, port, tls_socket):
+        """Guarda la sesión si el servidor emitió un ticket reanudable"""
+        session = tls_socket.session
+        if session is not None and session.has_ticket:
+            with self._lock:
+                self._sessions[(host, port)] = session
+
+# Caché compartida por todas las conexiones del proceso
+session_cache = SessionCache()
+
+def generate_self_signed(certfile, keyfile, host="localhost", days=365, key_type="ec"):
+    """Genera un certificado autofirmado con la herramienta openssl (uso local y pruebas)"""
+    for path in (certfile, keyfile):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+    try:
+        ipaddress.ip_address(host)
+        names = f"IP:{host}"
+    except ValueError:
+        names = f"DNS:{host}"
+    if host != "127.0.0.1":
+        names += ",IP:127.0.0.1"
+    if key_type == "rsa":
+        key_args = ["-newkey", "rsa:2048"]
+    else:
+        key_args = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"]
+    subprocess.run(["openssl", "req", "-x509", *key_args, "-nodes", "-keyout", keyfile, "-out", certfile, "-days", str(days),
+                    "-subj", f"/CN={host}", "-addext", f"subjectAltName={names}"],
+                   check=True, capture_output=True)
@@ -0,0 +1,160 @@
+# Vista previa de enlaces: descarga de títulos en segundo plano con caché (sin Qt)
+import html
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+URL_PATTERN = re.compile(r'https?://[^\s<>"\']+')
+
+def find_urls(text):
+    """Devuelve los enlaces http(s) de un texto (sin regex si no hay ninguno)"""
+    if "http" not in text:
+        return []
+    return URL_PATTERN.findall(text)
+
+class TTLCache:
+    """Caché LRU acotada en número de entradas, con caducidad por entrada"""
+
+    def __init__(self, maxsize=512, ttl=3600, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # clave -> (caduca, valor)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+class _TitleParser(HTMLParser):
+    """Extrae og:title o, en su defecto, el contenido de <title>"""
+
+    def __init__(self):
+        super().__init__()
+        self.title = ""
+        self.og_title = ""
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attrs = dict(attrs)
+            if attrs.get("property") == "og:title" and attrs.get("content"):
+                self.og_title = attrs["content"]
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+def extract_title(document):
+    """Devuelve el título de una página HTML, normalizado y recortado"""
+    parser = _TitleParser()
+    try:
+        parser.feed(document)
+    except Exception:
+        pass
+    title = " ".join((parser.og_title or parser.title).split())
+    return html.unescape(title)[:200]
+
+def fetch_title(url, timeout=3.0, max_bytes=64 * 1024):
+    """Descarga como mucho max_bytes de la página y devuelve su título ('' si no hay)"""
+    import urllib.request  # arrastra http.client y ssl: solo se carga al primer enlace
+    request = urllib.request.Request(url, headers={"User-Agent": "ChatApp-LinkPreview/1.0",
+                                                   "Accept": "text/html"})
+    deadline = time.monotonic() + timeout
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        if "html" not in response.headers.get("Content-Type", ""):
+            return ""
+        charset = response.headers.get_content_charset() or "utf-8"
+        # El título está en la cabecera: se deja de leer al cerrarse <head>, al llegar
+        # a max_bytes o al agotar el tiempo total (un servidor lento no retiene el hilo)
+        body = b""
+        while len(body) < max_bytes and time.monotonic() < deadline:
+            chunk = response.read1(min(8192, max_bytes - len(body)))
+            if not chunk:
+                break
+            body += chunk
+            if b"</head>" in body.lower():
+                break
+    return extract_title(body.decode(charset, errors="replace"))
+
+class LinkUnfurler:
+    """Resuelve títulos de enlaces en un grupo de hilos.
+
+    Las peticiones simultáneas de una misma URL comparten una sola descarga,
+    y los resultados (incluidos los fallos, con menos vida) quedan en caché.
+    El callback se llama desde un hilo de trabajo: la interfaz debe pasarlo a
+    su propio hilo (por ejemplo con una señal de Qt).
+    """
+
+    def __init__(self, workers=4, timeout=3.0, max_bytes=64 * 1024, cache=None,
+                 failure_ttl=300, fetch=fetch_title):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.cache = cache if cache is not None else TTLCache()
+        self.failure_ttl = failure_ttl
+        self.fetch = fetch
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="unfurl")
+        self._lock = threading.Lock()
+        self._waiters = {}  # url -> [callback, ...] de las descargas en curso
+
+    def request(self, url, callback):
+        """Pide el título de url; callback(url, título) se llama al resolverse"""
+        title = self.cache.get(url)
+        if title is not None:
+            callback(url, title)
+            return
+        with self._lock:
+            if url in self._waiters:
+                # Ya hay una descarga en curso: esperar a la misma
+                self._waiters[url].append(callback)
+                return
+            self._waiters[url] = [callback]
+        self._executor.submit(self._resolve, url)
+
+    def _resolve(self, url):
+        try:
+            title = self.fetch(url, self.timeout, self.max_bytes)
+            self.cache.put(url, title)
+        except Exception:
+            title = ""
+            self.cache.put(url, title, ttl=self.failure_ttl)
+        with self._lock:
+            callbacks = self._waiters.pop(url, [])
+        for callback in callbacks:
+            try:
+                callback(url, title)
+            except Exception:
+                pass
+
+    def shutdown(self):
+        """Detiene el grupo de hilos sin esperar a las descargas en curso"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# Caché compartida por todas las ventanas del proceso
+shared_cache = TTLCache(maxsize=1024, ttl=3600)
@@ -0,0 +1,209 @@
+# Filtro de términos prohibidos con un autómata Aho-Corasick y recarga en caliente (sin Qt)
+#
+# Fichero de términos: uno por línea, '#' inicia un comentario. Cada línea puede empezar
+# por una acción seguida de ':' (ocultar, rechazar o marcar; por defecto ocultar):
+#   rechazar: casino online
+#   marcar: oferta
+#   tonto
+#   *mierda*
+#   ocultar: http://*
+# Un término sin comodines solo coincide con palabras completas. Un '*' inicial permite
+# que vaya precedido de letras; uno final, que le sigan, y entonces la coincidencia se
+# extiende hasta el siguiente espacio (útil para ocultar enlaces completos).
+import os
+import threading
+from collections import deque
+from pipeline import Stage
+
+MASK = "*"
+ACTIONS = ("ocultar", "rechazar", "marcar")
+DEFAULT_ACTION = "ocultar"
+# Cada cuánto se comprueba si el fichero de términos ha cambiado (segundos)
+RELOAD_INTERVAL = 2.0
+
+class Rule:
+    """Término del filtro con su acción y sus comodines"""
+
+    __slots__ = ("term", "action", "inside", "extend")
+
+    def __init__(self, term, action=DEFAULT_ACTION, inside=False, extend=False):
+        self.term = term
+        self.action = action
+        self.inside = inside  # puede ir precedido de letras
+        self.extend = extend  # puede ir seguido de letras; la coincidencia llega al siguiente espacio
+
+def parse_rules(lines):
+    """Convierte las líneas de un fichero de términos en reglas; lanza ValueError si hay errores"""
+    rules = []
+    for number, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        action, separator, rest = line.partition(":")
+        if separator and action.strip().lower() in ACTIONS:
+            action, line = action.strip().lower(), rest.strip()
+        else:
+            action = DEFAULT_ACTION
+        inside, extend = line.startswith("*"), line.endswith("*")
+        term = line.strip("*").lower()
+        if not term:
+            raise ValueError(f"línea {number}: término vacío")
+        rules.append(Rule(term, action, inside, extend))
+    return rules
+
+def lower(text):
+    """Minúsculas sin cambiar la longitud, para que las posiciones sigan valiendo en el original"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(char.lower()[:1] for char in text)
+
+class Automaton:
+    """Autómata Aho-Corasick: busca todos los términos a la vez en O(longitud del texto)"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.goto = [{}]  # estado -> {carácter: estado siguiente}
+        self.fail = [0]
+        self.outputs = [()]  # estado -> reglas que terminan aquí (incluidas las de sus sufijos)
+        for index, rule in enumerate(rules):
+            state = 0
+            for char in rule.term:
+                following = self.goto[state].get(char)
+                if following is None:
+                    following = self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(())
+                state = following
+            self.outputs[state] += (index,)
+        # Enlaces de fallo en anchura: el sufijo propio más largo que también es prefijo
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self.goto[state].items():
+                queue.append(following)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[following] = self.goto[fallback].get(char, 0)
+                self.outputs[following] += self.outputs[self.fail[following]]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def search(self, text):
+        """Coincidencias [(inicio, fin, regla)] que respetan los límites de palabra de cada término"""
+        lowered = lower(text)
+        goto, fail, outputs, rules = self.goto, self.fail, self.outputs, self.rules
+        matches = []
+        state = 0
+        for position, char in enumerate(lowered):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                for index in outputs[state]:
+                    rule = rules[index]
+                    start, end = position + 1 - len(rule.term), position + 1
+                    if not rule.inside and start > 0 and lowered[start - 1].isalnum():
+                        continue
+                    if rule.extend:
+                        while end < len(text) and not text[end].isspace():
+                            end += 1
+                    elif end < len(text) and lowered[end].isalnum():
+                        continue
+                    matches.append((start, end, rule))
+        return matches
+
+def mask(text, matches):
+    """Sustituye por asteriscos los tramos coincidentes"""
+    chars = list(text)
+    for start, end, _ in matches:
+        chars[start:end] = MASK * (end - start)
+    return "".join(chars)
+
+class WordFilter(Stage):
+    """Etapa de la cadena de mensajes que oculta, rechaza o marca términos prohibidos.
+
+    El autómata se reconstruye aparte y se sustituye de una vez, de modo que los
+    mensajes en curso siguen usando el anterior hasta que el nuevo está listo.
+    """
+
+    name = "filtro"
+
+    def __init__(self, path, log=None):
+        self.path = path
+        self.log = log or (lambda message, type: None)
+        self.automaton = None
+        self.counts = {action: 0 for action in ACTIONS}
+        self.loaded_mtime = None
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def load(self):
+        """Lee el fichero de términos y cambia al nuevo autómata; lanza OSError o ValueError"""
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, encoding="utf-8") as file:
+            rules = parse_rules(file)
+        self.automaton = Automaton(rules)
+        self.loaded_mtime = mtime
+        return len(rules)
+
+    def reload(self):
+        """Recarga el fichero e informa del resultado; si falla se conserva la lista anterior"""
+        try:
+            count = self.load()
+        except (OSError, ValueError) as e:
+            self.log(f"[FILTRO] No se pudo cargar {self.path}: {e}", "error")
+            return False
+        self.log(f"[FILTRO] {count} términos cargados de {self.path}", "system")
+        return True
+
+    def start(self):
+        """Carga los términos y vigila el fichero para recargarlo cuando cambie"""
+        self.reload()
+        self.thread = threading.Thread(target=self.watch_loop, name="filtro")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def watch_loop(self):
+        while not self.wakeup.wait(RELOAD_INTERVAL):
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if mtime != self.loaded_mtime:
+                if not self.reload():
+                    # No insistir con el mismo fichero erróneo hasta que vuelva a cambiar
+                    self.loaded_mtime = mtime
+
+    def stop(self):
+        self.wakeup.set()
+
+    def process(self, message):
+        automaton = self.automaton
+        if automaton is None:
+            return True
+        matches = automaton.search(message.text)
+        if not matches:
+            return True
+        actions = {rule.action for _, _, rule in matches}
+        if "rechazar" in actions:
+            self.counts["rechazar"] += 1
+            message.reply("Mensaje no enviado: contiene términos no permitidos")
+            self.log(f"[FILTRO] Rechazado un mensaje de {message.alias}", "warning")
+            return False
+        if "marcar" in actions:
+            self.counts["marcar"] += 1
+            self.log(f"[FILTRO] Mensaje marcado de {message.alias}: {message.text}", "warning")
+        hidden = [match for match in matches if match[2].action == "ocultar"]
+        if hidden:
+            self.counts["ocultar"] += 1
+            message.text = mask(message.text, hidden)
+        return True
+
+    def summary(self):
+        terms = len(self.automaton) if self.automaton is not None else 0
+        return (f"{terms} términos de {self.path}; mensajes rechazados {self.counts['rechazar']}, "
+                f"ocultados {self.counts['ocultar']}, marcados {self.counts['marcar']}")